@@ -0,0 +1,212 @@
+import gc
+import math
+import platform
+import time
+from typing import Dict, List, Optional, Sequence, Any, Iterable
+
+import numpy as np
+import stim
+
+from hookinj import gen
+from hookinj._make_circuit import CONSTRUCTIONS, Params, split_magic_head_and_tail
+
+STAGES = ('construct', 'verify', 'compile', 'to_cz', 'noise')
+
+DEFAULT_DISTANCES = tuple(range(3, 33, 2))
+
+
+def bench_params(basis: str, distance: int) -> Params:
+    """The parameters benchmarked for a construction at a given distance."""
+    if 'inject' in basis:
+        return Params(
+            basis=basis,
+            distance=distance,
+            postselected_rounds=2,
+            postselected_diameter=3,
+            memory_rounds=distance,
+        )
+    return Params(
+        basis=basis,
+        distance=distance,
+        postselected_rounds=0,
+        postselected_diameter=0,
+        memory_rounds=distance,
+    )
+
+
+def clear_memo_caches() -> None:
+    """Forgets memoized patches, chunks and verification results, so stages are timed from scratch."""
+    from hookinj.circuits.steps import _patches, _hook_injection_round, _measure_y_transition_round
+    from hookinj.gen import _chunk, _flow, _flow_util, _verify_cache
+    _patches.make_xtop_qubit_patch.cache_clear()
+    _patches.make_ztop_yboundary_patch.cache_clear()
+    _hook_injection_round.make_hook_injection_round.cache_clear()
+    _measure_y_transition_round.make_y_transition_round_nesw_xzxz_to_xzzx.cache_clear()
+    _chunk._INVERTED.clear()
+    _flow_util._standard_surface_code_chunk_cached.cache_clear()
+    _flow_util._relabeled_circuit_cached.cache_clear()
+    _flow_util._relabel_template.cache_clear()
+    _verify_cache.clear_verified()
+    gc.collect()
+    _flow._compact_coord_bits()
+
+
+def time_stages(
+        params: Params,
+        *,
+        noise: gen.NoiseModel,
+        verify: bool = True,
+        repeats: int = 1,
+) -> Dict[str, float]:
+    """Times each stage of circuit generation, in seconds.
+
+    Each stage is run `repeats` times and the fastest run is reported. Stages
+    that don't apply (e.g. 'verify' when `verify=False`) are omitted.
+    """
+    best: Dict[str, float] = {}
+
+    def record(stage: str, t0: float):
+        dt = time.perf_counter() - t0
+        best[stage] = min(best.get(stage, math.inf), dt)
+
+    for _ in range(repeats):
+        clear_memo_caches()
+        t0 = time.perf_counter()
+        chunks = CONSTRUCTIONS[params.basis](params)
+        record('construct', t0)
+
+        if verify:
+            with gen.verification_cache_dir(None):
+                t0 = time.perf_counter()
+                for chunk in chunks:
+                    chunk.verify()
+                record('verify', t0)
+
+        t0 = time.perf_counter()
+        circuit = gen.compile_chunks_into_circuit(chunks)
+        record('compile', t0)
+        _, body, _ = split_magic_head_and_tail(circuit, chunks)
+
+        t0 = time.perf_counter()
+        body = gen.to_z_basis_interaction_circuit(body)
+        record('to_cz', t0)
+
+        t0 = time.perf_counter()
+        noise.noisy_circuit(body)
+        record('noise', t0)
+
+    return best
+
+
+def fit_exponent(distances: Sequence[int], seconds: Sequence[float]) -> Optional[float]:
+    """Fits `seconds ~ c * distance**k` and returns k.
+
+    Returns None when there aren't at least two usable (non-zero) points.
+    """
+    xs = []
+    ys = []
+    for d, t in zip(distances, seconds):
+        if t > 0:
+            xs.append(math.log(d))
+            ys.append(math.log(t))
+    if len(set(xs)) < 2:
+        return None
+    slope, _ = np.polyfit(xs, ys, 1)
+    return float(slope)
+
+
+def run_benchmark(
+        *,
+        bases: Iterable[str],
+        distances: Iterable[int],
+        noise: Optional[gen.NoiseModel] = None,
+        verify: bool = True,
+        repeats: int = 1,
+        progress_callback: Optional[Any] = None,
+) -> Dict[str, Any]:
+    """Times every stage for every construction and distance.
+
+    Returns:
+        A json-serializable dictionary with the raw timings under 'timings'
+        and the fitted scaling exponent of each stage under 'exponents'.
+    """
+    if noise is None:
+        noise = gen.NoiseModel.si1000(1e-3)
+    bases = list(bases)
+    distances = sorted(distances)
+    timings: List[Dict[str, Any]] = []
+    for basis in bases:
+        if basis not in CONSTRUCTIONS:
+            raise NotImplementedError(f'{basis=}')
+        for distance in distances:
+            stages = time_stages(bench_params(basis, distance), noise=noise, verify=verify, repeats=repeats)
+            entry = {'basis': basis, 'distance': distance, 'seconds': stages}
+            timings.append(entry)
+            if progress_callback is not None:
+                progress_callback(entry)
+
+    exponents: Dict[str, Dict[str, Optional[float]]] = {}
+    for basis in bases:
+        entries = [e for e in timings if e['basis'] == basis]
+        exponents[basis] = {
+            stage: fit_exponent(
+                [e['distance'] for e in entries if stage in e['seconds']],
+                [e['seconds'][stage] for e in entries if stage in e['seconds']],
+            )
+            for stage in STAGES
+        }
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'stim': stim.__version__,
+            'machine': platform.machine(),
+            'repeats': repeats,
+        },
+        'timings': timings,
+        'exponents': exponents,
+    }
+
+
+def compare_to_baseline(
+        result: Dict[str, Any],
+        baseline: Dict[str, Any],
+        *,
+        max_exponent_increase: float = 0.3,
+        max_slowdown: float = 1.5,
+) -> List[str]:
+    """Lists the stages that got worse relative to a baseline benchmark result.
+
+    A stage is flagged when its scaling exponent grew by more than
+    `max_exponent_increase`, or when its time at the largest distance measured
+    by both results grew by more than a factor of `max_slowdown`.
+    """
+    problems = []
+    for basis, stage_exponents in result['exponents'].items():
+        old_exponents = baseline['exponents'].get(basis)
+        if old_exponents is None:
+            continue
+        for stage, k in stage_exponents.items():
+            old_k = old_exponents.get(stage)
+            if k is None or old_k is None:
+                continue
+            if k - old_k > max_exponent_increase:
+                problems.append(f'{basis} {stage}: scaling exponent went from {old_k:.2f} to {k:.2f}')
+
+    def by_key(data: Dict[str, Any]) -> Dict[Any, Dict[str, float]]:
+        return {(e['basis'], e['distance']): e['seconds'] for e in data['timings']}
+    new_times = by_key(result)
+    old_times = by_key(baseline)
+    for basis in result['exponents']:
+        common = [d for b, d in new_times.keys() & old_times.keys() if b == basis]
+        if not common:
+            continue
+        d = max(common)
+        new_seconds = new_times[(basis, d)]
+        old_seconds = old_times[(basis, d)]
+        for stage in STAGES:
+            if stage in new_seconds and old_seconds.get(stage, 0) > 0:
+                ratio = new_seconds[stage] / old_seconds[stage]
+                if ratio > max_slowdown:
+                    problems.append(f'{basis} {stage}: {ratio:.2f}x slower at d={d} ({old_seconds[stage]:.3f}s -> {new_seconds[stage]:.3f}s)')
+    return problems
@@ -0,0 +1,38 @@
+import pytest
+
+from hookinj import gen
+from hookinj._bench import fit_exponent, time_stages, bench_params, run_benchmark, compare_to_baseline, STAGES
+
+
+def test_fit_exponent():
+    ds = [3, 5, 7, 9]
+    assert fit_exponent(ds, [2 * d**3 for d in ds]) == pytest.approx(3)
+    assert fit_exponent(ds, [0.5 * d for d in ds]) == pytest.approx(1)
+    assert fit_exponent([3], [1.0]) is None
+    assert fit_exponent([3, 5], [0.0, 1.0]) is None
+
+
+def test_time_stages():
+    seconds = time_stages(bench_params('hook_inject_Y', 3), noise=gen.NoiseModel.si1000(1e-3))
+    assert set(seconds) == set(STAGES)
+    assert all(t >= 0 for t in seconds.values())
+
+    seconds = time_stages(bench_params('X', 3), noise=gen.NoiseModel.si1000(1e-3), verify=False)
+    assert set(seconds) == set(STAGES) - {'verify'}
+
+
+def test_compare_to_baseline():
+    result = run_benchmark(bases=['X'], distances=[3, 5], verify=False)
+    assert set(result['exponents']['X']) == set(STAGES)
+    assert compare_to_baseline(result, result) == []
+
+    slower = {
+        'exponents': {'X': {stage: k + 1 for stage, k in result['exponents']['X'].items() if k is not None}},
+        'timings': [
+            {**e, 'seconds': {stage: t * 3 for stage, t in e['seconds'].items()}}
+            for e in result['timings']
+        ],
+    }
+    problems = compare_to_baseline(slower, result)
+    assert any('scaling exponent' in p for p in problems)
+    assert any('slower at d=5' in p for p in problems)
@@ -0,0 +1,86 @@
+import dataclasses
+import functools
+import hashlib
+import json
+import pathlib
+from typing import Any, Optional, Union
+
+import stim
+
+from hookinj import gen
+from hookinj._circuit_io import read_circuit, write_circuit
+
+_PACKAGE_DIR = pathlib.Path(__file__).parent
+
+
+@functools.lru_cache(maxsize=None)
+def construction_source_hash() -> str:
+    """Hashes the source code of every non-test module in the hookinj package.
+
+    Any edit to the code that builds, compiles, translates, or noises circuits
+    changes this hash, which invalidates everything previously stored in a
+    `CircuitCache`.
+    """
+    h = hashlib.sha256()
+    for path in sorted(_PACKAGE_DIR.rglob('*.py')):
+        if path.name.endswith('_test.py'):
+            continue
+        h.update(path.relative_to(_PACKAGE_DIR).as_posix().encode('utf8'))
+        h.update(b'\0')
+        h.update(path.read_bytes())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class CircuitCache:
+    """An on-disk, content-addressed store of generated circuits.
+
+    Entries are keyed by everything that determines the generated circuit: the
+    construction parameters, the noise model, whether the circuit was converted
+    to the CZ gate set, and the source code of the package.
+    """
+
+    def __init__(self, directory: Union[str, pathlib.Path]):
+        self.directory = pathlib.Path(directory)
+
+    def key(self,
+            *,
+            params: Any,
+            noise: Optional[gen.NoiseModel],
+            convert_to_cz: bool) -> str:
+        desc = json.dumps({
+            'params': dataclasses.asdict(params),
+            'noise': repr(noise),
+            'convert_to_cz': bool(convert_to_cz),
+            'source': construction_source_hash(),
+        }, sort_keys=True)
+        return hashlib.sha256(desc.encode('utf8')).hexdigest()
+
+    def path_for(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / f'{key}.stim'
+
+    def verified_marker_path_for(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / f'{key}.verified'
+
+    def is_verified(self, key: str) -> bool:
+        """Whether the entry was built with its chunks verified."""
+        return self.verified_marker_path_for(key).exists()
+
+    def get(self, key: str) -> Optional[stim.Circuit]:
+        path = self.path_for(key)
+        if not path.exists():
+            return None
+        return read_circuit(path)
+
+    def put(self, key: str, circuit: stim.Circuit, *, verified: bool = False) -> None:
+        path = self.path_for(key)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        # Written atomically, so concurrent readers never see a partial entry.
+        write_circuit(path, circuit)
+        if verified:
+            self.verified_marker_path_for(key).touch()
+
+    @property
+    def verified_chunks_dir(self) -> pathlib.Path:
+        """Where `Chunk.verify` remembers chunks it has proven correct."""
+        return self.directory / 'verified_chunks'
@@ -0,0 +1,91 @@
+import stim
+
+from hookinj import gen
+from hookinj import _make_circuit
+from hookinj._circuit_cache import CircuitCache
+from hookinj._make_circuit import make_circuit, Params
+
+
+def test_circuit_cache_round_trip(tmp_path):
+    cache = CircuitCache(tmp_path)
+    key = cache.key(
+        params=Params(basis='X', postselected_rounds=0, postselected_diameter=0, memory_rounds=3, distance=3),
+        noise=None,
+        convert_to_cz=False,
+    )
+    assert cache.get(key) is None
+    circuit = stim.Circuit("""
+        REPEAT 2 {
+            H 0
+            TICK
+        }
+        M 0
+    """)
+    cache.put(key, circuit)
+    assert cache.get(key) == circuit
+
+
+def test_circuit_cache_key_covers_inputs(tmp_path):
+    cache = CircuitCache(tmp_path)
+    params = Params(basis='X', postselected_rounds=0, postselected_diameter=0, memory_rounds=3, distance=3)
+    other_params = Params(basis='X', postselected_rounds=0, postselected_diameter=0, memory_rounds=3, distance=5)
+    keys = {
+        cache.key(params=params, noise=None, convert_to_cz=False),
+        cache.key(params=params, noise=None, convert_to_cz=True),
+        cache.key(params=other_params, noise=None, convert_to_cz=False),
+        cache.key(params=params, noise=gen.NoiseModel.si1000(1e-3), convert_to_cz=False),
+        cache.key(params=params, noise=gen.NoiseModel.si1000(2e-3), convert_to_cz=False),
+        cache.key(params=params, noise=gen.NoiseModel.uniform_depolarizing(1e-3), convert_to_cz=False),
+    }
+    assert len(keys) == 6
+    assert cache.key(params=params, noise=gen.NoiseModel.si1000(1e-3), convert_to_cz=False) == cache.key(
+        params=Params(basis='X', postselected_rounds=0, postselected_diameter=0, memory_rounds=3, distance=3),
+        noise=gen.NoiseModel.si1000(1e-3),
+        convert_to_cz=False,
+    )
+
+
+def test_make_circuit_uses_cache(tmp_path, monkeypatch):
+    kwargs = dict(
+        basis='hook_inject_Y',
+        distance=3,
+        noise=gen.NoiseModel.si1000(1e-3),
+        postselected_rounds=2,
+        postselected_diameter=3,
+        memory_rounds=3,
+        cache_dir=tmp_path,
+    )
+    expected = make_circuit(**kwargs)
+    assert len(list(tmp_path.rglob('*.stim'))) == 1
+
+    def fail(params):
+        raise AssertionError("cache miss")
+    monkeypatch.setitem(_make_circuit.CONSTRUCTIONS, 'hook_inject_Y', fail)
+    assert make_circuit(**kwargs) == expected
+
+
+def test_make_circuit_reuses_only_verified_entries(tmp_path, monkeypatch):
+    kwargs = dict(
+        basis='hook_inject_Y',
+        distance=3,
+        noise=None,
+        postselected_rounds=2,
+        postselected_diameter=3,
+        memory_rounds=3,
+        cache_dir=tmp_path,
+    )
+    expected = make_circuit(**kwargs)
+    original = _make_circuit.CONSTRUCTIONS['hook_inject_Y']
+    calls = []
+
+    def counting(params):
+        calls.append(params)
+        return original(params)
+    monkeypatch.setitem(_make_circuit.CONSTRUCTIONS, 'hook_inject_Y', counting)
+
+    # The entry wasn't built with verification, so it gets rebuilt.
+    assert make_circuit(**kwargs, verify_chunks=True) == expected
+    assert len(calls) == 1
+    assert list((tmp_path / 'verified_chunks').rglob('*'))
+    assert make_circuit(**kwargs, verify_chunks=True) == expected
+    assert len(calls) == 1
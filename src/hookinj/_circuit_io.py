@@ -0,0 +1,82 @@
+import gzip
+import io
+import lzma
+import os
+import pathlib
+import tempfile
+from typing import Iterator, TextIO, Union, IO
+
+import stim
+
+COMPRESSION_SUFFIXES = {
+    'none': '',
+    'gzip': '.gz',
+    'xz': '.xz',
+}
+
+
+def _text_stream(path: pathlib.Path, mode: str, raw: IO) -> TextIO:
+    """Wraps a binary stream, (de)compressing based on the suffix of `path`."""
+    if path.suffix == '.gz':
+        return gzip.open(raw, mode + 't', encoding='utf8')
+    if path.suffix == '.xz':
+        return lzma.open(raw, mode + 't', encoding='utf8')
+    return io.TextIOWrapper(raw, encoding='utf8')
+
+
+def iter_circuit_lines(circuit: stim.Circuit, *, indent: str = '') -> Iterator[str]:
+    """Yields the lines of `str(circuit)` one at a time.
+
+    Repeat blocks are expanded recursively, so the full text of a large circuit
+    never has to exist in memory at once.
+    """
+    for op in circuit:
+        if isinstance(op, stim.CircuitRepeatBlock):
+            yield f'{indent}REPEAT {op.repeat_count} {{'
+            yield from iter_circuit_lines(op.body_copy(), indent=indent + '    ')
+            yield f'{indent}}}'
+        else:
+            yield f'{indent}{op}'
+
+
+def write_circuit(path: Union[str, pathlib.Path], circuit: stim.Circuit) -> None:
+    """Writes a circuit to a file, atomically.
+
+    The circuit is written to a temporary file in the same directory, which is
+    renamed over `path` once complete. A crash therefore never leaves a
+    partially written circuit behind. Paths ending in `.gz` or `.xz` are
+    compressed. The uncompressed contents are identical to
+    `print(circuit, file=f)`.
+    """
+    path = pathlib.Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw, _text_stream(path, 'w', raw) as f:
+            empty = True
+            for line in iter_circuit_lines(circuit):
+                f.write(line)
+                f.write('\n')
+                empty = False
+            if empty:
+                f.write('\n')
+        # mkstemp creates owner-only files; use the permissions `open` would have.
+        os.chmod(tmp_path, 0o666 & ~_umask())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def read_circuit(path: Union[str, pathlib.Path]) -> stim.Circuit:
+    """Reads a circuit written by `write_circuit` (or any plain stim file)."""
+    path = pathlib.Path(path)
+    if path.suffix in ('.gz', '.xz'):
+        with open(path, 'rb') as raw, _text_stream(path, 'r', raw) as f:
+            return stim.Circuit(f.read())
+    return stim.Circuit.from_file(str(path))
@@ -0,0 +1,56 @@
+import pytest
+import stim
+
+from hookinj import _circuit_io
+from hookinj._circuit_io import write_circuit, read_circuit, iter_circuit_lines
+
+
+def _circuit() -> stim.Circuit:
+    return stim.Circuit("""
+        QUBIT_COORDS(0, 1) 0
+        RX 0 1
+        REPEAT 3 {
+            MPP X0*Z1
+            REPEAT 2 {
+                DEPOLARIZE1(0.125) 0 1
+                TICK
+            }
+            DETECTOR(1, 2.5, 0) rec[-1]
+        }
+        OBSERVABLE_INCLUDE(0) rec[-1]
+    """)
+
+
+def test_iter_circuit_lines_matches_str():
+    c = _circuit()
+    assert '\n'.join(iter_circuit_lines(c)) == str(c)
+    assert list(iter_circuit_lines(stim.Circuit())) == []
+
+
+@pytest.mark.parametrize('suffix', ['.stim', '.stim.gz', '.stim.xz'])
+def test_write_read_round_trip(tmp_path, suffix):
+    path = tmp_path / f'c{suffix}'
+    write_circuit(path, _circuit())
+    assert read_circuit(path) == _circuit()
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
+
+
+def test_write_circuit_plain_matches_print(tmp_path):
+    path = tmp_path / 'c.stim'
+    write_circuit(path, _circuit())
+    assert path.read_text() == str(_circuit()) + '\n'
+
+    write_circuit(path, stim.Circuit())
+    assert path.read_text() == '\n'
+
+
+def test_write_circuit_failure_leaves_no_file(tmp_path, monkeypatch):
+    path = tmp_path / 'c.stim.gz'
+
+    def fail(circuit, **kwargs):
+        yield 'H 0'
+        raise RuntimeError('crash')
+    monkeypatch.setattr(_circuit_io, 'iter_circuit_lines', fail)
+    with pytest.raises(RuntimeError):
+        write_circuit(path, _circuit())
+    assert list(tmp_path.iterdir()) == []
@@ -1,10 +1,13 @@
+import contextlib
 import dataclasses
 import pathlib
-from typing import Union, Any, Optional, List, Callable, Dict
+from typing import Union, Any, Optional, List, Callable, Dict, Tuple, Iterable
 
 import stim
 
 from hookinj import gen
+from hookinj._circuit_cache import CircuitCache
+from hookinj._circuit_io import write_circuit
 from hookinj.circuits._cphase_injection_circuit import make_zz_injection
 from hookinj.circuits._hook_injection_circuit import make_hook_injection_circuit
 from hookinj.circuits._li_injection_circuit import make_li_injection_rounds
@@ -14,12 +17,15 @@ from hookinj.circuits._y_memory_circuit import make_y_memory_experiment_chunks
 
 def _write(path: Any, content: Any):
     path = pathlib.Path(path)
-    with open(path, "w") as f:
-        print(content, file=f)
+    if isinstance(content, stim.Circuit):
+        write_circuit(path, content)
+    else:
+        with open(path, "w") as f:
+            print(content, file=f)
     print(f'wrote file://{path.absolute()}')
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True)
 class Params:
     basis: str
     postselected_rounds: int
@@ -123,26 +129,62 @@ def _make_constructions() -> Dict[str, Callable[[Params], List[gen.Chunk]]]:
 CONSTRUCTIONS = _make_constructions()
 
 
-def make_circuit(
+@dataclasses.dataclass
+class CircuitParts:
+    """A generated circuit split into the part that gets noise and the parts that don't.
+
+    The head and tail hold the noiseless magic MPP initialization/verification of
+    `_magic_verify` constructions (they're empty otherwise).
+    """
+    head: stim.Circuit
+    body: stim.Circuit
+    tail: stim.Circuit
+    patch: gen.Patch
+
+    def with_noise(self, noise: Optional[gen.NoiseModel]) -> stim.Circuit:
+        body = self.body
+        if noise is not None:
+            body = noise.noisy_circuit(body)
+        return self.head + body + self.tail
+
+    def with_noise_family(self, model: Callable[[float], gen.NoiseModel], strengths: Iterable[float]) -> List[stim.Circuit]:
+        """Same as `with_noise(model(p))` for each strength p, but lays out the noise only once."""
+        bodies = gen.NoiseModel.noisy_circuit_family(self.body, strengths, model=model)
+        return [self.head + body + self.tail for body in bodies]
+
+
+def split_magic_head_and_tail(circuit: stim.Circuit, chunks: List[gen.Chunk]) -> Tuple[stim.Circuit, stim.Circuit, stim.Circuit]:
+    """Separates the noiseless magic MPP head/tail of a compiled circuit from its body."""
+    mpp_indices = [
+        k
+        for k, inst in enumerate(circuit)
+        if isinstance(inst, stim.CircuitInstruction) and inst.name == 'MPP'
+    ]
+    skip_mpp_head = chunks[0].magic
+    skip_mpp_tail = chunks[-1].magic
+    body_start = mpp_indices[0] + 2 if skip_mpp_head else 0
+    body_end = mpp_indices[-1] if skip_mpp_tail else len(circuit)
+    return circuit[:body_start], circuit[body_start:body_end], circuit[body_end:]
+
+
+def make_circuit_parts(
+    params: Params,
     *,
-    basis: str,
-    noise: Optional[gen.NoiseModel],
-    postselected_rounds: int = 0,
-    postselected_diameter: int = 0,
-    memory_rounds: int,
-    distance: int,
     verify_chunks: bool = False,
+    verify_jobs: int = 1,
     debug_out_dir: Union[None, str, pathlib.Path] = None,
     convert_to_cz: bool = True,
-) -> stim.Circuit:
-    params = Params(basis=basis, postselected_rounds=postselected_rounds, postselected_diameter=postselected_diameter, memory_rounds=memory_rounds, distance=distance)
-    construction = CONSTRUCTIONS.get(basis)
+) -> CircuitParts:
+    """Does all of the work of `make_circuit` except for adding noise."""
+    construction = CONSTRUCTIONS.get(params.basis)
     if construction is None:
-        raise NotImplementedError(f'{basis=}')
+        raise NotImplementedError(f'{params.basis=}')
+    if debug_out_dir is not None:
+        debug_out_dir = pathlib.Path(debug_out_dir)
     chunks = construction(params)
 
     assert len(chunks) >= 2
-    if 'magic' not in basis:
+    if 'magic' not in params.basis:
         assert not any(chunk.magic for chunk in chunks)
 
     if debug_out_dir is not None:
@@ -156,8 +198,7 @@ def make_circuit(
         ))
 
     if verify_chunks:
-        for chunk in chunks:
-            chunk.verify()
+        gen.verify_chunks(chunks, jobs=verify_jobs)
 
     if debug_out_dir is not None:
         ignore_errors_ideal_circuit = gen.compile_chunks_into_circuit(chunks, ignore_errors=True)
@@ -168,19 +209,7 @@ def make_circuit(
         _write(debug_out_dir / "ideal_circuit.stim", ignore_errors_ideal_circuit)
         _write(debug_out_dir / "ideal_circuit_dets.svg", ignore_errors_ideal_circuit.diagram("time+detector-slice-svg"))
 
-    body = gen.compile_chunks_into_circuit(chunks)
-    mpp_indices = [
-        k
-        for k, inst in enumerate(body)
-        if isinstance(inst, stim.CircuitInstruction) and inst.name == 'MPP'
-    ]
-    skip_mpp_head = chunks[0].magic
-    skip_mpp_tail = chunks[-1].magic
-    body_start = mpp_indices[0] + 2 if skip_mpp_head else 0
-    body_end = mpp_indices[-1] if skip_mpp_tail else len(body)
-    magic_head = body[:body_start]
-    magic_tail = body[body_end:]
-    body = body[body_start:body_end]
+    magic_head, body, magic_tail = split_magic_head_and_tail(gen.compile_chunks_into_circuit(chunks), chunks)
 
     if convert_to_cz:
         body = gen.to_z_basis_interaction_circuit(body)
@@ -193,16 +222,81 @@ def make_circuit(
             _write(debug_out_dir / "ideal_cz_circuit.stim", ideal_circuit)
             _write(debug_out_dir / "ideal_cz_circuit_dets.svg", ideal_circuit.diagram("time+detector-slice-svg"))
 
-    if noise is not None:
-        body = noise.noisy_circuit(body)
-    noisy_circuit = magic_head + body + magic_tail
+    return CircuitParts(head=magic_head, body=body, tail=magic_tail, patch=chunks[0].end_patch())
+
+
+def write_noisy_circuit_debug_files(
+    debug_out_dir: Union[str, pathlib.Path],
+    noisy_circuit: stim.Circuit,
+    patch: gen.Patch,
+) -> None:
+    debug_out_dir = pathlib.Path(debug_out_dir)
+    _write(debug_out_dir / "noisy_circuit.html", gen.stim_circuit_html_viewer(
+        noisy_circuit,
+        patch=patch,
+    ))
+    _write(debug_out_dir / "noisy_circuit.stim", noisy_circuit)
+    _write(debug_out_dir / "noisy_circuit_dets.svg", noisy_circuit.diagram("time+detector-slice-svg"))
+
+
+def make_circuit(
+    *,
+    basis: str,
+    noise: Optional[gen.NoiseModel],
+    postselected_rounds: int = 0,
+    postselected_diameter: int = 0,
+    memory_rounds: int,
+    distance: int,
+    verify_chunks: bool = False,
+    verify_jobs: int = 1,
+    debug_out_dir: Union[None, str, pathlib.Path] = None,
+    convert_to_cz: bool = True,
+    cache_dir: Union[None, str, pathlib.Path] = None,
+) -> stim.Circuit:
+    """Builds the circuit for the given construction and parameters.
+
+    If `cache_dir` is given, the result is stored in (and, when possible,
+    retrieved from) an on-disk cache. With `verify_chunks`, only entries that
+    were themselves built with verified chunks are reused, and chunks proven
+    correct are remembered in the cache directory so they aren't verified
+    again. Cache lookups are skipped when `debug_out_dir` is given, because
+    writing the debug files requires actually building the circuit.
+
+    Distinct chunks are verified on `verify_jobs` processes, and every
+    failing chunk is reported together.
+    """
+    params = Params(basis=basis, postselected_rounds=postselected_rounds, postselected_diameter=postselected_diameter, memory_rounds=memory_rounds, distance=distance)
+    if basis not in CONSTRUCTIONS:
+        raise NotImplementedError(f'{basis=}')
+
+    cache = None
+    cache_key = None
+    verified_chunks_dir = None
+    if cache_dir is not None:
+        cache = CircuitCache(cache_dir)
+        cache_key = cache.key(params=params, noise=noise, convert_to_cz=convert_to_cz)
+        verified_chunks_dir = cache.verified_chunks_dir
+        if debug_out_dir is None and (not verify_chunks or cache.is_verified(cache_key)):
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+    with contextlib.ExitStack() as stack:
+        if verified_chunks_dir is not None:
+            stack.enter_context(gen.verification_cache_dir(verified_chunks_dir))
+        parts = make_circuit_parts(
+            params,
+            verify_chunks=verify_chunks,
+            verify_jobs=verify_jobs,
+            debug_out_dir=debug_out_dir,
+            convert_to_cz=convert_to_cz,
+        )
+    noisy_circuit = parts.with_noise(noise)
 
     if debug_out_dir is not None:
-        _write(debug_out_dir / "noisy_circuit.html", gen.stim_circuit_html_viewer(
-            noisy_circuit,
-            patch=chunks[0].end_patch(),
-        ))
-        _write(debug_out_dir / "noisy_circuit.stim", noisy_circuit)
-        _write(debug_out_dir / "noisy_circuit_dets.svg", noisy_circuit.diagram("time+detector-slice-svg"))
+        write_noisy_circuit_debug_files(debug_out_dir, noisy_circuit, parts.patch)
+
+    if cache is not None:
+        cache.put(cache_key, noisy_circuit, verified=verify_chunks)
 
     return noisy_circuit
@@ -0,0 +1,313 @@
+import concurrent.futures
+import dataclasses
+import pathlib
+import sys
+import time
+from typing import Optional, List, Union, Dict, Tuple, Iterable, Any, TextIO
+
+import stim
+
+from hookinj import gen
+from hookinj._circuit_cache import CircuitCache
+from hookinj._circuit_io import write_circuit, COMPRESSION_SUFFIXES
+from hookinj._task_manifest import make_task_manifest, write_task_manifest
+from hookinj._make_circuit import Params, CircuitParts, make_circuit_parts, write_noisy_circuit_debug_files
+
+NOISE_MODEL_NAMES = ['SI1000', 'UniformDepolarizing', 'None']
+
+
+def make_noise_model(name: str, strength: float) -> Optional[gen.NoiseModel]:
+    if name == "SI1000":
+        return gen.NoiseModel.si1000(strength)
+    elif name == "UniformDepolarizing":
+        return gen.NoiseModel.uniform_depolarizing(strength)
+    elif name == "None":
+        return None
+    else:
+        raise NotImplementedError(f'{name=}')
+
+
+@dataclasses.dataclass(frozen=True)
+class SweepPoint:
+    """One circuit to generate as part of a sweep."""
+    params: Params
+    convert_to_cz: bool
+    noise_model_name: str
+    noise_strength: float
+    extra_tags: str = ''
+
+    @property
+    def body_key(self) -> Tuple[Params, bool]:
+        """Sweep points with equal body keys share the same noiseless circuit."""
+        return self.params, self.convert_to_cz
+
+    def noise_model(self) -> Optional[gen.NoiseModel]:
+        return make_noise_model(self.noise_model_name, self.noise_strength)
+
+    def file_name(self, circuit: stim.Circuit) -> str:
+        p = self.params
+        tags = self.extra_tags
+        if self.convert_to_cz:
+            tags += ',gates=cz'
+        else:
+            tags += ',gates=all'
+        if 'inject' in p.basis:
+            tags += f',post_q={gen.estimate_qubit_count_during_postselection(circuit)}'
+        return (f'r={p.memory_rounds},'
+                f'd={p.distance},'
+                f'p={self.noise_strength},'
+                f'noise={self.noise_model_name},'
+                f'b={p.basis},'
+                f'post_r={p.postselected_rounds},'
+                f'post_d={p.postselected_diameter},'
+                f'q={circuit.num_qubits}'
+                f'{tags}.stim')
+
+
+@dataclasses.dataclass
+class _PartsText:
+    """Text form of `CircuitParts`, for cheaply moving them between processes."""
+    head: str
+    body: str
+    tail: str
+    patch: gen.Patch
+
+    @staticmethod
+    def from_parts(parts: CircuitParts) -> '_PartsText':
+        return _PartsText(head=str(parts.head), body=str(parts.body), tail=str(parts.tail), patch=parts.patch)
+
+    def to_parts(self) -> CircuitParts:
+        return CircuitParts(
+            head=stim.Circuit(self.head),
+            body=stim.Circuit(self.body),
+            tail=stim.Circuit(self.tail),
+            patch=self.patch,
+        )
+
+
+def _build_body(
+        params: Params,
+        convert_to_cz: bool,
+        verify_chunks: bool,
+        debug_out_dir: Optional[str],
+        as_text: bool,
+        cache_dir: Optional[str],
+) -> Union[_PartsText, CircuitParts]:
+    # Chunks are verified inline. This already runs on a pool worker when
+    # jobs > 1, and starting a nested pool would oversubscribe the machine.
+    verified_chunks_dir = None if cache_dir is None else CircuitCache(cache_dir).verified_chunks_dir
+    with gen.verification_cache_dir(verified_chunks_dir):
+        parts = make_circuit_parts(
+            params,
+            convert_to_cz=convert_to_cz,
+            verify_chunks=verify_chunks,
+            debug_out_dir=debug_out_dir,
+        )
+    if as_text:
+        return _PartsText.from_parts(parts)
+    return parts
+
+
+def _write_noisy(
+        parts: Union[_PartsText, CircuitParts],
+        point: SweepPoint,
+        out_dir: str,
+        cache_dir: Optional[str],
+        debug_out_dir: Optional[str],
+        compression: str,
+        manifest_decoders: Tuple[str, ...],
+        verified: bool,
+) -> str:
+    if isinstance(parts, _PartsText):
+        parts = parts.to_parts()
+    circuit = parts.with_noise(point.noise_model())
+    return _store_noisy(circuit, parts, point, out_dir, cache_dir, debug_out_dir, compression, manifest_decoders, verified)
+
+
+def _write_noisy_family(
+        parts: Union[_PartsText, CircuitParts],
+        points: List[SweepPoint],
+        out_dir: str,
+        cache_dir: Optional[str],
+        debug_out_dir: Optional[str],
+        compression: str,
+        manifest_decoders: Tuple[str, ...],
+        verified: bool,
+) -> List[str]:
+    """Writes sweep points that only differ in noise strength, laying out their noise once."""
+    if isinstance(parts, _PartsText):
+        parts = parts.to_parts()
+    name = points[0].noise_model_name
+    circuits = parts.with_noise_family(lambda p: make_noise_model(name, p), [point.noise_strength for point in points])
+    return [
+        _store_noisy(circuit, parts, point, out_dir, cache_dir, debug_out_dir, compression, manifest_decoders, verified)
+        for circuit, point in zip(circuits, points)
+    ]
+
+
+def _store_noisy(
+        circuit: stim.Circuit,
+        parts: CircuitParts,
+        point: SweepPoint,
+        out_dir: str,
+        cache_dir: Optional[str],
+        debug_out_dir: Optional[str],
+        compression: str,
+        manifest_decoders: Tuple[str, ...],
+        verified: bool,
+) -> str:
+    if debug_out_dir is not None:
+        write_noisy_circuit_debug_files(debug_out_dir, circuit, parts.patch)
+    if cache_dir is not None:
+        cache = CircuitCache(cache_dir)
+        cache.put(cache.key(params=point.params, noise=point.noise_model(), convert_to_cz=point.convert_to_cz), circuit, verified=verified)
+    return _write_output(circuit, point, out_dir, compression, manifest_decoders)
+
+
+def _copy_cached(point: SweepPoint, out_dir: str, cache_dir: str, compression: str, manifest_decoders: Tuple[str, ...]) -> str:
+    cache = CircuitCache(cache_dir)
+    circuit = cache.get(cache.key(params=point.params, noise=point.noise_model(), convert_to_cz=point.convert_to_cz))
+    return _write_output(circuit, point, out_dir, compression, manifest_decoders)
+
+
+def _write_output(
+        circuit: stim.Circuit,
+        point: SweepPoint,
+        out_dir: str,
+        compression: str,
+        manifest_decoders: Tuple[str, ...],
+) -> str:
+    path = pathlib.Path(out_dir) / (point.file_name(circuit) + COMPRESSION_SUFFIXES[compression])
+    write_circuit(path, circuit)
+    if manifest_decoders:
+        write_task_manifest(path, make_task_manifest(circuit, circuit_path=path, decoders=manifest_decoders))
+    return str(path)
+
+
+class _ProgressReporter:
+    def __init__(self, total: int, out: Optional[TextIO]):
+        self.total = total
+        self.done = 0
+        self.out = out
+        self.start = time.monotonic()
+
+    def finished(self, path: str) -> None:
+        self.done += 1
+        print(f'wrote file://{pathlib.Path(path).absolute()}')
+        if self.out is None:
+            return
+        elapsed = time.monotonic() - self.start
+        remaining = elapsed / self.done * (self.total - self.done)
+        print(f'[{self.done}/{self.total}] {elapsed:.1f}s elapsed, ~{remaining:.1f}s remaining', file=self.out)
+
+
+class _InlineExecutor(concurrent.futures.Executor):
+    """Runs submitted work immediately, in the calling process."""
+
+    def submit(self, fn, /, *args, **kwargs) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as ex:
+            future.set_exception(ex)
+        return future
+
+
+def run_sweep(
+        points: Iterable[SweepPoint],
+        *,
+        out_dir: Union[str, pathlib.Path],
+        jobs: int = 1,
+        cache_dir: Union[None, str, pathlib.Path] = None,
+        verify_chunks: bool = False,
+        debug_out_dir: Union[None, str, pathlib.Path] = None,
+        compression: str = 'none',
+        manifest_decoders: Iterable[str] = (),
+        noise_families: bool = False,
+        progress_out: Optional[TextIO] = sys.stderr,
+) -> List[str]:
+    """Generates the circuit for each sweep point and writes it into `out_dir`.
+
+    The noiseless body of each distinct (params, convert_to_cz) combination is
+    built exactly once, and then fanned out to every noise model and strength
+    that needs it. With `jobs > 1` the work runs on a process pool.
+
+    With `verify_chunks`, every chunk is checked to implement its flows. When
+    `cache_dir` is also given, chunks proven correct are remembered there,
+    so repeated sweeps only verify chunks they haven't seen before.
+
+    Files are written atomically. `compression` is one of 'none', 'gzip', or
+    'xz', and determines whether a `.gz`/`.xz` suffix is appended.
+
+    If `manifest_decoders` is non-empty, a task manifest (see
+    `hookinj._task_manifest`) is written next to each circuit, holding the
+    precomputed detector error model and postselection mask.
+
+    With `noise_families`, the points sharing a body and a noise model are
+    noised together (see `gen.NoiseModel.noisy_circuit_family`), so the
+    noise is laid out once instead of once per strength. Each family is a
+    single unit of work, even when `jobs > 1`.
+
+    Returns:
+        The paths of the written circuit files.
+    """
+    points = list(points)
+    manifest_decoders = tuple(manifest_decoders)
+    out_dir = str(out_dir)
+    cache_dir = None if cache_dir is None else str(cache_dir)
+    debug_out_dir = None if debug_out_dir is None else str(debug_out_dir)
+    if debug_out_dir is not None and jobs > 1:
+        raise ValueError("debug_out_dir requires jobs=1")
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f'{compression=}')
+    pathlib.Path(out_dir).mkdir(exist_ok=True, parents=True)
+
+    cache = None
+    if cache_dir is not None and debug_out_dir is None:
+        cache = CircuitCache(cache_dir)
+    cached: List[SweepPoint] = []
+    groups: Dict[Any, List[SweepPoint]] = {}
+    for point in points:
+        if cache is not None:
+            key = cache.key(params=point.params, noise=point.noise_model(), convert_to_cz=point.convert_to_cz)
+            if cache.path_for(key).exists() and (not verify_chunks or cache.is_verified(key)):
+                cached.append(point)
+                continue
+        groups.setdefault(point.body_key, []).append(point)
+
+    progress = _ProgressReporter(len(points), progress_out)
+    if jobs > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    else:
+        executor = _InlineExecutor()
+    paths = []
+    with executor:
+        pending = set()
+        for point in cached:
+            pending.add(executor.submit(_copy_cached, point, out_dir, cache_dir, compression, manifest_decoders))
+        body_futures = {}
+        for key, group in groups.items():
+            params, convert_to_cz = key
+            f = executor.submit(_build_body, params, convert_to_cz, verify_chunks, debug_out_dir, jobs > 1, cache_dir)
+            body_futures[f] = group
+            pending.add(f)
+
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for f in done:
+                result = f.result()
+                if f in body_futures:
+                    group = body_futures.pop(f)
+                    families: Dict[str, List[SweepPoint]] = {}
+                    for point in group:
+                        if noise_families and point.noise_model_name != 'None':
+                            families.setdefault(point.noise_model_name, []).append(point)
+                        else:
+                            pending.add(executor.submit(_write_noisy, result, point, out_dir, cache_dir, debug_out_dir, compression, manifest_decoders, verify_chunks))
+                    for family in families.values():
+                        pending.add(executor.submit(_write_noisy_family, result, family, out_dir, cache_dir, debug_out_dir, compression, manifest_decoders, verify_chunks))
+                else:
+                    for path in [result] if isinstance(result, str) else result:
+                        paths.append(path)
+                        progress.finished(path)
+    return paths
@@ -0,0 +1,129 @@
+import pathlib
+
+import pytest
+import stim
+
+from hookinj import _make_circuit
+from hookinj._circuit_io import read_circuit
+from hookinj._task_manifest import load_task_manifest, manifest_path_for
+from hookinj._make_circuit import make_circuit, Params
+from hookinj._sweep import SweepPoint, run_sweep, make_noise_model
+
+
+def _points():
+    params = Params(basis='hook_inject_Y', postselected_rounds=2, postselected_diameter=3, memory_rounds=3, distance=3)
+    return [
+        SweepPoint(params=params, convert_to_cz=True, noise_model_name=name, noise_strength=p)
+        for name in ['SI1000', 'None']
+        for p in [1e-3, 2e-3]
+    ]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_run_sweep_matches_make_circuit(tmp_path, jobs):
+    points = _points()
+    paths = run_sweep(points, out_dir=tmp_path, jobs=jobs, progress_out=None)
+    assert len(paths) == len(points)
+    assert len(set(paths)) == len(points)
+
+    for point in points:
+        expected = make_circuit(
+            basis=point.params.basis,
+            distance=point.params.distance,
+            postselected_rounds=point.params.postselected_rounds,
+            postselected_diameter=point.params.postselected_diameter,
+            memory_rounds=point.params.memory_rounds,
+            noise=make_noise_model(point.noise_model_name, point.noise_strength),
+            convert_to_cz=point.convert_to_cz,
+        )
+        path = tmp_path / point.file_name(expected)
+        assert str(path) in paths
+        assert stim.Circuit.from_file(str(path)) == expected
+
+
+def test_run_sweep_builds_each_body_once(tmp_path, monkeypatch):
+    calls = []
+    original = _make_circuit.CONSTRUCTIONS['hook_inject_Y']
+
+    def counting(params):
+        calls.append(params)
+        return original(params)
+    monkeypatch.setitem(_make_circuit.CONSTRUCTIONS, 'hook_inject_Y', counting)
+
+    run_sweep(_points(), out_dir=tmp_path / 'a', cache_dir=tmp_path / 'cache', progress_out=None)
+    assert len(calls) == 1
+
+    # Everything is cached now.
+    paths = run_sweep(_points(), out_dir=tmp_path / 'b', cache_dir=tmp_path / 'cache', progress_out=None)
+    assert len(calls) == 1
+    assert sorted(pathlib.Path(p).name for p in paths) == sorted(p.name for p in (tmp_path / 'a').iterdir())
+
+
+def test_run_sweep_rejects_parallel_debug_output(tmp_path):
+    with pytest.raises(ValueError):
+        run_sweep(_points(), out_dir=tmp_path, jobs=2, debug_out_dir=tmp_path / 'debug')
+
+
+def test_run_sweep_compression(tmp_path):
+    paths = run_sweep(_points()[:1], out_dir=tmp_path, compression='gzip', progress_out=None)
+    assert len(paths) == 1
+    assert paths[0].endswith('.stim.gz')
+    assert read_circuit(paths[0]).num_detectors > 0
+    with pytest.raises(ValueError):
+        run_sweep(_points(), out_dir=tmp_path, compression='zip')
+
+
+def test_run_sweep_manifests(tmp_path):
+    paths = run_sweep(_points()[:1], out_dir=tmp_path, manifest_decoders=['pymatching'], progress_out=None)
+    tasks = load_task_manifest(manifest_path_for(paths[0]))
+    assert len(tasks) == 1
+    assert tasks[0].circuit == read_circuit(paths[0])
+
+
+def test_run_sweep_verified_cache(tmp_path, monkeypatch):
+    calls = []
+    original = _make_circuit.CONSTRUCTIONS['hook_inject_Y']
+
+    def counting(params):
+        calls.append(params)
+        return original(params)
+    monkeypatch.setitem(_make_circuit.CONSTRUCTIONS, 'hook_inject_Y', counting)
+
+    run_sweep(_points(), out_dir=tmp_path / 'a', cache_dir=tmp_path / 'cache', progress_out=None)
+    run_sweep(_points(), out_dir=tmp_path / 'b', cache_dir=tmp_path / 'cache', verify_chunks=True, progress_out=None)
+    assert len(calls) == 2
+    run_sweep(_points(), out_dir=tmp_path / 'c', cache_dir=tmp_path / 'cache', verify_chunks=True, progress_out=None)
+    assert len(calls) == 2
+    for p in (tmp_path / 'a').iterdir():
+        assert (tmp_path / 'c' / p.name).read_text() == p.read_text()
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_run_sweep_noise_families(tmp_path, jobs):
+    points = _points()
+    paths = run_sweep(points, out_dir=tmp_path / 'a', progress_out=None)
+    family_paths = run_sweep(points, out_dir=tmp_path / 'b', jobs=jobs, noise_families=True, progress_out=None)
+    assert sorted(pathlib.Path(p).name for p in family_paths) == sorted(pathlib.Path(p).name for p in paths)
+    for p in paths:
+        p = pathlib.Path(p)
+        assert (tmp_path / 'b' / p.name).read_text() == p.read_text()
+
+
+def test_run_sweep_recycles_pauli_string_coordinates(tmp_path):
+    from hookinj._bench import clear_memo_caches
+    from hookinj.gen import _flow
+    points = [
+        SweepPoint(
+            params=Params(basis='hook_inject_Y', postselected_rounds=2, postselected_diameter=3, memory_rounds=3, distance=d),
+            convert_to_cz=True,
+            noise_model_name='None',
+            noise_strength=0,
+        )
+        for d in [3, 5, 7]
+    ]
+    sizes = []
+    for k in range(3):
+        run_sweep(points, out_dir=tmp_path / str(k), progress_out=None)
+        clear_memo_caches()
+        sizes.append((len(_flow._COORD_TO_BIT), len(_flow._BIT_TO_COORD)))
+    assert sizes[0] == sizes[1] == sizes[2]
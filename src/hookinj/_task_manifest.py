@@ -0,0 +1,140 @@
+import json
+import os
+import pathlib
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import sinter
+import stim
+
+from hookinj._circuit_io import read_circuit, COMPRESSION_SUFFIXES, _umask
+
+MANIFEST_SUFFIX = '.task.json'
+
+
+def manifest_path_for(circuit_path: Union[str, pathlib.Path]) -> pathlib.Path:
+    circuit_path = pathlib.Path(circuit_path)
+    return circuit_path.parent / (circuit_path.name + MANIFEST_SUFFIX)
+
+
+def circuit_file_metadata(circuit_path: Union[str, pathlib.Path]) -> Dict[str, Any]:
+    """The metadata `sinter collect --metadata_func auto` would give the file."""
+    name = pathlib.Path(circuit_path).name
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if suffix:
+            name = name.removesuffix(suffix)
+    return sinter.comma_separated_key_values(name)
+
+
+def postselection_mask_from_4th_coord(circuit: stim.Circuit) -> Optional[np.ndarray]:
+    """Bit-packs which detectors have a non-zero fourth coordinate.
+
+    This is the mask that `--postselected_detectors_predicate "len(coords) > 3
+    and coords[3] != 0"` produces, including returning None instead of an
+    all-zero mask.
+    """
+    bits = np.zeros(shape=circuit.num_detectors, dtype=np.bool_)
+    for k, coords in circuit.get_detector_coordinates().items():
+        if len(coords) > 3 and coords[3] != 0:
+            bits[k] = True
+    if not np.any(bits):
+        return None
+    return np.packbits(bits, bitorder='little')
+
+
+def detector_error_model_for_collection(circuit: stim.Circuit) -> stim.DetectorErrorModel:
+    """Computes the detector error model the way `sinter collect` (v1.11) does."""
+    return circuit.detector_error_model(
+        allow_gauge_detectors=False,
+        approximate_disjoint_errors=True,
+        block_decomposition_from_introducing_remnant_edges=False,
+        decompose_errors=True,
+        flatten_loops=True,
+        ignore_decomposition_failures=False,
+    )
+
+
+def make_task_manifest(
+        circuit: stim.Circuit,
+        *,
+        circuit_path: Union[str, pathlib.Path],
+        decoders: Sequence[str],
+) -> Dict[str, Any]:
+    """Precomputes everything sinter needs to start sampling the circuit.
+
+    The circuit is referenced by file name, relative to the manifest, rather
+    than being duplicated into the manifest.
+    """
+    if not decoders:
+        raise ValueError("Need at least one decoder.")
+    dem = detector_error_model_for_collection(circuit)
+    mask = postselection_mask_from_4th_coord(circuit)
+    json_metadata = circuit_file_metadata(circuit_path)
+    strong_ids = {}
+    for decoder in decoders:
+        strong_ids[decoder] = sinter.Task(
+            circuit=circuit,
+            decoder=decoder,
+            detector_error_model=dem,
+            postselection_mask=mask,
+            json_metadata=json_metadata,
+        ).strong_id()
+    return {
+        'circuit_file': pathlib.Path(circuit_path).name,
+        'detector_error_model': str(dem),
+        'num_detectors': circuit.num_detectors,
+        'postselection_mask': None if mask is None else mask.tobytes().hex(),
+        'json_metadata': json_metadata,
+        'strong_ids': strong_ids,
+    }
+
+
+def write_task_manifest(circuit_path: Union[str, pathlib.Path], manifest: Dict[str, Any]) -> pathlib.Path:
+    """Writes the manifest next to its circuit, atomically (like `write_circuit`)."""
+    path = manifest_path_for(circuit_path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        # mkstemp creates owner-only files; use the permissions `open` would have.
+        os.chmod(tmp_path, 0o666 & ~_umask())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+def load_task_manifest(path: Union[str, pathlib.Path]) -> List[sinter.Task]:
+    """Turns a manifest into one `sinter.Task` per decoder.
+
+    Nothing is recomputed. The detector error model and strong ids are taken
+    from the manifest as-is.
+    """
+    path = pathlib.Path(path)
+    with open(path) as f:
+        manifest = json.load(f)
+    circuit = read_circuit(path.parent / manifest['circuit_file'])
+    if circuit.num_detectors != manifest['num_detectors']:
+        raise ValueError(f"Circuit file doesn't match manifest {path}.")
+    dem = stim.DetectorErrorModel(manifest['detector_error_model'])
+    mask = manifest['postselection_mask']
+    if mask is not None:
+        mask = np.frombuffer(bytes.fromhex(mask), dtype=np.uint8).copy()
+    return [
+        sinter.Task(
+            circuit=circuit,
+            decoder=decoder,
+            detector_error_model=dem,
+            postselection_mask=mask,
+            json_metadata=manifest['json_metadata'],
+            skip_validation=True,
+            _unvalidated_strong_id=strong_id,
+        )
+        for decoder, strong_id in manifest['strong_ids'].items()
+    ]
+
+
+def load_task_manifests(paths: Iterable[Union[str, pathlib.Path]]) -> List[sinter.Task]:
+    return [task for path in paths for task in load_task_manifest(path)]
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+import sinter
+
+from hookinj import gen
+from hookinj._circuit_io import write_circuit
+from hookinj._make_circuit import make_circuit
+from hookinj._task_manifest import make_task_manifest, write_task_manifest, load_task_manifest, \
+    postselection_mask_from_4th_coord, manifest_path_for, detector_error_model_for_collection
+
+
+def test_task_manifest_matches_sinter_cli(tmp_path):
+    circuit = make_circuit(
+        basis='hook_inject_Y',
+        distance=3,
+        noise=gen.NoiseModel.si1000(1e-3),
+        postselected_rounds=2,
+        postselected_diameter=3,
+        memory_rounds=3,
+    )
+    path = tmp_path / 'd=3,b=hook_inject_Y,p=0.001.stim.gz'
+    write_circuit(path, circuit)
+    manifest_path = write_task_manifest(path, make_task_manifest(circuit, circuit_path=path, decoders=['pymatching', 'fusion_blossom']))
+    assert manifest_path == manifest_path_for(path)
+
+    tasks = load_task_manifest(manifest_path)
+    assert [t.decoder for t in tasks] == ['pymatching', 'fusion_blossom']
+    for task in tasks:
+        # What `sinter collect --metadata_func auto --postselected_detectors_predicate ...` would compute.
+        expected = sinter.Task(
+            circuit=circuit,
+            decoder=task.decoder,
+            detector_error_model=detector_error_model_for_collection(circuit),
+            postselection_mask=sinter.post_selection_mask_from_4th_coord(circuit),
+            json_metadata={'d': 3, 'b': 'hook_inject_Y', 'p': 0.001},
+        )
+        assert task.circuit == circuit
+        assert task.json_metadata == expected.json_metadata
+        np.testing.assert_array_equal(task.postselection_mask, expected.postselection_mask)
+        assert task.strong_id() == expected.strong_id()
+        assert task._recomputed_strong_id() == expected.strong_id()
+
+
+def test_postselection_mask_from_4th_coord():
+    circuit = make_circuit(basis='X', distance=3, noise=None, memory_rounds=3)
+    assert postselection_mask_from_4th_coord(circuit) is None
+
+    circuit = make_circuit(basis='hook_inject_X', distance=3, noise=None, memory_rounds=3, postselected_rounds=1, postselected_diameter=3)
+    np.testing.assert_array_equal(
+        postselection_mask_from_4th_coord(circuit),
+        sinter.post_selection_mask_from_4th_coord(circuit),
+    )
+
+
+def test_write_task_manifest_failure_leaves_no_file(tmp_path):
+    with pytest.raises(TypeError):
+        write_task_manifest(tmp_path / 'c.stim', {'unserializable': object()})
+    assert list(tmp_path.iterdir()) == []
+    path = write_task_manifest(tmp_path / 'c.stim', {'a': 1})
+    assert list(tmp_path.iterdir()) == [path]
+    assert path.read_text() == '{"a": 1}'
@@ -136,8 +136,8 @@ def test_exact_circuit():
         QUBIT_COORDS(4, 2) 22
         QUBIT_COORDS(4, 3) 23
         QUBIT_COORDS(4, 4) 24
-        R 0 1 2 5 7 10 11 12 6
-        X_ERROR(0.001) 0 1 2 5 7 10 11 12 6
+        R 0 1 2 5 6 7 10 11 12
+        X_ERROR(0.001) 0 1 2 5 6 7 10 11 12
         DEPOLARIZE1(0.001) 3 4 8 9 13 14 15 16 17 18 19 20 21 22 23 24
         TICK
         C_ZYX 0 10
@@ -222,8 +222,8 @@ def test_exact_circuit():
         SHIFT_COORDS(0, 0, 1)
         DEPOLARIZE1(0.001) 1 5 7 11 0 2 3 4 6 8 9 10 12 13 14 15 16 17 18 19 20 21 22 23 24
         TICK
-        R 1 3 4 5 7 9 11 13 14 15 16 17 19 21 23 24 8 18 20 22
-        X_ERROR(0.001) 1 3 4 5 7 9 11 13 14 15 16 17 19 21 23 24 8 18 20 22
+        R 1 3 4 5 7 8 9 11 13 14 15 16 17 18 19 20 21 22 23 24
+        X_ERROR(0.001) 1 3 4 5 7 8 9 11 13 14 15 16 17 18 19 20 21 22 23 24
         DEPOLARIZE1(0.001) 0 2 6 10 12
         TICK
         H 0 1 2 3 5 7 8 9 11 13 15 17 18 19 21 23 24
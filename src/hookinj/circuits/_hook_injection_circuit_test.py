@@ -131,8 +131,8 @@ def test_hook_injection_circuit_exact():
         QUBIT_COORDS(1.5, 1.5) 14
         QUBIT_COORDS(1.5, 2.5) 15
         QUBIT_COORDS(2.5, 0.5) 16
-        R 0 1 3 4 10 12 11
-        X_ERROR(0.001) 0 1 3 4 10 12 11
+        R 0 1 3 4 10 11 12
+        X_ERROR(0.001) 0 1 3 4 10 11 12
         DEPOLARIZE1(0.001) 2 5 6 7 8 9 13 14 15 16
         TICK
         H 0 3 4 10 11 12
@@ -166,8 +166,8 @@ def test_hook_injection_circuit_exact():
         SHIFT_COORDS(0, 0, 1)
         DEPOLARIZE1(0.001) 10 12 11 0 1 2 3 4 5 6 7 8 9 13 14 15 16
         TICK
-        R 10 12 11
-        X_ERROR(0.001) 10 12 11
+        R 10 11 12
+        X_ERROR(0.001) 10 11 12
         DEPOLARIZE1(0.001) 0 1 2 3 4 5 6 7 8 9 13 14 15 16
         TICK
         H 10 11 12
@@ -205,8 +205,8 @@ def test_hook_injection_circuit_exact():
         SHIFT_COORDS(0, 0, 1)
         DEPOLARIZE1(0.001) 10 12 11 0 1 2 3 4 5 6 7 8 9 13 14 15 16
         TICK
-        R 10 12 13 15 2 5 8 6 7 9 11 14 16
-        X_ERROR(0.001) 10 12 13 15 2 5 8 6 7 9 11 14 16
+        R 2 5 6 7 8 9 10 11 12 13 14 15 16
+        X_ERROR(0.001) 2 5 6 7 8 9 10 11 12 13 14 15 16
         DEPOLARIZE1(0.001) 0 1 3 4
         TICK
         H 0 5 8 9 10 11 12 13 14 15 16
@@ -247,8 +247,8 @@ def test_hook_injection_circuit_exact():
         DEPOLARIZE1(0.001) 10 12 13 15 9 11 14 16 0 1 2 3 4 5 6 7 8
         TICK
         REPEAT 4 {
-            R 10 12 13 15 9 11 14 16
-            X_ERROR(0.001) 10 12 13 15 9 11 14 16
+            R 9 10 11 12 13 14 15 16
+            X_ERROR(0.001) 9 10 11 12 13 14 15 16
             DEPOLARIZE1(0.001) 0 1 2 3 4 5 6 7 8
             TICK
             H 0 2 4 9 10 11 12 13 14 15 16
@@ -292,8 +292,8 @@ def test_hook_injection_circuit_exact():
             DEPOLARIZE1(0.001) 10 12 13 15 9 11 14 16 0 1 2 3 4 5 6 7 8
             TICK
         }
-        R 10 12 13 15 9 11 14 16
-        X_ERROR(0.001) 10 12 13 15 9 11 14 16
+        R 9 10 11 12 13 14 15 16
+        X_ERROR(0.001) 9 10 11 12 13 14 15 16
         DEPOLARIZE1(0.001) 0 1 2 3 4 5 6 7 8
         TICK
         H 0 2 4 9 10 11 12 13 14 15 16
@@ -65,8 +65,8 @@ def test_exact_circuit_x():
         QUBIT_COORDS(1.5, 1.5) 14
         QUBIT_COORDS(1.5, 2.5) 15
         QUBIT_COORDS(2.5, 0.5) 16
-        R 10 12 13 15 0 1 2 3 4 5 6 7 8 9 11 14 16
-        X_ERROR(0.001) 10 12 13 15 0 1 2 3 4 5 6 7 8 9 11 14 16
+        R 0 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16
+        X_ERROR(0.001) 0 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16
         TICK
         H 0 1 2 3 7 9 10 11 12 13 14 15 16
         DEPOLARIZE1(0.001) 0 1 2 3 7 9 10 11 12 13 14 15 16 4 5 6 8
@@ -105,8 +105,8 @@ def test_exact_circuit_x():
         DEPOLARIZE1(0.001) 10 12 13 15 9 11 14 16 0 1 2 3 4 5 6 7 8
         TICK
         REPEAT 98 {
-            R 10 12 13 15 9 11 14 16
-            X_ERROR(0.001) 10 12 13 15 9 11 14 16
+            R 9 10 11 12 13 14 15 16
+            X_ERROR(0.001) 9 10 11 12 13 14 15 16
             DEPOLARIZE1(0.001) 0 1 2 3 4 5 6 7 8
             TICK
             H 4 6 8 9 10 11 12 13 14 15 16
@@ -150,8 +150,8 @@ def test_exact_circuit_x():
             DEPOLARIZE1(0.001) 10 12 13 15 9 11 14 16 0 1 2 3 4 5 6 7 8
             TICK
         }
-        R 10 12 13 15 9 11 14 16
-        X_ERROR(0.001) 10 12 13 15 9 11 14 16
+        R 9 10 11 12 13 14 15 16
+        X_ERROR(0.001) 9 10 11 12 13 14 15 16
         DEPOLARIZE1(0.001) 0 1 2 3 4 5 6 7 8
         TICK
         H 4 6 8 9 10 11 12 13 14 15 16
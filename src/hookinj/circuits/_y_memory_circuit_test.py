@@ -67,7 +67,7 @@ def test_exact_circuit_y():
         QUBIT_COORDS(1.5, 2.5) 16
         QUBIT_COORDS(2.5, 0.5) 17
         QUBIT_COORDS(2.5, 1.5) 18
-        R 15 13 11 9 6 4 3 2 1 8 7 5 18 16 14 12
+        R 1 2 3 4 5 6 7 8 9 11 12 13 14 15 16 18
         TICK
         H 2 4 5 9 11 12 13 14 15 16 18
         TICK
@@ -93,7 +93,7 @@ def test_exact_circuit_y():
         DETECTOR(2.5, 1.5, 0) rec[-4]
         SHIFT_COORDS(0, 0, 1)
         TICK
-        R 15 13 11 9 18 16 14 12
+        R 9 11 12 13 14 15 16 18
         TICK
         H 9 11 12 13 14 15 16 18
         TICK
@@ -122,7 +122,7 @@ def test_exact_circuit_y():
         DETECTOR(2.5, 1.5, 0) rec[-12] rec[-4]
         SHIFT_COORDS(0, 0, 1)
         TICK
-        R 15 13 11 10 9 0 18 17 16 14 12
+        R 0 9 10 11 12 13 14 15 16 17 18
         TICK
         C_ZYX 11 15
         H 9 10 12 13 16
@@ -162,7 +162,7 @@ def test_exact_circuit_y():
         OBSERVABLE_INCLUDE(0) rec[-10] rec[-9] rec[-5] rec[-2]
         SHIFT_COORDS(0, 0, 1)
         TICK
-        R 10 12 14 16 9 11 15 17
+        R 9 10 11 12 14 15 16 17
         TICK
         H 9 10 11 12 14 15 16 17
         TICK
@@ -192,7 +192,7 @@ def test_exact_circuit_y():
         SHIFT_COORDS(0, 0, 1)
         TICK
         REPEAT 99 {
-            R 10 12 14 16 9 11 15 17
+            R 9 10 11 12 14 15 16 17
             TICK
             H 4 6 8 9 10 11 12 14 15 16 17
             TICK
@@ -222,7 +222,7 @@ def test_exact_circuit_y():
             SHIFT_COORDS(0, 0, 1)
             TICK
         }
-        R 10 12 13 14 16 9 11 15 17 18
+        R 9 10 11 12 13 14 15 16 17 18
         TICK
         H 0 2 4 9 10 11 12 13 14 15 16 17 18
         TICK
@@ -260,7 +260,7 @@ def test_exact_circuit_y():
         OBSERVABLE_INCLUDE(0) rec[-11] rec[-10] rec[-9] rec[-8] rec[-7] rec[-6]
         SHIFT_COORDS(0, 0, 1)
         TICK
-        R 12 14 16 18 9 11 13 15
+        R 9 11 12 13 14 15 16 18
         TICK
         H 9 11 12 13 14 15 16 17 18
         SQRT_X 0
@@ -290,7 +290,7 @@ def test_exact_circuit_y():
         DETECTOR(2.5, 1.5, 0) rec[-16] rec[-15] rec[-5]
         SHIFT_COORDS(0, 0, 1)
         TICK
-        R 12 14 16 18 9 11 13 15
+        R 9 11 12 13 14 15 16 18
         TICK
         H 6 9 11 12 13 14 15 16 18
         TICK
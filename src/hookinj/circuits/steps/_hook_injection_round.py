@@ -1,9 +1,11 @@
+import functools
 from typing import AbstractSet, Set, Tuple
 
 from hookinj import gen
 from hookinj.circuits.steps._patches import make_xtop_qubit_patch, DL, UR, UL, DR
 
 
+@functools.lru_cache(maxsize=64)
 def make_hook_injection_round(*, exponent: float, distance: int) -> gen.Chunk:
     patch = make_xtop_qubit_patch(distance=distance)
     xs = {q for q in patch.measure_set if gen.checkerboard_basis(q) == 'X'}
@@ -1,3 +1,4 @@
+import functools
 from typing import Tuple, Set, AbstractSet, Optional
 
 from hookinj import gen
@@ -21,6 +22,7 @@ def _split_dl_md_ur(ps: AbstractSet[complex]) -> Tuple[Set[complex], Set[complex
     return dl, md, ur
 
 
+@functools.lru_cache(maxsize=64)
 def make_y_transition_round_nesw_xzxz_to_xzzx(
         *,
         distance: int,
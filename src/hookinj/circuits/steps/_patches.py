@@ -98,6 +98,7 @@ def rectangular_unrotated_surface_code_patch(
     )
 
 
+@functools.lru_cache(maxsize=64)
 def make_ztop_yboundary_patch(*, distance: int) -> gen.Patch:
     def order_func(m: complex) -> List[complex]:
         if m.real > m.imag and False:
@@ -122,6 +123,7 @@ def make_ztop_yboundary_patch(*, distance: int) -> gen.Patch:
     )
 
 
+@functools.lru_cache(maxsize=64)
 def make_xtop_qubit_patch(*, distance: int) -> gen.Patch:
     def order_func(m: complex) -> List[complex]:
         if gen.checkerboard_basis(m) == 'X':
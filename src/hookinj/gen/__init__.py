@@ -1,51 +1,132 @@
-from hookinj.gen._layer_translate import (
-    to_z_basis_interaction_circuit,
-)
-from hookinj.gen._noise import (
-    NoiseModel,
-    NoiseRule,
-    occurs_in_classical_control_system,
-)
-from hookinj.gen._builder import (
-    Builder,
-    AtLayer,
-    MeasurementTracker,
-)
-from hookinj.gen._tile import (
-    Tile,
-)
-from hookinj.gen._patch import (
-    Patch,
-)
-from hookinj.gen._util import (
-    stim_circuit_with_transformed_coords,
-    sorted_complex,
-    complex_key,
-    estimate_qubit_count_during_postselection,
-)
-from hookinj.gen._viz_circuit_html import (
-    stim_circuit_html_viewer,
-)
-from hookinj.gen._viz_patch_svg import (
-    patch_svg_viewer,
-)
-from hookinj.gen._surface_code import (
-    surface_code_patch,
-    checkerboard_basis,
-)
-from hookinj.gen._flow_util import (
-    verify_circuit_has_all_possible_detectors,
-    standard_surface_code_chunk,
-    compile_chunks_into_circuit,
-    build_surface_code_round_circuit,
-)
-from hookinj.gen._chunk import (
-    Chunk,
-)
-from hookinj.gen._flow import (
-    Flow,
-    PauliString,
-)
-from hookinj.gen._flow_verifier import (
-    FlowStabilizerVerifier,
-)
+"""Utilities for building, verifying, and noising surface code circuits.
+
+Public names are resolved lazily, the first time they are accessed, so that
+importing this package doesn't pay for heavy dependencies (e.g. numpy via
+the flow verifier and layer translator) that a given process never uses.
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+_LAZY_ATTRS = {
+    'to_z_basis_interaction_circuit': 'hookinj.gen._layer_translate',
+
+    'NoiseModel': 'hookinj.gen._noise',
+    'NoiseRule': 'hookinj.gen._noise',
+    'occurs_in_classical_control_system': 'hookinj.gen._noise',
+
+    'Builder': 'hookinj.gen._builder',
+    'AtLayer': 'hookinj.gen._builder',
+    'MeasurementTracker': 'hookinj.gen._builder',
+
+    'Tile': 'hookinj.gen._tile',
+
+    'Patch': 'hookinj.gen._patch',
+
+    'stim_circuit_with_transformed_coords': 'hookinj.gen._util',
+    'sorted_complex': 'hookinj.gen._util',
+    'complex_key': 'hookinj.gen._util',
+    'estimate_qubit_count_during_postselection': 'hookinj.gen._util',
+
+    'stim_circuit_html_viewer': 'hookinj.gen._viz_circuit_html',
+
+    'patch_svg_viewer': 'hookinj.gen._viz_patch_svg',
+
+    'surface_code_patch': 'hookinj.gen._surface_code',
+    'checkerboard_basis': 'hookinj.gen._surface_code',
+
+    'verify_circuit_has_all_possible_detectors': 'hookinj.gen._flow_util',
+    'standard_surface_code_chunk': 'hookinj.gen._flow_util',
+    'compile_chunks_into_circuit': 'hookinj.gen._flow_util',
+    'ChunkCompiler': 'hookinj.gen._flow_util',
+    'build_surface_code_round_circuit': 'hookinj.gen._flow_util',
+
+    'Chunk': 'hookinj.gen._chunk',
+    'verify_chunks': 'hookinj.gen._chunk',
+
+    'Flow': 'hookinj.gen._flow',
+    'PauliString': 'hookinj.gen._flow',
+
+    'FlowStabilizerVerifier': 'hookinj.gen._flow_verifier',
+
+    'tracing': 'hookinj.gen._trace',
+
+    'verification_cache_dir': 'hookinj.gen._verify_cache',
+}
+
+__all__ = sorted(_LAZY_ATTRS)
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
+
+
+if TYPE_CHECKING:
+    from hookinj.gen._layer_translate import (
+        to_z_basis_interaction_circuit,
+    )
+    from hookinj.gen._noise import (
+        NoiseModel,
+        NoiseRule,
+        occurs_in_classical_control_system,
+    )
+    from hookinj.gen._builder import (
+        Builder,
+        AtLayer,
+        MeasurementTracker,
+    )
+    from hookinj.gen._tile import (
+        Tile,
+    )
+    from hookinj.gen._patch import (
+        Patch,
+    )
+    from hookinj.gen._util import (
+        stim_circuit_with_transformed_coords,
+        sorted_complex,
+        complex_key,
+        estimate_qubit_count_during_postselection,
+    )
+    from hookinj.gen._viz_circuit_html import (
+        stim_circuit_html_viewer,
+    )
+    from hookinj.gen._viz_patch_svg import (
+        patch_svg_viewer,
+    )
+    from hookinj.gen._surface_code import (
+        surface_code_patch,
+        checkerboard_basis,
+    )
+    from hookinj.gen._flow_util import (
+        verify_circuit_has_all_possible_detectors,
+        standard_surface_code_chunk,
+        compile_chunks_into_circuit,
+        ChunkCompiler,
+        build_surface_code_round_circuit,
+    )
+    from hookinj.gen._chunk import (
+        Chunk,
+        verify_chunks,
+    )
+    from hookinj.gen._flow import (
+        Flow,
+        PauliString,
+    )
+    from hookinj.gen._flow_verifier import (
+        FlowStabilizerVerifier,
+    )
+    from hookinj.gen._trace import (
+        tracing,
+    )
+    from hookinj.gen._verify_cache import (
+        verification_cache_dir,
+    )
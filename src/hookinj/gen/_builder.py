@@ -4,7 +4,8 @@ import dataclasses
 
 import stim
 
-from hookinj.gen._util import complex_key, sorted_complex
+from hookinj.gen._trace import traced
+from hookinj.gen._util import complex_key, sorted_complex, append_instruction
 
 if TYPE_CHECKING:
     from hookinj.gen._interaction_planner import InteractionPlanner
@@ -116,13 +117,14 @@ class Builder:
         circuit = stim.Circuit()
         for q, i in q2i.items():
             c = to_circuit_coord_data(q)
-            circuit.append("QUBIT_COORDS", [i], [c.real, c.imag])
+            append_instruction(circuit, "QUBIT_COORDS", [i], [c.real, c.imag])
         return Builder(
             q2i=q2i,
             circuit=circuit,
             tracker=MeasurementTracker(),
         )
 
+    @traced('Builder.gate')
     def gate(self,
              name: str,
              qubits: Iterable[complex]) -> None:
@@ -130,8 +132,9 @@ class Builder:
         qubits = sorted_complex(qubits)
         if not qubits:
             return
-        self.circuit.append(name, [self.q2i[q] for q in qubits])
+        append_instruction(self.circuit, name, [self.q2i[q] for q in qubits])
 
+    @traced('Builder.gate2')
     def gate2(self,
               name: str,
               pairs: Iterable[Tuple[complex, complex]]) -> None:
@@ -146,11 +149,12 @@ class Builder:
             pairs = [sorted_complex(pair) for pair in pairs]
         if not pairs:
             return
-        self.circuit.append(name, [self.q2i[q] for pair in pairs for q in pair])
+        append_instruction(self.circuit, name, [self.q2i[q] for pair in pairs for q in pair])
 
     def shift_coords(self, *, dp: complex = 0, dt: int):
-        self.circuit.append("SHIFT_COORDS", [], [dp.real, dp.imag, dt])
+        append_instruction(self.circuit, "SHIFT_COORDS", [], [dp.real, dp.imag, dt])
 
+    @traced('Builder.measure')
     def measure(self,
                 qubits: Iterable[complex],
                 *,
@@ -160,10 +164,11 @@ class Builder:
         qubits = sorted_complex(qubits)
         if not qubits:
             return
-        self.circuit.append(f"M{basis}", [self.q2i[q] for q in qubits])
+        append_instruction(self.circuit, f"M{basis}", [self.q2i[q] for q in qubits])
         for q in qubits:
             self.tracker.record_measurement(AtLayer(tracker_key(q), save_layer))
 
+    @traced('Builder.measure_pauli_product')
     def measure_pauli_product(self,
                               *,
                               xs: Iterable[complex] = (),
@@ -235,11 +240,12 @@ class Builder:
             targets.append(comb)
         if targets:
             targets.pop()
-            self.circuit.append('MPP', targets)
+            append_instruction(self.circuit, 'MPP', targets)
             self.tracker.record_measurement(key)
         else:
             self.tracker.make_measurement_group([], key=key)
 
+    @traced('Builder.detector')
     def detector(self,
                  keys: Iterable[Any],
                  *,
@@ -259,23 +265,21 @@ class Builder:
         if ignore_non_existent:
             keys = [k for k in keys if k in self.tracker.recorded]
         targets = self.tracker.current_measurement_record_targets_for(keys)
-        self.circuit.append('DETECTOR', targets, coords)
+        append_instruction(self.circuit, 'DETECTOR', targets, coords)
 
+    @traced('Builder.obs_include')
     def obs_include(self,
                     keys: Iterable[Any],
                     *,
                     obs_index: int) -> None:
         ms = self.tracker.current_measurement_record_targets_for(keys)
         if ms:
-            self.circuit.append(
-                'OBSERVABLE_INCLUDE',
-                ms,
-                obs_index,
-            )
+            append_instruction(self.circuit, 'OBSERVABLE_INCLUDE', ms, obs_index)
 
     def tick(self) -> None:
-        self.circuit.append('TICK')
+        append_instruction(self.circuit, 'TICK')
 
+    @traced('Builder.cz')
     def cz(self, pairs: List[Tuple[complex, complex]]) -> None:
         sorted_pairs = []
         for a, b in pairs:
@@ -283,9 +287,10 @@ class Builder:
                 a, b = b, a
             sorted_pairs.append((a, b))
         sorted_pairs = sorted(sorted_pairs, key=lambda e: (complex_key(e[0]), complex_key(e[1])))
-        for a, b in sorted_pairs:
-            self.circuit.append('CZ', [self.q2i[a], self.q2i[b]])
+        if sorted_pairs:
+            append_instruction(self.circuit, 'CZ', [self.q2i[q] for pair in sorted_pairs for q in pair])
 
+    @traced('Builder.swap')
     def swap(self, pairs: List[Tuple[complex, complex]]) -> None:
         sorted_pairs = []
         for a, b in pairs:
@@ -293,9 +298,10 @@ class Builder:
                 a, b = b, a
             sorted_pairs.append((a, b))
         sorted_pairs = sorted(sorted_pairs, key=lambda e: (complex_key(e[0]), complex_key(e[1])))
-        for a, b in sorted_pairs:
-            self.circuit.append('SWAP', [self.q2i[a], self.q2i[b]])
+        if sorted_pairs:
+            append_instruction(self.circuit, 'SWAP', [self.q2i[q] for pair in sorted_pairs for q in pair])
 
+    @traced('Builder.classical_paulis')
     def classical_paulis(self,
                          *,
                          control_keys: Iterable[Any],
@@ -303,9 +309,13 @@ class Builder:
                          basis: str) -> None:
         gate = f'C{basis}'
         indices = [self.q2i[q] for q in sorted_complex(targets)]
+        flat_targets = []
         for rec in self.tracker.current_measurement_record_targets_for(control_keys):
             for i in indices:
-                self.circuit.append(gate, [rec, i])
+                flat_targets.append(rec)
+                flat_targets.append(i)
+        if flat_targets:
+            append_instruction(self.circuit, gate, flat_targets)
 
     def plan_interactions(
             self,
@@ -1,14 +1,20 @@
-from typing import Iterable, Dict, Callable
+import hashlib
+import pathlib
+from typing import Iterable, Dict, Callable, List, Tuple, Any, Optional
 
-import sinter
 import stim
 
-from hookinj.gen._util import stim_circuit_with_transformed_coords
+from hookinj.gen import _verify_cache
+from hookinj.gen._util import stim_circuit_with_transformed_coords, group_by
 from hookinj.gen._flow import Flow, PauliString
 from hookinj.gen._patch import Patch
 from hookinj.gen._tile import Tile
 
 
+_MAX_INVERTED = 256
+_INVERTED: Dict[str, 'Chunk'] = {}
+
+
 class Chunk:
     def __init__(self,
                  circuit: stim.Circuit,
@@ -63,12 +69,47 @@ class Chunk:
     def __mul__(self, other: int) -> 'Chunk':
         return self.with_repetitions(other)
 
+    def fingerprint(self) -> str:
+        """A stable hash of everything that determines whether the chunk verifies.
+
+        Equal chunks have equal fingerprints, in any process.
+        """
+        h = hashlib.sha256()
+
+        def add(text: str):
+            h.update(text.encode('utf8'))
+            h.update(b'\0')
+
+        add(str(self.circuit))
+        for q, i in sorted(self.q2i.items(), key=lambda e: e[1]):
+            add(f'{i}:{complex(q)!r}')
+        add('flows')
+        for flow in self.flows:
+            add(f'{flow.start}|{flow.end}|{flow.measurement_indices!r}|{flow.obs_index!r}|{complex(flow.center)!r}|{flow.postselect!r}')
+        add('discarded_inputs')
+        for p in self.discarded_inputs:
+            add(str(p))
+        add('discarded_outputs')
+        for p in self.discarded_outputs:
+            add(str(p))
+        add(f'{self.magic!r}|{self.repetitions!r}')
+        return h.hexdigest()
+
     def verify(self):
-        """Checks that this chunk's circuit actually implements its flows."""
-        for key, group in sinter.group_by(self.flows, key=lambda flow: (flow.start, flow.obs_index)).items():
+        """Checks that this chunk's circuit actually implements its flows.
+
+        Chunks that were verified before (see `fingerprint`) are skipped. Set
+        HOOKINJ_VERIFY_CACHE to a directory to also remember them across
+        processes.
+        """
+        fingerprint = self.fingerprint()
+        if _verify_cache.is_verified(fingerprint):
+            return
+
+        for key, group in group_by(self.flows, key=lambda flow: (flow.start, flow.obs_index)).items():
             if key[0] and len(group) > 1:
                 raise ValueError(f"Multiple flows with same non-empty end: {group}")
-        for key, group in sinter.group_by(self.flows, key=lambda flow: (flow.end, flow.obs_index)).items():
+        for key, group in group_by(self.flows, key=lambda flow: (flow.end, flow.obs_index)).items():
             if key[0] and len(group) > 1:
                 raise ValueError(f"Multiple flows with same non-empty end: {group}")
 
@@ -86,10 +127,23 @@ class Chunk:
             if starts != ends:
                 raise ValueError("Not an exact loop.")
 
+        _verify_cache.mark_verified(fingerprint)
+
     def inverted(self) -> 'Chunk':
-        """Checks that this chunk's circuit actually implements its flows."""
-        from hookinj.gen._flow_verifier import FlowStabilizerVerifier
-        return FlowStabilizerVerifier.invert(self)
+        """Returns the time reversal of this chunk, checking its flows along the way.
+
+        Results are memoized by fingerprint. The returned chunk is shared, so
+        don't mutate it.
+        """
+        fingerprint = self.fingerprint()
+        result = _INVERTED.get(fingerprint)
+        if result is None:
+            from hookinj.gen._flow_verifier import FlowStabilizerVerifier
+            result = FlowStabilizerVerifier.invert(self)
+            if len(_INVERTED) >= _MAX_INVERTED:
+                del _INVERTED[next(iter(_INVERTED))]
+            _INVERTED[fingerprint] = result
+        return result
 
     def with_xz_flipped(self) -> 'Chunk':
         return Chunk(
@@ -150,6 +204,93 @@ class Chunk:
         return self._boundary_patch(True)
 
 
+def verify_chunks(chunks: Iterable[Chunk], *, jobs: int = 1) -> None:
+    """Verifies many chunks, reporting every failure instead of just the first.
+
+    Identical chunks (and chunks verified before) are only checked once. With
+    `jobs > 1` the chunks are verified on a process pool.
+
+    Raises:
+        ValueError: One or more chunks don't implement their flows, or
+            verifying them raised. The message lists each failing chunk's
+            position, fingerprint and the reason it failed.
+    """
+    pending: Dict[str, Tuple[int, Chunk]] = {}
+    for k, chunk in enumerate(chunks):
+        fingerprint = chunk.fingerprint()
+        if fingerprint not in pending and not _verify_cache.is_verified(fingerprint):
+            pending[fingerprint] = (k, chunk)
+
+    failures: List[Tuple[int, str, str]] = []
+    if jobs > 1 and len(pending) > 1:
+        import concurrent.futures
+        directory = _verify_cache.get_verification_cache_dir()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as executor:
+            futures = {
+                executor.submit(_verify_in_worker, _chunk_to_picklable(chunk), directory): (k, fingerprint)
+                for fingerprint, (k, chunk) in pending.items()
+            }
+            for future, (k, fingerprint) in futures.items():
+                try:
+                    error = future.result()
+                except Exception as ex:
+                    error = _failure_text(ex)
+                if error is None:
+                    _verify_cache.mark_verified(fingerprint)
+                else:
+                    failures.append((k, fingerprint, error))
+    else:
+        for fingerprint, (k, chunk) in pending.items():
+            try:
+                chunk.verify()
+            except Exception as ex:
+                failures.append((k, fingerprint, _failure_text(ex)))
+
+    if failures:
+        failures.sort()
+        lines = [f"{len(failures)} chunk(s) failed verification:"]
+        lines.extend(f"    chunk {k}: [fingerprint {fingerprint[:12]}] {error}" for k, fingerprint, error in failures)
+        raise ValueError('\n'.join(lines))
+
+
+def _failure_text(ex: Exception) -> str:
+    if isinstance(ex, ValueError):
+        return str(ex)
+    return f'{type(ex).__name__}: {ex}'
+
+
+def _chunk_to_picklable(chunk: Chunk) -> Tuple[Any, ...]:
+    # Circuits are sent as text, since older versions of stim can't pickle them.
+    return (
+        str(chunk.circuit),
+        chunk.q2i,
+        chunk.flows,
+        chunk.magic,
+        tuple(chunk.discarded_inputs),
+        tuple(chunk.discarded_outputs),
+        chunk.repetitions,
+    )
+
+
+def _verify_in_worker(args: Tuple[Any, ...], directory: Optional[pathlib.Path]) -> Optional[str]:
+    circuit_text, q2i, flows, magic, discarded_inputs, discarded_outputs, repetitions = args
+    chunk = Chunk(
+        circuit=stim.Circuit(circuit_text),
+        q2i=q2i,
+        flows=flows,
+        magic=magic,
+        discarded_inputs=discarded_inputs,
+        discarded_outputs=discarded_outputs,
+        repetitions=repetitions,
+    )
+    with _verify_cache.verification_cache_dir(directory):
+        try:
+            chunk.verify()
+        except Exception as ex:
+            return _failure_text(ex)
+    return None
+
+
 XZ_FLIPPED = {
     "I": "I",
     "X": "Z",
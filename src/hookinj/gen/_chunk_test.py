@@ -1,5 +1,6 @@
 from typing import Iterable, Dict, Callable
 
+import pytest
 import stim
 
 from hookinj import gen
@@ -80,3 +81,116 @@ def test_with_flows_postselected():
             end=gen.PauliString({0: 'Z'}),
         ).postselected()],
     )
+
+
+def _small_chunk(end_basis: str = 'Z') -> gen.Chunk:
+    return gen.Chunk(
+        circuit=stim.Circuit("""
+            R 0
+            H 0
+        """),
+        q2i={1j: 0},
+        flows=[gen.Flow(center=0, end=gen.PauliString({1j: end_basis}))],
+    )
+
+
+def test_fingerprint():
+    assert _small_chunk().fingerprint() == _small_chunk().fingerprint()
+    assert _small_chunk().fingerprint() != _small_chunk('X').fingerprint()
+    assert _small_chunk().fingerprint() != (_small_chunk() * 2).fingerprint()
+
+
+def test_verify_remembers_verified_chunks(tmp_path, monkeypatch):
+    from hookinj.gen import _verify_cache
+    from hookinj.gen._flow_verifier import FlowStabilizerVerifier
+    calls = []
+    original = FlowStabilizerVerifier.verify
+
+    def counting(chunk):
+        calls.append(chunk)
+        return original(chunk)
+    monkeypatch.setattr(FlowStabilizerVerifier, 'verify', staticmethod(counting))
+    _verify_cache.clear_verified()
+
+    with gen.verification_cache_dir(tmp_path):
+        _small_chunk('X').verify()
+        _small_chunk('X').verify()
+        assert len(calls) == 1
+
+        # Failures aren't remembered.
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                _small_chunk('Z').verify()
+        assert len(calls) == 3
+
+        # Successes are also remembered on disk.
+        _verify_cache.clear_verified()
+        _small_chunk('X').verify()
+        assert len(calls) == 3
+
+    _verify_cache.clear_verified()
+    _small_chunk('X').verify()
+    assert len(calls) == 4
+
+
+
+def test_verified_markers_depend_on_stim_version(tmp_path, monkeypatch):
+    from hookinj.gen import _verify_cache
+    _verify_cache.clear_verified()
+    _verify_cache.verifier_source_hash.cache_clear()
+    with gen.verification_cache_dir(tmp_path):
+        fingerprint = _small_chunk('X').fingerprint()
+        _verify_cache.mark_verified(fingerprint)
+        _verify_cache.clear_verified()
+        assert _verify_cache.is_verified(fingerprint)
+
+        monkeypatch.setattr(stim, '__version__', stim.__version__ + '.other')
+        _verify_cache.verifier_source_hash.cache_clear()
+        _verify_cache.clear_verified()
+        assert not _verify_cache.is_verified(fingerprint)
+    monkeypatch.undo()
+    _verify_cache.verifier_source_hash.cache_clear()
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_verify_chunks_reports_all_failures(jobs):
+    from hookinj.gen import _verify_cache
+    _verify_cache.clear_verified()
+    good = _small_chunk('X')
+    other = gen.Chunk(
+        circuit=stim.Circuit("RX 0"),
+        q2i={1j: 0},
+        flows=[gen.Flow(center=0, end=gen.PauliString({1j: 'X'}))],
+    )
+    gen.verify_chunks([good, good, other], jobs=jobs)
+    assert _verify_cache.is_verified(good.fingerprint())
+
+    with pytest.raises(ValueError, match=r'(?s)2 chunk\(s\) failed.*chunk 1:.*chunk 3:'):
+        gen.verify_chunks([good, _small_chunk('Z'), good, _small_chunk('Z') * 2], jobs=jobs)
+
+    unknown_qubit = gen.Chunk(
+        circuit=stim.Circuit("R 0"),
+        q2i={0: 0},
+        flows=[gen.Flow(center=0, end=gen.PauliString({5: 'Z'}))],
+    )
+    unsupported_gate = gen.Chunk(
+        circuit=stim.Circuit("R 0\nHERALDED_ERASE(0.1) 0"),
+        q2i={0: 0},
+        flows=[gen.Flow(center=0, end=gen.PauliString({0: 'Z'}))],
+    )
+    with pytest.raises(ValueError, match=r'(?s)3 chunk\(s\) failed.*chunk 0: \[fingerprint \w+\] KeyError.*chunk 1:.*chunk 2: \[fingerprint \w+\] NotImplementedError'):
+        gen.verify_chunks(iter([unknown_qubit, _small_chunk('Z'), unsupported_gate]), jobs=jobs)
+
+
+def test_inverted_is_memoized():
+    chunk = _small_chunk('X')
+    inv = chunk.inverted()
+    assert _small_chunk('X').inverted() is inv
+    assert inv.circuit == stim.Circuit("""
+        H 0
+        M 0
+    """)
+    assert inv.flows == (gen.Flow(center=0, start=gen.PauliString({1j: 'X'}), measurement_indices=[0]),)
+
+    with pytest.raises(ValueError):
+        _small_chunk('Z').inverted()
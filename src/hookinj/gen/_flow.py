@@ -1,17 +1,128 @@
-from typing import Iterable, Tuple, Any, Optional, Dict, Callable
+import heapq
+import weakref
+from typing import Iterable, Tuple, Any, Optional, Dict, Callable, List
 
 import stim
 
-from hookinj import gen
 from hookinj.gen._tile import Tile
 from hookinj.gen._util import sorted_complex
 
 
+# Every qubit coordinate used by a live PauliString gets a bit position, so
+# that pauli strings can be stored as a pair of integer bit masks. Positions
+# of coordinates that no live pauli string uses anymore are recycled, so that
+# long running processes don't keep widening the masks.
+_COORD_TO_BIT: Dict[complex, int] = {}
+_BIT_TO_COORD: List[complex] = []
+_FREE_BITS: List[int] = []
+_MIN_COMPACT_AT = 1 << 12
+_compact_at = _MIN_COMPACT_AT
+_INTERNED: 'weakref.WeakValueDictionary[Tuple[int, int], PauliString]' = weakref.WeakValueDictionary()
+_EMPTY_QUBITS: Dict[complex, str] = {}
+
+
+def _coord_bit(q: complex) -> int:
+    b = _COORD_TO_BIT.get(q)
+    if b is None:
+        # Normalized so that the qubits dict doesn't depend on which equal
+        # coordinate (e.g. `2` vs `2+0j`) happened to be seen first.
+        if _FREE_BITS:
+            b = heapq.heappop(_FREE_BITS)
+            _BIT_TO_COORD[b] = complex(q)
+        else:
+            b = len(_BIT_TO_COORD)
+            _BIT_TO_COORD.append(complex(q))
+        _COORD_TO_BIT[q] = b
+    return b
+
+
+def _compact_coord_bits() -> None:
+    """Frees the bit positions of coordinates that no live pauli string uses."""
+    global _compact_at
+    used = 0
+    for p in list(_INTERNED.values()):
+        used |= p._xs | p._zs
+    used_bits = {b for b, c in enumerate(reversed(bin(used)[2:])) if c == '1'}
+    for q, b in list(_COORD_TO_BIT.items()):
+        if b not in used_bits:
+            del _COORD_TO_BIT[q]
+            heapq.heappush(_FREE_BITS, b)
+    _compact_at = max(_MIN_COMPACT_AT, 2 * len(_COORD_TO_BIT))
+
+
+def _coord_text(q: complex) -> str:
+    """Formats a stored (complex) coordinate the way the original number would print, e.g. `2` instead of `(2+0j)`."""
+    if q.imag == 0:
+        r = q.real
+        return str(int(r)) if r.is_integer() else str(r)
+    return str(q)
+
+
 class PauliString:
-    """A qubit-to-pauli mapping."""
-    def __init__(self, qubits: Dict[complex, str]):
-        self.qubits = {q: qubits[q] for q in gen.sorted_complex(qubits.keys())}
-        self._hash = hash(tuple(self.qubits.items()))
+    """A qubit-to-pauli mapping.
+
+    Stored as X and Z bit masks over a process-wide qubit numbering. Equal
+    pauli strings are interned, so building the same one twice returns the
+    same object. Instances are immutable.
+    """
+    __slots__ = ('_xs', '_zs', '_hash', '_qubits', '__weakref__')
+
+    def __new__(cls, qubits: Dict[complex, str]) -> 'PauliString':
+        # Only between pauli strings, so that no bit in use is missed.
+        if len(_COORD_TO_BIT) >= _compact_at and not _FREE_BITS:
+            _compact_coord_bits()
+        xs = 0
+        zs = 0
+        for q, p in qubits.items():
+            m = 1 << _coord_bit(q)
+            if p == 'X':
+                xs |= m
+            elif p == 'Z':
+                zs |= m
+            elif p == 'Y':
+                xs |= m
+                zs |= m
+            else:
+                raise ValueError(f'Not a pauli: {p!r}')
+        return PauliString._from_masks(xs, zs)
+
+    @staticmethod
+    def _from_masks(xs: int, zs: int) -> 'PauliString':
+        key = (xs, zs)
+        result = _INTERNED.get(key)
+        if result is None:
+            result = object.__new__(PauliString)
+            object.__setattr__(result, '_xs', xs)
+            object.__setattr__(result, '_zs', zs)
+            object.__setattr__(result, '_hash', hash(key))
+            object.__setattr__(result, '_qubits', None)
+            _INTERNED[key] = result
+        return result
+
+    def __setattr__(self, key, value):
+        raise AttributeError('PauliString is immutable')
+
+    def __reduce__(self):
+        # Bit positions are specific to each process.
+        return PauliString, (self.qubits,)
+
+    @property
+    def qubits(self) -> Dict[complex, str]:
+        """The qubit-to-pauli dictionary, in sorted qubit order. Don't mutate it."""
+        result = self._qubits
+        if result is None:
+            xs = self._xs
+            zs = self._zs
+            unsorted = {}
+            m = xs | zs
+            while m:
+                low = m & -m
+                b = low.bit_length() - 1
+                unsorted[_BIT_TO_COORD[b]] = 'IXZY'[bool(xs & low) + 2 * bool(zs & low)]
+                m ^= low
+            result = {q: unsorted[q] for q in sorted_complex(unsorted.keys())} if unsorted else _EMPTY_QUBITS
+            object.__setattr__(self, '_qubits', result)
+        return result
 
     @staticmethod
     def from_stim_pauli_string(stim_pauli_string: stim.PauliString) -> 'PauliString':
@@ -22,44 +133,26 @@ class PauliString:
         })
 
     def __bool__(self):
-        return bool(self.qubits)
+        return bool(self._xs or self._zs)
 
     def __mul__(self, other: 'PauliString') -> 'PauliString':
-        result = {}
-        for q in self.qubits.keys() | other.qubits.keys():
-            a = self.qubits.get(q, 'I')
-            b = other.qubits.get(q, 'I')
-            ax = a in 'XY'
-            az = a in 'YZ'
-            bx = b in 'XY'
-            bz = b in 'YZ'
-            cx = ax ^ bx
-            cz = az ^ bz
-            c = 'IXZY'[cx + cz*2]
-            if c != 'I':
-                result[q] = c
-        return PauliString(result)
+        return PauliString._from_masks(self._xs ^ other._xs, self._zs ^ other._zs)
 
     def __repr__(self):
-        return f'PauliString(qubits={self.qubits!r})'
+        qubits = ', '.join(f'{_coord_text(q)}: {p!r}' for q, p in self.qubits.items())
+        return f'PauliString(qubits={{{qubits}}})'
 
     def __str__(self):
         return '*'.join(
-            f'{self.qubits[q]}{q}'
-            for q in sorted_complex(self.qubits.keys())
+            f'{p}{_coord_text(q)}'
+            for q, p in self.qubits.items()
         )
 
-
     def with_xz_flipped(self) -> 'PauliString':
-        return PauliString({
-            q: "Z" if p == 'X' else 'X' if p == 'Z' else p for q, p in self.qubits.items()
-        })
+        return PauliString._from_masks(self._zs, self._xs)
 
     def anticommutes(self, other: 'PauliString') -> bool:
-        t = 0
-        for q in self.qubits.keys() & other.qubits.keys():
-            t += self.qubits[q] != other.qubits[q]
-        return t % 2 == 1
+        return bin((self._xs & other._zs) ^ (self._zs & other._xs)).count('1') % 2 == 1
 
     def with_transformed_coords(self, transform: Callable[[complex], complex]) -> 'PauliString':
         return PauliString({
@@ -80,12 +173,13 @@ class PauliString:
     def __eq__(self, other):
         if not isinstance(other, PauliString):
             return NotImplemented
-        return self.qubits == other.qubits
+        return self is other or (self._xs == other._xs and self._zs == other._zs)
 
 
 class Flow:
     """A rule for how a stabilizer travels into, through, and/or out of a chunk.
     """
+    __slots__ = ('start', 'end', 'measurement_indices', 'obs_index', 'center', 'postselect')
 
     def __init__(self,
                  *,
@@ -99,13 +193,24 @@ class Flow:
                  ):
         if not allow_vacuous:
             assert start or end or measurement_indices, "vacuous flow"
-        self.start = PauliString({}) if start is None else start
-        self.end = PauliString({}) if end is None else end
+        self.start = _EMPTY if start is None else start
+        self.end = _EMPTY if end is None else end
         self.measurement_indices: Tuple[int, ...] = tuple(measurement_indices)
         self.obs_index = obs_index
         self.center = center
         self.postselect = postselect
 
+    def _with(self, **changes: Any) -> 'Flow':
+        """Copies the flow with some fields replaced, skipping re-validation."""
+        result = object.__new__(Flow)
+        result.start = changes.get('start', self.start)
+        result.end = changes.get('end', self.end)
+        result.measurement_indices = changes.get('measurement_indices', self.measurement_indices)
+        result.obs_index = changes.get('obs_index', self.obs_index)
+        result.center = changes.get('center', self.center)
+        result.postselect = changes.get('postselect', self.postselect)
+        return result
+
     def __eq__(self, other):
         if not isinstance(other, Flow):
             return NotImplemented
@@ -119,44 +224,40 @@ class Flow:
     def __repr__(self):
         return f'Flow(start={self.start!r}, end={self.end!r}, measurement_indices={self.measurement_indices!r}, obs_index={self.obs_index!r}, postselect={self.postselect!r})'
 
+    def with_measurement_offset(self, offset: int) -> 'Flow':
+        if not offset:
+            return self
+        return self._with(measurement_indices=tuple(m + offset for m in self.measurement_indices))
+
     def postselected(self) -> 'Flow':
-        return Flow(
-            start=self.start,
-            end=self.end,
-            measurement_indices=self.measurement_indices,
-            obs_index=self.obs_index,
-            center=self.center,
-            postselect=True,
-        )
+        return self._with(postselect=True)
 
     def with_xz_flipped(self) -> 'Flow':
-        return Flow(
+        return self._with(
             start=self.start.with_xz_flipped(),
             end=self.end.with_xz_flipped(),
-            measurement_indices=self.measurement_indices,
-            obs_index=self.obs_index,
-            center=self.center,
-            postselect=self.postselect,
         )
 
     def with_transformed_coords(self, transform: Callable[[complex], complex]) -> 'Flow':
-        return Flow(
+        return self._with(
             start=self.start.with_transformed_coords(transform),
             end=self.end.with_transformed_coords(transform),
-            measurement_indices=self.measurement_indices,
-            obs_index=self.obs_index,
             center=transform(self.center),
-            postselect=self.postselect,
         )
 
     def concat(self, other: 'Flow', other_measure_offset: int) -> 'Flow':
         if other.start != self.end or other.obs_index != self.obs_index:
             raise ValueError('other.start != self.end')
-        return Flow(
-            start=self.start,
+        if other_measure_offset:
+            other_indices = tuple(m + other_measure_offset for m in other.measurement_indices)
+        else:
+            other_indices = other.measurement_indices
+        return self._with(
             end=other.end,
             center=(self.center + other.center) / 2,
-            measurement_indices=self.measurement_indices + tuple(m + other_measure_offset for m in other.measurement_indices),
-            obs_index=self.obs_index,
+            measurement_indices=self.measurement_indices + other_indices,
             postselect=self.postselect or other.postselect,
         )
+
+
+_EMPTY = PauliString({})
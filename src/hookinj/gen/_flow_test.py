@@ -1,3 +1,8 @@
+import gc
+import pickle
+
+import pytest
+
 from hookinj import gen
 
 
@@ -10,3 +15,60 @@ def test_mul():
     c = gen.PauliString({q: p for q, p in enumerate(c) if p != 'I'})
     assert a * b == c
 
+
+
+def test_pauli_string_interned_and_immutable():
+    a = gen.PauliString({1j: 'X', 0: 'Z', 2: 'Y'})
+    b = gen.PauliString({2: 'Y', 0: 'Z', 1j: 'X'})
+    assert a is b
+    assert hash(a) == hash(b)
+    assert list(a.qubits.items()) == [(0, 'Z'), (1j, 'X'), (2, 'Y')]
+    assert str(a) == 'Z0*X1j*Y2'
+    assert repr(a) == "PauliString(qubits={0: 'Z', 1j: 'X', 2: 'Y'})"
+    with pytest.raises(AttributeError):
+        a.qubits = {}
+    with pytest.raises(ValueError):
+        gen.PauliString({0: 'W'})
+    assert pickle.loads(pickle.dumps(a)) is a
+    assert not gen.PauliString({})
+    assert a * a == gen.PauliString({})
+
+
+
+def test_pauli_string_coordinate_bits_are_recycled():
+    from hookinj.gen import _flow
+    kept = gen.PauliString({0.25: 'X', 0.5 + 0.5j: 'Z'})
+    gc.collect()
+    _flow._compact_coord_bits()
+    width = len(_flow._BIT_TO_COORD)
+    for k in range(3 * _flow._MIN_COMPACT_AT):
+        gen.PauliString({1000.5 + k: 'X', 1000.5j + k: 'Z'})
+    gc.collect()
+    _flow._compact_coord_bits()
+    # The transient coordinates were forgotten, and their bits were reused.
+    assert 1000.5 not in _flow._COORD_TO_BIT
+    assert len(_flow._BIT_TO_COORD) <= width + 2 * _flow._MIN_COMPACT_AT
+    assert kept == gen.PauliString({0.25: 'X', 0.5 + 0.5j: 'Z'})
+    assert str(kept) == 'X0.25*Z(0.5+0.5j)'
+
+
+def test_pauli_string_ops():
+    a = gen.PauliString({0: 'X', 1: 'Y', 2: 'Z'})
+    assert a.with_xz_flipped() == gen.PauliString({0: 'Z', 1: 'Y', 2: 'X'})
+    assert a.anticommutes(gen.PauliString({0: 'Z'}))
+    assert not a.anticommutes(gen.PauliString({0: 'Z', 1: 'X'}))
+    assert not a.anticommutes(gen.PauliString({5: 'Z'}))
+    assert a.with_transformed_coords(lambda q: q + 10j) == gen.PauliString({10j: 'X', 1 + 10j: 'Y', 2 + 10j: 'Z'})
+
+
+def test_flow_concat():
+    a = gen.PauliString({0: 'X'})
+    b = gen.PauliString({1: 'Z'})
+    f1 = gen.Flow(start=a, end=b, measurement_indices=[0, 1], center=0)
+    f2 = gen.Flow(start=b, measurement_indices=[2], center=2, postselect=True)
+    assert f1.concat(f2, 10) == gen.Flow(start=a, measurement_indices=[0, 1, 12], center=1, postselect=True)
+    assert f1.with_measurement_offset(3).measurement_indices == (3, 4)
+    assert f1.with_measurement_offset(0) is f1
+    assert f1.postselected().postselect
+    with pytest.raises(ValueError):
+        f2.concat(f1, 0)
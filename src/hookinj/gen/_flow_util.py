@@ -1,4 +1,5 @@
-from typing import Union, List, Tuple, Any, Optional, Dict, Callable, Literal
+import functools
+from typing import Union, List, Tuple, Any, Optional, Dict, Callable, Literal, Iterable, TextIO
 
 import stim
 
@@ -6,6 +7,7 @@ from hookinj.gen._chunk import Chunk
 from hookinj.gen._flow import PauliString, Flow
 from hookinj.gen._builder import MeasurementTracker, Builder, AtLayer
 from hookinj.gen._patch import Patch
+from hookinj.gen import _trace as trace
 from hookinj.gen._util import sorted_complex
 
 
@@ -119,6 +121,37 @@ def standard_surface_code_chunk(
         measure_data_basis: Union[None, str, Dict[complex, str]] = None,
         obs: Optional[PauliString] = None,
 ) -> Chunk:
+    """Makes a chunk that measures every tile of the patch once.
+
+    Results are memoized, so repeated calls with equal arguments return the
+    same Chunk instance. Callers must not mutate the returned chunk.
+    """
+    return _standard_surface_code_chunk_cached(
+        patch,
+        _hashable_basis_arg(init_data_basis),
+        _hashable_basis_arg(measure_data_basis),
+        obs,
+    )
+
+
+def _hashable_basis_arg(basis: Union[None, str, Dict[complex, str]]) -> Union[None, str, Tuple[Tuple[complex, str], ...]]:
+    if isinstance(basis, dict):
+        # Order is preserved because it determines the order of measurements.
+        return tuple(basis.items())
+    return basis
+
+
+@functools.lru_cache(maxsize=256)
+def _standard_surface_code_chunk_cached(
+        patch: Patch,
+        init_data_basis: Union[None, str, Tuple[Tuple[complex, str], ...]],
+        measure_data_basis: Union[None, str, Tuple[Tuple[complex, str], ...]],
+        obs: Optional[PauliString],
+) -> Chunk:
+    if isinstance(init_data_basis, tuple):
+        init_data_basis = dict(init_data_basis)
+    if isinstance(measure_data_basis, tuple):
+        measure_data_basis = dict(measure_data_basis)
     if init_data_basis is None:
         init_data_basis = {}
     elif isinstance(init_data_basis, str):
@@ -219,13 +252,96 @@ def standard_surface_code_chunk(
 
 
 def relabel_circuit_into(*, circuit: stim.Circuit, old_q2i: Dict[complex, int], new_q2i: Dict[complex, int], out: stim.Circuit):
-    i2i = {i: new_q2i[q] for q, i in old_q2i.items()}
-    return reindexed_circuit(
-        circuit=circuit,
-        old2new=i2i,
-        out=out,
-        discard_qubit_coords=True,
-    )
+    i2i = tuple(sorted((i, new_q2i[q]) for q, i in old_q2i.items()))
+    out += _relabeled_circuit_cached(str(circuit), i2i)
+    return out
+
+
+# Kept small because entries hold whole chunk circuits (and their text). A
+# build only compiles a handful of distinct chunks.
+@functools.lru_cache(maxsize=32)
+def _relabeled_circuit_cached(circuit_text: str, i2i: Tuple[Tuple[int, int], ...]) -> stim.Circuit:
+    # Keyed by text, because stim circuits aren't hashable. Producing the text
+    # is far cheaper than relabeling. Callers must not mutate the result.
+    template = _relabel_template(circuit_text, True)
+    return template.relabeled(_lookup_table(dict(i2i)), out=stim.Circuit())
+
+
+@functools.lru_cache(maxsize=32)
+def _relabel_template(circuit_text: str, discard_qubit_coords: bool) -> '_RelabelTemplate':
+    return _RelabelTemplate(stim.Circuit(circuit_text), discard_qubit_coords=discard_qubit_coords)
+
+
+def _lookup_table(old2new: Dict[int, int]) -> List[Optional[int]]:
+    table: List[Optional[int]] = [None] * (max(old2new, default=-1) + 1)
+    for k, v in old2new.items():
+        table[k] = v
+    return table
+
+
+class _RelabelTemplate:
+    """A circuit pre-split into flat lists of qubit indices, for fast relabeling.
+
+    Instructions whose targets are all plain, non-inverted qubits (almost all
+    of them) are relabeled with a single bulk lookup instead of per-target
+    branching.
+    """
+
+    def __init__(self, circuit: stim.Circuit, *, discard_qubit_coords: bool):
+        self.ops: List[Tuple[Any, ...]] = []
+        for inst in circuit:
+            if isinstance(inst, stim.CircuitRepeatBlock):
+                self.ops.append(('repeat', inst.repeat_count, _RelabelTemplate(inst.body_copy(), discard_qubit_coords=False)))
+            elif isinstance(inst, stim.CircuitInstruction):
+                if discard_qubit_coords and inst.name == "QUBIT_COORDS":
+                    continue
+                targets = inst.targets_copy()
+                if all(t.is_qubit_target and not t.is_inverted_result_target for t in targets):
+                    self.ops.append(('qubits', inst.name, [t.value for t in targets], inst.gate_args_copy()))
+                else:
+                    self.ops.append(('mixed', inst.name, targets, inst.gate_args_copy()))
+            else:
+                raise NotImplementedError(f'{inst=}')
+
+    def relabeled(self, table: List[Optional[int]], *, out: stim.Circuit) -> stim.Circuit:
+        for op in self.ops:
+            kind = op[0]
+            if kind == 'qubits':
+                _, name, values, args = op
+                try:
+                    new_values = list(map(table.__getitem__, values))
+                except IndexError as ex:
+                    raise KeyError(max(values)) from ex
+                if None in new_values:
+                    raise KeyError(values[new_values.index(None)])
+                out.append(name, new_values, args)
+            elif kind == 'mixed':
+                _, name, targets, args = op
+                out.append(name, [_relabeled_target(t, table) for t in targets], args)
+            else:
+                _, repeat_count, body = op
+                out.append(stim.CircuitRepeatBlock(
+                    repeat_count=repeat_count,
+                    body=body.relabeled(table, out=stim.Circuit()),
+                ))
+        return out
+
+
+def _relabeled_target(t: stim.GateTarget, table: List[Optional[int]]) -> Union[int, stim.GateTarget]:
+    if t.is_combiner or t.is_measurement_record_target or t.is_sweep_bit_target:
+        return t
+    v = table[t.value] if t.value < len(table) else None
+    if v is None:
+        raise KeyError(t.value)
+    if t.is_qubit_target:
+        return stim.target_inv(v) if t.is_inverted_result_target else v
+    if t.is_x_target:
+        return stim.target_x(v, invert=t.is_inverted_result_target)
+    if t.is_y_target:
+        return stim.target_y(v, invert=t.is_inverted_result_target)
+    if t.is_z_target:
+        return stim.target_z(v, invert=t.is_inverted_result_target)
+    raise NotImplementedError(f'{t=}')
 
 
 def reindexed_circuit(
@@ -237,36 +353,8 @@ def reindexed_circuit(
 ) -> stim.Circuit:
     if out is None:
         out = stim.Circuit()
-    for inst in circuit:
-        if isinstance(inst, stim.CircuitRepeatBlock):
-            out.append(stim.CircuitRepeatBlock(
-                repeat_count=inst.repeat_count,
-                body=reindexed_circuit(
-                    circuit=inst.body_copy(),
-                    old2new=old2new,
-                )
-            ))
-        elif isinstance(inst, stim.CircuitInstruction):
-            if discard_qubit_coords and inst.name == "QUBIT_COORDS":
-                continue
-            targets = []
-            for t in inst.targets_copy():
-                if t.is_qubit_target:
-                    targets.append(old2new[t.value])
-                elif t.is_x_target:
-                    targets.append(stim.target_x(old2new[t.value]))
-                elif t.is_y_target:
-                    targets.append(stim.target_y(old2new[t.value]))
-                elif t.is_z_target:
-                    targets.append(stim.target_z(old2new[t.value]))
-                elif t.is_combiner:
-                    targets.append(t)
-                else:
-                    raise NotImplementedError(f'{inst=}')
-            out.append(inst.name, targets, inst.gate_args_copy())
-        else:
-            raise NotImplementedError(f'{inst=}')
-    return out
+    template = _RelabelTemplate(circuit, discard_qubit_coords=discard_qubit_coords)
+    return template.relabeled(_lookup_table(old2new), out=out)
 
 
 class ChunkCompileState:
@@ -275,6 +363,117 @@ class ChunkCompileState:
         self.measure_offset = measure_offset
 
 
+def _relative_fingerprint(state: ChunkCompileState) -> Any:
+    """A hashable summary of everything about a state that affects compilation.
+
+    Measurement indices are expressed relative to the state's measurement
+    offset, so states that differ only by a shift in time compare equal.
+    Compiling a chunk from two states with equal fingerprints produces
+    identical circuits, and states whose fingerprints are again equal.
+    """
+    offset = state.measure_offset
+    items = []
+    for key, flow in state.open_flows.items():
+        if isinstance(flow, Flow):
+            value = (
+                flow.start,
+                flow.end,
+                flow.obs_index,
+                flow.center,
+                flow.postselect,
+                tuple(m - offset for m in flow.measurement_indices),
+            )
+        else:
+            value = flow
+        items.append((key, value))
+    return frozenset(items)
+
+
+def _shifted_state(state: ChunkCompileState, shift: int) -> ChunkCompileState:
+    """Returns the state moved later in time by the given number of measurements."""
+    if shift == 0:
+        return state
+    open_flows = {}
+    for key, flow in state.open_flows.items():
+        if isinstance(flow, Flow):
+            flow = flow.with_measurement_offset(shift)
+        open_flows[key] = flow
+    return ChunkCompileState(open_flows=open_flows, measure_offset=state.measure_offset + shift)
+
+
+def _compile_repeated_chunk_into_circuit(
+    *,
+    chunk: Chunk,
+    state: ChunkCompileState,
+    include_detectors: bool,
+    ignore_errors: bool,
+    out_circuit: stim.Circuit,
+    q2i: Dict[complex, int],
+    span: trace.Span,
+) -> ChunkCompileState:
+    no_reps = chunk.with_repetitions(1)
+    measurements_per_iteration = chunk.circuit.num_measurements
+    reps = chunk.repetitions
+
+    # Compile iterations until the (time-shifted) state repeats. From then on
+    # the compiled iterations cycle, so they don't need to be compiled again.
+    circuits: List[stim.Circuit] = []
+    states = [state]
+    seen = {_relative_fingerprint(state): 0}
+    cycle_start = None
+    while len(circuits) < reps:
+        circuit = stim.Circuit()
+        state = compile_chunk_into_circuit(
+            chunk=no_reps,
+            state=state,
+            include_detectors=include_detectors,
+            ignore_errors=ignore_errors,
+            out_circuit=circuit,
+            q2i=q2i,
+        )
+        circuits.append(circuit)
+        states.append(state)
+        fingerprint = _relative_fingerprint(state)
+        cycle_start = seen.get(fingerprint)
+        if cycle_start is not None:
+            break
+        seen[fingerprint] = len(circuits)
+    # How many iterations were compiled before the steady state was found.
+    span.args['iterations_compiled'] = len(circuits)
+    trace.count('loop iterations', compiled=len(circuits), reused=reps - len(circuits))
+
+    runs: List[Tuple[stim.Circuit, int]] = [(c, 1) for c in circuits]
+    if cycle_start is not None and len(circuits) < reps:
+        period = len(circuits) - cycle_start
+        cycles, leftover = divmod(reps - cycle_start, period)
+        cycle = circuits[cycle_start:]
+        runs = runs[:cycle_start]
+        if period == 1:
+            runs.append((cycle[0], cycles))
+        else:
+            cycle_circuit = stim.Circuit()
+            for c in cycle:
+                cycle_circuit += c
+            runs.append((cycle_circuit, cycles))
+        runs.extend((c, 1) for c in cycle[:leftover])
+        state = _shifted_state(
+            states[cycle_start + leftover],
+            cycles * period * measurements_per_iteration,
+        )
+
+    # Fuse iterations that happened to be equal.
+    k = 0
+    while k < len(runs):
+        circuit, count = runs[k]
+        k += 1
+        while k < len(runs) and runs[k][0] == circuit:
+            count += runs[k][1]
+            k += 1
+        out_circuit += circuit * count
+
+    return state
+
+
 def compile_chunk_into_circuit(
     *,
     chunk: Chunk,
@@ -287,60 +486,23 @@ def compile_chunk_into_circuit(
     if chunk.repetitions == 0:
         return state
     if chunk.repetitions > 1:
-        no_reps = chunk.with_repetitions(1)
-        circuits = []
-        measure_offset_start_of_loop = state.measure_offset
-        while len(circuits) < chunk.repetitions:
-            fully_in_loop = min([
-                m
-                for flow in state.open_flows.values()
-                if isinstance(flow, Flow)
-                for m in flow.measurement_indices
-            ], default=measure_offset_start_of_loop) >= measure_offset_start_of_loop
-
-            circuits.append(stim.Circuit())
-            state = compile_chunk_into_circuit(
-                chunk=no_reps,
+        with trace.span('compile_chunk_into_circuit.loop', repetitions=chunk.repetitions) as span:
+            return _compile_repeated_chunk_into_circuit(
+                chunk=chunk,
                 state=state,
                 include_detectors=include_detectors,
                 ignore_errors=ignore_errors,
-                out_circuit=circuits[-1],
+                out_circuit=out_circuit,
                 q2i=q2i,
+                span=span,
             )
 
-            if fully_in_loop:
-                # The circuit is guaranteed to repeat now. Don't do each iteration individually.
-                finish_reps = chunk.repetitions - len(circuits) + 1
-                while len(circuits) > 1 and circuits[-1] == circuits[-2]:
-                    finish_reps += 1
-                    circuits.pop()
-                circuits[-1] *= finish_reps
-                break
-
-        # Fuse iterations that happened to be equal.
-        k = 0
-        while k < len(circuits):
-            k2 = k + 1
-            while k2 < len(circuits) and circuits[k2] == circuits[k]:
-                k2 += 1
-            out_circuit += circuits[k] * (k2 - k)
-            k = k2
-
-        return state
-
     prev_flows = dict(state.open_flows)
     next_flows: Dict[Tuple[PauliString, Any], Union[Flow, Literal['discard']]] = {}
     dumped_flows: List[Flow] = []
     if include_detectors:
         for flow in chunk.flows:
-            flow = Flow(
-                center=flow.center,
-                start=flow.start,
-                end=flow.end,
-                obs_index=flow.obs_index,
-                measurement_indices=[m + state.measure_offset for m in flow.measurement_indices],
-                postselect=flow.postselect,
-            )
+            flow = flow.with_measurement_offset(state.measure_offset)
             if flow.start:
                 prev = prev_flows.pop((flow.start, flow.obs_index), None)
                 if prev is None:
@@ -392,6 +554,73 @@ def compile_chunk_into_circuit(
         open_flows=next_flows,
     )
 
+class ChunkCompiler:
+    """Compiles chunks one at a time, streaming the instructions into a sink.
+
+    Only the flows still open between chunks are kept in memory, so very long
+    experiments can be written out with bounded memory. Because the qubit
+    coordinates are declared at the start of the circuit, the qubits have to
+    be known before the first chunk arrives.
+
+    The sink is either a `stim.Circuit`, which is appended to, or a text
+    stream such as an open file, which is written to. Reading back the text
+    gives the same circuit as compiling into a `stim.Circuit`.
+    """
+
+    def __init__(
+            self,
+            *,
+            qubits: Iterable[complex],
+            sink: Union[stim.Circuit, TextIO],
+            include_detectors: bool = True,
+            ignore_errors: bool = False,
+    ):
+        self.q2i = {q: i for i, q in enumerate(sorted_complex(set(qubits)))}
+        self.sink = sink
+        self.include_detectors = include_detectors
+        self.ignore_errors = ignore_errors
+        self.state = ChunkCompileState(open_flows={}, measure_offset=0)
+        header = stim.Circuit()
+        for q, i in self.q2i.items():
+            header.append('QUBIT_COORDS', i, [q.real, q.imag])
+        self._emit(header)
+
+    def _emit(self, circuit: stim.Circuit) -> None:
+        if isinstance(self.sink, stim.Circuit):
+            self.sink += circuit
+        elif len(circuit):
+            self.sink.write(str(circuit))
+            self.sink.write('\n')
+
+    def append(self, chunk: Chunk) -> None:
+        missing = chunk.q2i.keys() - self.q2i.keys()
+        if missing:
+            raise ValueError(f"Chunk uses qubits that weren't declared: {sorted_complex(missing)!r}")
+        if isinstance(self.sink, stim.Circuit):
+            out = self.sink
+        else:
+            out = stim.Circuit()
+        self.state = compile_chunk_into_circuit(
+            chunk=chunk,
+            state=self.state,
+            include_detectors=self.include_detectors,
+            ignore_errors=self.ignore_errors,
+            out_circuit=out,
+            q2i=self.q2i,
+        )
+        if out is not self.sink:
+            self._emit(out)
+
+    def extend(self, chunks: Iterable[Chunk]) -> None:
+        for chunk in chunks:
+            self.append(chunk)
+
+    def finish(self) -> None:
+        """Checks that every flow was terminated by the chunks given so far."""
+        if self.include_detectors and self.state.open_flows and not self.ignore_errors:
+            raise ValueError("Unterminated")
+
+
 def compile_chunks_into_circuit(
         chunks: List[Chunk],
         *,
@@ -401,25 +630,15 @@ def compile_chunks_into_circuit(
     all_qubits = set()
     for c in chunks:
         all_qubits |= c.q2i.keys()
-    q2i = {q: i for i, q in enumerate(sorted_complex(set(all_qubits)))}
     full_circuit = stim.Circuit()
-    for q, i in q2i.items():
-        full_circuit.append('QUBIT_COORDS', i, [q.real, q.imag])
-
-    state = ChunkCompileState(open_flows={}, measure_offset=0)
-    for k, chunk in enumerate(chunks):
-        state = compile_chunk_into_circuit(
-            chunk=chunk,
-            state=state,
-            include_detectors=include_detectors,
-            ignore_errors=ignore_errors,
-            out_circuit=full_circuit,
-            q2i=q2i,
-        )
-    if include_detectors:
-        if state.open_flows:
-            if not ignore_errors:
-                raise ValueError("Unterminated")
+    compiler = ChunkCompiler(
+        qubits=all_qubits,
+        sink=full_circuit,
+        include_detectors=include_detectors,
+        ignore_errors=ignore_errors,
+    )
+    compiler.extend(chunks)
+    compiler.finish()
     return full_circuit
 
 
@@ -1,7 +1,9 @@
+import io
+import pytest
 import stim
 
 from hookinj import gen
-from hookinj.gen._flow_util import reindexed_circuit
+from hookinj.gen._flow_util import reindexed_circuit, relabel_circuit_into, _relabeled_circuit_cached
 
 
 def test_magic_init_for_chunk():
@@ -341,4 +343,176 @@ def test_reindexed_circuit():
             S 103
             MPP X101*Y102*Z103
         }
-    """)
\ No newline at end of file
+    """)
+
+def test_standard_surface_code_chunk_is_memoized():
+    from hookinj.circuits.steps._patches import make_xtop_qubit_patch
+    p = make_xtop_qubit_patch(distance=3)
+    assert make_xtop_qubit_patch(distance=3) is p
+    obs = gen.PauliString({0: 'X', 1j: 'X', 2j: 'X'})
+
+    c1 = gen.standard_surface_code_chunk(p, init_data_basis='X', obs=obs)
+    assert gen.standard_surface_code_chunk(p, init_data_basis='X', obs=obs) is c1
+    assert gen.standard_surface_code_chunk(gen.Patch(p.tiles), init_data_basis='X', obs=obs) is c1
+    assert gen.standard_surface_code_chunk(p, obs=obs) is not c1
+
+    basis = {q: 'X' for q in sorted(p.data_set, key=lambda q: (q.real, q.imag))}
+    c2 = gen.standard_surface_code_chunk(p, measure_data_basis=basis, obs=obs)
+    assert gen.standard_surface_code_chunk(p, measure_data_basis=dict(basis), obs=obs) is c2
+    c2.verify()
+
+
+def test_compile_repeated_chunk_matches_unrolled():
+    from hookinj.circuits.steps._patches import make_xtop_qubit_patch
+    from hookinj.gen import _trace
+    p = make_xtop_qubit_patch(distance=3)
+    obs = gen.PauliString({0: 'X', 1j: 'X', 2j: 'X'})
+    c1 = gen.standard_surface_code_chunk(p, init_data_basis='X', obs=obs)
+    c2 = gen.standard_surface_code_chunk(p, obs=obs)
+    c3 = gen.standard_surface_code_chunk(p, measure_data_basis='X', obs=obs)
+
+    with _trace.tracing() as tracer:
+        folded = gen.compile_chunks_into_circuit([c1, c2 * 1000, c3])
+    unrolled = gen.compile_chunks_into_circuit([c1] + [c2] * 1000 + [c3])
+    assert folded.flattened() == unrolled.flattened()
+    assert len(folded) < 100
+    (loop,) = [e for e in tracer.events if e['name'] == 'compile_chunk_into_circuit.loop']
+    assert loop['args']['iterations_compiled'] <= 3
+    (counter,) = [e for e in tracer.events if e['name'] == 'loop iterations']
+    assert counter['args']['compiled'] + counter['args']['reused'] == 1000
+
+
+def test_compile_repeated_chunk_with_period_2():
+    from hookinj.gen import _trace
+    z0 = gen.PauliString({0: 'Z'})
+    z1 = gen.PauliString({1: 'Z'})
+    q2i = {0: 0, 1: 1}
+    init = gen.Chunk(
+        circuit=stim.Circuit("R 0 1\nTICK"),
+        q2i=q2i,
+        flows=[
+            gen.Flow(center=0, end=z0, postselect=True),
+            gen.Flow(center=0, end=z1),
+        ],
+    )
+    # The postselected flow hops between the qubits, so the state cycles with period 2.
+    swap = gen.Chunk(
+        circuit=stim.Circuit("SWAP 0 1\nTICK"),
+        q2i=q2i,
+        flows=[
+            gen.Flow(center=0, start=z0, end=z1),
+            gen.Flow(center=0, start=z1, end=z0),
+        ],
+    )
+    end = gen.Chunk(
+        circuit=stim.Circuit("M 0 1"),
+        q2i=q2i,
+        flows=[
+            gen.Flow(center=0, start=z0, measurement_indices=[0]),
+            gen.Flow(center=0, start=z1, measurement_indices=[1]),
+        ],
+    )
+    for reps in [2, 3, 4, 7, 100, 101]:
+        with _trace.tracing() as tracer:
+            folded = gen.compile_chunks_into_circuit([init, swap * reps, end])
+        unrolled = gen.compile_chunks_into_circuit([init] + [swap] * reps + [end])
+        assert folded.flattened() == unrolled.flattened()
+        (loop,) = [e for e in tracer.events if e['name'] == 'compile_chunk_into_circuit.loop']
+        assert loop['args']['iterations_compiled'] <= 4
+
+
+def test_shifted_state():
+    from hookinj.gen._flow_util import ChunkCompileState, _shifted_state, _relative_fingerprint
+    flow = gen.Flow(center=0, end=gen.PauliString({0: 'X'}), measurement_indices=[3, 5])
+    key = (flow.end, None)
+    state = ChunkCompileState(open_flows={key: flow, (gen.PauliString({1: 'Z'}), None): 'discard'}, measure_offset=6)
+    shifted = _shifted_state(state, 10)
+    assert shifted.measure_offset == 16
+    assert shifted.open_flows[key].measurement_indices == (13, 15)
+    assert _relative_fingerprint(shifted) == _relative_fingerprint(state)
+    assert _relative_fingerprint(_shifted_state(state, 0)) == _relative_fingerprint(state)
+    assert _relative_fingerprint(ChunkCompileState(open_flows=state.open_flows, measure_offset=7)) != _relative_fingerprint(state)
+
+
+def test_reindexed_circuit_records_and_missing_qubits():
+    c = stim.Circuit("""
+        M 0 1
+        DETECTOR rec[-1] rec[-2]
+        MPP !X0*Z1
+        CX rec[-1] 2
+    """)
+    assert reindexed_circuit(c, old2new={0: 5, 1: 6, 2: 7}) == stim.Circuit("""
+        M 5 6
+        DETECTOR rec[-1] rec[-2]
+        MPP !X5*Z6
+        CX rec[-1] 7
+    """)
+    with pytest.raises(KeyError):
+        reindexed_circuit(c, old2new={0: 5, 1: 6})
+    with pytest.raises(KeyError):
+        reindexed_circuit(stim.Circuit("H 3"), old2new={0: 5, 1: 6})
+
+
+def test_reindexed_circuit_keeps_inverted_targets():
+    assert reindexed_circuit(stim.Circuit("M !0 1"), old2new={0: 3, 1: 4}) == stim.Circuit("M !3 4")
+    assert reindexed_circuit(stim.Circuit("MPP !X0*Z1"), old2new={0: 3, 1: 4}) == stim.Circuit("MPP !X3*Z4")
+    assert reindexed_circuit(stim.Circuit("MR !0\nMX 1"), old2new={0: 3, 1: 4}) == stim.Circuit("MR !3\nMX 4")
+
+
+def test_relabel_circuit_into_is_cached():
+    _relabeled_circuit_cached.cache_clear()
+    c = stim.Circuit("""
+        QUBIT_COORDS(0, 0) 0
+        R 0 1
+        CX 0 1
+    """)
+    out = stim.Circuit("H 9")
+    for _ in range(3):
+        relabel_circuit_into(circuit=c, old_q2i={0: 0, 1j: 1}, new_q2i={0: 4, 1j: 3}, out=out)
+    assert out == stim.Circuit("""
+        H 9
+        R 4 3
+        CX 4 3
+        R 4 3
+        CX 4 3
+        R 4 3
+        CX 4 3
+    """)
+    info = _relabeled_circuit_cached.cache_info()
+    assert info.misses == 1
+    assert info.hits == 2
+
+
+def test_chunk_compiler_streams_text():
+    from hookinj.circuits.steps._patches import make_xtop_qubit_patch
+    p = make_xtop_qubit_patch(distance=3)
+    obs = gen.PauliString({0: 'X', 1j: 'X', 2j: 'X'})
+    c1 = gen.standard_surface_code_chunk(p, init_data_basis='X', obs=obs)
+    c2 = gen.standard_surface_code_chunk(p, obs=obs)
+    c3 = gen.standard_surface_code_chunk(p, measure_data_basis='X', obs=obs)
+    expected = gen.compile_chunks_into_circuit([c1, c2, c2 * 5, c3])
+
+    def chunks():
+        yield c1
+        yield c2
+        yield c2 * 5
+        yield c3
+
+    buf = io.StringIO()
+    compiler = gen.ChunkCompiler(qubits=p.used_set, sink=buf)
+    compiler.extend(chunks())
+    compiler.finish()
+    assert stim.Circuit(buf.getvalue()) == expected
+
+    circuit = stim.Circuit()
+    compiler = gen.ChunkCompiler(qubits=p.used_set, sink=circuit)
+    compiler.append(c1)
+    with pytest.raises(ValueError, match='Unterminated'):
+        compiler.finish()
+    compiler.append(c3)
+    compiler.finish()
+    assert circuit == gen.compile_chunks_into_circuit([c1, c3])
+
+    compiler = gen.ChunkCompiler(qubits=[0, 1], sink=io.StringIO())
+    with pytest.raises(ValueError, match="weren't declared"):
+        compiler.append(c1)
@@ -1,5 +1,5 @@
 import collections
-from typing import Iterable, Tuple, Dict, List, Set, DefaultDict
+from typing import Iterable, Tuple, Dict, List, Set, DefaultDict, Iterator
 
 import numpy as np
 import stim
@@ -54,6 +54,27 @@ REV_DICT = {
 }
 
 
+_SINGLE_QUBIT_RULES = {
+    'H', 'SQRT_Y', 'SQRT_Y_DAG',
+    'S', 'S_DAG', 'H_XY',
+    'SQRT_X', 'SQRT_X_DAG', 'H_YZ',
+    'C_XYZ', 'C_ZYX',
+    'R', 'RX', 'RY',
+    'M', 'MX', 'MY',
+}
+_TWO_QUBIT_RULES = {
+    'XCZ', 'CX', 'CZ', 'CY', 'YCZ', 'XCY', 'YCX',
+    'SWAP', 'ISWAP', 'ISWAP_DAG',
+    'SQRT_ZZ', 'SQRT_ZZ_DAG', 'SQRT_YY', 'SQRT_YY_DAG', 'SQRT_XX', 'SQRT_XX_DAG',
+    'XCX', 'YCY',
+}
+
+
+def _flow_bit(k: int) -> Tuple[int, np.uint64]:
+    """The word index and bit mask of a flow in a packed row."""
+    return k >> 6, np.uint64(1 << (k & 63))
+
+
 class FlowStabilizerVerifier:
     def __init__(self, next_measurement: int, q2i: Dict[complex, int], flows: Iterable[Flow]):
         self.flows: Tuple[Flow, ...] = tuple(flows)
@@ -64,29 +85,47 @@ class FlowStabilizerVerifier:
         self.next_measurement = next_measurement
         self.reset_to_flow_indices: DefaultDict[int, List[int]] = collections.defaultdict(list)
         num_qubits = max(q2i.values()) + 1
-        self.xs = np.zeros(shape=(num_qubits, len(self.flows)), dtype=np.bool8)
-        self.zs = np.zeros(shape=(num_qubits, len(self.flows)), dtype=np.bool8)
+        # Flows are packed 64 to a word, so each row operation acts on 64 flows at once.
+        num_words = (len(self.flows) + 63) // 64
+        self.xs = np.zeros(shape=(num_qubits, num_words), dtype=np.uint64)
+        self.zs = np.zeros(shape=(num_qubits, num_words), dtype=np.uint64)
         for k in range(len(self.flows)):
             flow: Flow = self.flows[k]
             for m in flow.measurement_indices:
                 self.i2m[m].append(k)
+            w, b = _flow_bit(k)
             for q, p in flow.end.qubits.items():
                 assert p == 'X' or p == 'Y' or p == 'Z'
-                self.xs[q2i[q], k] = p == 'X' or p == 'Y'
-                self.zs[q2i[q], k] = p == 'Z' or p == 'Y'
+                if p == 'X' or p == 'Y':
+                    self.xs[q2i[q], w] |= b
+                if p == 'Z' or p == 'Y':
+                    self.zs[q2i[q], w] |= b
+
+    def measurement_row(self, m: int) -> np.ndarray:
+        """A packed row with the bits of the flows that include measurement m."""
+        row = np.zeros(shape=self.xs.shape[1], dtype=np.uint64)
+        for s in self.i2m.get(m, ()):
+            w, b = _flow_bit(s)
+            row[w] |= b
+        return row
+
+    def flows_in(self, row: np.ndarray) -> List[int]:
+        """Lists the indices of the flows whose bits are set in a packed row."""
+        bits = np.unpackbits(np.ascontiguousarray(row, dtype='<u8').view(np.uint8), bitorder='little')
+        return np.flatnonzero(bits[:len(self.flows)]).tolist()
 
     def fail_if(self, mask: np.ndarray, msg: str):
         if np.any(mask):
-            for k in range(len(mask)):
-                if mask[k]:
-                    self.fail(k, msg)
+            for k in self.flows_in(mask):
+                self.fail(k, msg)
 
     def pauli_terms(self, k: int) -> str:
         i2q = {i: q for q, i in self.q2i.items()}
+        w, b = _flow_bit(k)
         terms = []
         for q in range(self.xs.shape[0]):
-            x = self.xs[q, k]
-            z = self.zs[q, k]
+            x = bool(self.xs[q, w] & b)
+            z = bool(self.zs[q, w] & b)
             if x or z:
                 terms.append('_XZY'[x + z*2] + repr(i2q[q]))
         return '*'.join(terms)
@@ -96,14 +135,15 @@ class FlowStabilizerVerifier:
 
     def finish(self):
         for k in range(len(self.flows)):
+            w, b = _flow_bit(k)
             for q, p in self.flows[k].start.qubits.items():
                 assert p == 'X' or p == 'Y' or p == 'Z'
-                self.xs[self.q2i[q], k] ^= p == 'X' or p == 'Y'
-                self.zs[self.q2i[q], k] ^= p == 'Z' or p == 'Y'
+                if p == 'X' or p == 'Y':
+                    self.xs[self.q2i[q], w] ^= b
+                if p == 'Z' or p == 'Y':
+                    self.zs[self.q2i[q], w] ^= b
         if np.any(self.xs) or np.any(self.zs):
-            for k in range(len(self.flows)):
-                if np.any(self.xs[:, k]) or np.any(self.zs[:, k]):
-                    self.fail(k, "Mismatch at start")
+            self.fail_if(np.bitwise_or.reduce(self.xs | self.zs, axis=0), "Mismatch at start")
 
     @staticmethod
     def verify(chunk: 'Chunk') -> 'FlowStabilizerVerifier':
@@ -119,11 +159,18 @@ class FlowStabilizerVerifier:
 
     @staticmethod
     def invert(chunk: 'Chunk') -> Chunk:
-        v = FlowStabilizerVerifier.verify(chunk)
-        measurement_to_flow_indices: DefaultDict[int, List[int]] = collections.defaultdict(list)
-        for k, flow in enumerate(chunk.flows):
-            for m in flow.measurement_indices:
-                measurement_to_flow_indices[m].append(k)
+        """Verifies the chunk and builds its time reversal, in one backwards sweep.
+
+        Each instruction is first applied to the verifier, which decides
+        whether its measurements can become resets (and which flows its
+        resets feed). Then the reversed instruction is emitted.
+        """
+        v = FlowStabilizerVerifier(
+            q2i=chunk.q2i,
+            flows=chunk.flows,
+            next_measurement=chunk.circuit.num_measurements - 1,
+        )
+        measurement_to_flow_indices = v.i2m
 
         header = stim.Circuit()
         rev_circuit = stim.Circuit()
@@ -132,6 +179,7 @@ class FlowStabilizerVerifier:
         new_measure_index = 0
         old_measure_index = chunk.circuit.num_measurements
         for inst in chunk.circuit.flattened()[::-1]:
+            v.rev_apply(inst)
             if inst.name in FLIP_REV_SET:
                 old_targets = inst.targets_copy()
                 new_targets = [
@@ -146,7 +194,7 @@ class FlowStabilizerVerifier:
                 ts = inst.targets_copy()[::-1]
                 rev_circuit.append(inst.name.replace("R", "M"), ts, inst.gate_args_copy())
                 for k in range(len(ts)):
-                    for f in v.reset_to_flow_indices[reset_index]:
+                    for f in v.reset_to_flow_indices.get(reset_index, ()):
                         new_flow_measurements[f].append(new_measure_index)
                     new_measure_index += 1
                     reset_index += 1
@@ -158,7 +206,7 @@ class FlowStabilizerVerifier:
                 else:
                     rev_circuit.append(inst.name, ts, inst.gate_args_copy())
                     for k in range(len(ts)):
-                        for f in measurement_to_flow_indices[old_measure_index]:
+                        for f in measurement_to_flow_indices.get(old_measure_index, ()):
                             new_flow_measurements[f].append(new_measure_index)
                         old_measure_index -= 1
                         new_measure_index += 1
@@ -166,6 +214,7 @@ class FlowStabilizerVerifier:
                 header.append(inst)
             else:
                 raise NotImplementedError(f'{inst=}')
+        v.finish()
 
         return Chunk(
             circuit=header + rev_circuit,
@@ -185,311 +234,61 @@ class FlowStabilizerVerifier:
         )
 
     def rev_apply(self, inst: stim.CircuitInstruction):
-        if inst.name == 'H' or inst.name == 'SQRT_Y' or inst.name == "SQRT_Y_DAG":
-            for t in inst.targets_copy()[::-1]:
+        name = inst.name
+        if name in _SINGLE_QUBIT_RULES or name in _TWO_QUBIT_RULES:
+            arity = 1 if name in _SINGLE_QUBIT_RULES else 2
+            values = []
+            for t in inst.targets_copy():
                 assert t.is_qubit_target
-                q = t.value
-                tmp = self.xs[q].copy()
-                self.xs[q, :] = self.zs[q]
-                self.zs[q, :] = tmp
-        elif inst.name == 'I' or inst.name == 'Z' or inst.name == 'X' or inst.name == 'Y':
+                values.append(t.value)
+            # Targets are applied last-to-first. Each segment has no repeated
+            # qubits, so all of its targets can be updated simultaneously.
+            groups = [values[k:k + arity] for k in range(0, len(values), arity)][::-1]
+            for segment in _disjoint_segments(groups):
+                if arity == 1:
+                    self._rev_apply_single(name, np.array([g[0] for g in segment]))
+                else:
+                    a = np.array([g[0] for g in segment])
+                    b = np.array([g[1] for g in segment])
+                    self._rev_apply_pair(name, a, b)
+        elif name == 'I' or name == 'Z' or name == 'X' or name == 'Y':
             pass
-        elif inst.name == 'S' or inst.name == 'S_DAG' or inst.name == 'H_XY':
-            for t in inst.targets_copy()[::-1]:
-                assert t.is_qubit_target
-                q = t.value
-                self.zs[q, :] ^= self.xs[q]
-        elif inst.name == 'SQRT_X' or inst.name == 'SQRT_X_DAG' or inst.name == 'H_YZ':
-            for t in inst.targets_copy()[::-1]:
-                assert t.is_qubit_target
-                q = t.value
-                self.xs[q, :] ^= self.zs[q]
-        elif inst.name == 'C_XYZ':
-            for t in inst.targets_copy()[::-1]:
-                assert t.is_qubit_target
-                q = t.value
-                self.zs[q, :] ^= self.xs[q]
-                self.xs[q, :] ^= self.zs[q]
-        elif inst.name == 'C_ZYX':
-            for t in inst.targets_copy()[::-1]:
-                assert t.is_qubit_target
-                q = t.value
-                self.xs[q, :] ^= self.zs[q]
-                self.zs[q, :] ^= self.xs[q]
-        elif inst.name == 'RY':
-            for t in inst.targets_copy()[::-1]:
-                assert t.is_qubit_target
-                q = t.value
-                self.fail_if(self.xs[q] ^ self.zs[q], "Anticommuted with RY")
-                for k in range(len(self.flows)):
-                    if self.xs[q, k] and self.zs[q, k]:
-                        self.reset_to_flow_indices[self.reset_index].append(k)
-                self.reset_index += 1
-                self.xs[q, :] = 0
-                self.zs[q, :] = 0
-        elif inst.name == 'RX':
-            for t in inst.targets_copy()[::-1]:
-                assert t.is_qubit_target
-                q = t.value
-                self.fail_if(self.zs[q], "Anticommuted with RX")
-                for k in range(len(self.flows)):
-                    if self.xs[q, k]:
-                        self.reset_to_flow_indices[self.reset_index].append(k)
-                self.reset_index += 1
-                self.xs[q, :] = 0
-        elif inst.name == 'R':
-            for t in inst.targets_copy()[::-1]:
-                assert t.is_qubit_target
-                q = t.value
-                self.fail_if(self.xs[q], "Anticommuted with R")
-                for k in range(len(self.flows)):
-                    if self.zs[q, k]:
-                        self.reset_to_flow_indices[self.reset_index].append(k)
-                self.reset_index += 1
-                self.zs[q, :] = 0
-        elif inst.name == 'M':
-            for t in inst.targets_copy()[::-1]:
-                assert t.is_qubit_target
-                q = t.value
-                m = self.next_measurement
-                self.next_measurement -= 1
-                self.fail_if(self.xs[q], "Anticommuted with M")
-                if not np.any(self.xs[q, :]) and not np.any(self.zs[q, :]):
-                    self.measurement_to_can_be_destructive.add(m)
-                for s in self.i2m[m]:
-                    self.zs[q, s] ^= True
-        elif inst.name == 'MY':
-            for t in inst.targets_copy()[::-1]:
-                assert t.is_qubit_target
-                q = t.value
-                m = self.next_measurement
-                self.next_measurement -= 1
-                self.fail_if(self.xs[q] ^ self.zs[q], "Anticommuted with M")
-                if not np.any(self.xs[q, :]) and not np.any(self.zs[q, :]):
-                    self.measurement_to_can_be_destructive.add(m)
-                for s in self.i2m[m]:
-                    self.xs[q, s] ^= True
-                    self.zs[q, s] ^= True
-        elif inst.name == 'MX':
-            for t in inst.targets_copy()[::-1]:
-                assert t.is_qubit_target
-                q = t.value
-                m = self.next_measurement
-                self.next_measurement -= 1
-                self.fail_if(self.zs[q], "Anticommuted with MX")
-                if not np.any(self.xs[q, :]) and not np.any(self.zs[q, :]):
-                    self.measurement_to_can_be_destructive.add(m)
-                for s in self.i2m[m]:
-                    self.xs[q, s] ^= True
-        elif inst.name == 'XCZ':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                self.xs[q1] ^= self.xs[q2]
-                self.zs[q2] ^= self.zs[q1]
-        elif inst.name == 'CX':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                self.xs[q2] ^= self.xs[q1]
-                self.zs[q1] ^= self.zs[q2]
-        elif inst.name == 'CZ':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                self.zs[q2] ^= self.xs[q1]
-                self.zs[q1] ^= self.xs[q2]
-        elif inst.name == 'CY' or inst.name == 'YCZ':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                if inst.name == 'YCZ':
-                    t1, t2 = t2, t1
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                yt = self.xs[q2] ^ self.zs[q2]
-                self.zs[q1] ^= yt
-                self.zs[q2] ^= self.xs[q1]
-                self.xs[q2] ^= self.xs[q1]
-        elif inst.name == 'ISWAP' or inst.name == 'ISWAP_DAG':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                # swap
-                for bs in [self.xs, self.zs]:
-                    bs[q1] ^= bs[q2]
-                    bs[q2] ^= bs[q1]
-                    bs[q1] ^= bs[q2]
-                # cz
-                self.zs[q2] ^= self.xs[q1]
-                self.zs[q1] ^= self.xs[q2]
-                # s s
-                self.zs[q1, :] ^= self.xs[q1]
-                self.zs[q2, :] ^= self.xs[q2]
-        elif inst.name == 'SQRT_ZZ' or inst.name == 'SQRT_ZZ_DAG':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                # cz
-                self.zs[q2] ^= self.xs[q1]
-                self.zs[q1] ^= self.xs[q2]
-                # s s
-                self.zs[q1, :] ^= self.xs[q1]
-                self.zs[q2, :] ^= self.xs[q2]
-        elif inst.name == 'XCX':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                self.xs[q2] ^= self.zs[q1]
-                self.xs[q1] ^= self.zs[q2]
-        elif inst.name == 'YCY':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                # s s
-                self.zs[q1, :] ^= self.xs[q1]
-                self.zs[q2, :] ^= self.xs[q2]
-                # xcx
-                self.xs[q2] ^= self.zs[q1]
-                self.xs[q1] ^= self.zs[q2]
-                # s s
-                self.zs[q1, :] ^= self.xs[q1]
-                self.zs[q2, :] ^= self.xs[q2]
-        elif inst.name == 'SQRT_YY' or inst.name == 'SQRT_YY_DAG':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                # s s
-                self.zs[q1, :] ^= self.xs[q1]
-                self.zs[q2, :] ^= self.xs[q2]
-                # xcx
-                self.xs[q2] ^= self.zs[q1]
-                self.xs[q1] ^= self.zs[q2]
-                # sqrt_x sqrt_x
-                self.xs[q1, :] ^= self.zs[q1]
-                self.xs[q2, :] ^= self.zs[q2]
-                # s s
-                self.zs[q1, :] ^= self.xs[q1]
-                self.zs[q2, :] ^= self.xs[q2]
-        elif inst.name == 'SQRT_XX' or inst.name == 'SQRT_XX_DAG':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                # xcx
-                self.xs[q2] ^= self.zs[q1]
-                self.xs[q1] ^= self.zs[q2]
-                # sqrt_x sqrt_x
-                self.xs[q1, :] ^= self.zs[q1]
-                self.xs[q2, :] ^= self.zs[q2]
-        elif inst.name == 'SWAP':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                for bs in [self.xs, self.zs]:
-                    bs[q1] ^= bs[q2]
-                    bs[q2] ^= bs[q1]
-                    bs[q1] ^= bs[q2]
-        elif inst.name == 'XCY' or inst.name == 'YCX':
-            ts = inst.targets_copy()
-            for k in range(0, len(ts), 2)[::-1]:
-                t1 = ts[k]
-                t2 = ts[k + 1]
-                if inst.name == 'YCX':
-                    t1, t2 = t2, t1
-                assert t1.is_qubit_target
-                assert t2.is_qubit_target
-                q1 = t1.value
-                q2 = t2.value
-                yt = self.xs[q2] ^ self.zs[q2]
-                self.xs[q1] ^= yt
-                self.zs[q2] ^= self.zs[q1]
-                self.xs[q2] ^= self.zs[q1]
         elif inst.name == 'MPP':
-            targets = inst.targets_copy()[::-1]
-            start = 0
-            while start < len(targets):
-                end = start + 1
-                while end < len(targets) and targets[end].is_combiner:
-                    end += 2
-
-                x_mask = np.zeros(shape=self.xs.shape[0], dtype=np.bool8)
-                z_mask = np.zeros(shape=self.xs.shape[0], dtype=np.bool8)
-                for t in targets[start:end:2]:
+            targets = inst.targets_copy()
+            products: List[Tuple[List[int], List[int]]] = []
+            k = 0
+            while k < len(targets):
+                x_qubits: List[int] = []
+                z_qubits: List[int] = []
+                while True:
+                    t = targets[k]
                     if t.is_x_target:
-                        x_mask[t.value] ^= True
+                        x_qubits.append(t.value)
                     elif t.is_y_target:
-                        x_mask[t.value] ^= True
-                        z_mask[t.value] ^= True
+                        x_qubits.append(t.value)
+                        z_qubits.append(t.value)
                     elif t.is_z_target:
-                        z_mask[t.value] ^= True
+                        z_qubits.append(t.value)
                     else:
                         raise NotImplementedError(f'{inst=}')
+                    k += 1
+                    if k < len(targets) and targets[k].is_combiner:
+                        k += 1
+                    else:
+                        break
+                products.append((_odd_occurrences(x_qubits), _odd_occurrences(z_qubits)))
 
-                for k in range(self.xs.shape[1]):
-                    x_combos = np.sum(np.bitwise_and(self.xs[:, k], z_mask), axis=0)
-                    z_combos = np.sum(np.bitwise_and(self.zs[:, k], x_mask), axis=0)
-                    if np.any((x_combos + z_combos) & 1):
-                        raise ValueError("Anticommuted with MPP")
+            for x_qubits, z_qubits in products[::-1]:
+                # Bit k of the parity is set when flow k anticommutes with the product.
+                anticommuting = np.bitwise_xor.reduce(self.xs[z_qubits], axis=0) ^ np.bitwise_xor.reduce(self.zs[x_qubits], axis=0)
+                if np.any(anticommuting):
+                    raise ValueError("Anticommuted with MPP")
                 m = self.next_measurement
                 self.next_measurement -= 1
-                for s in self.i2m[m]:
-                    self.zs[:, s] ^= z_mask
-                    self.xs[:, s] ^= x_mask
-
-                start = end
+                if m in self.i2m:
+                    flows_row = self.measurement_row(m)
+                    self.zs[z_qubits] ^= flows_row
+                    self.xs[x_qubits] ^= flows_row
 
         elif inst.name == 'TICK':
             pass
@@ -497,3 +296,175 @@ class FlowStabilizerVerifier:
             pass
         else:
             raise NotImplementedError(f'{inst=}')
+
+    def _rev_apply_single(self, name: str, q: np.ndarray):
+        xs = self.xs
+        zs = self.zs
+        if name == 'H' or name == 'SQRT_Y' or name == 'SQRT_Y_DAG':
+            xs[q], zs[q] = zs[q], xs[q]
+        elif name == 'S' or name == 'S_DAG' or name == 'H_XY':
+            zs[q] ^= xs[q]
+        elif name == 'SQRT_X' or name == 'SQRT_X_DAG' or name == 'H_YZ':
+            xs[q] ^= zs[q]
+        elif name == 'C_XYZ':
+            zs[q] ^= xs[q]
+            xs[q] ^= zs[q]
+        elif name == 'C_ZYX':
+            xs[q] ^= zs[q]
+            zs[q] ^= xs[q]
+        elif name == 'R' or name == 'RX' or name == 'RY':
+            if name == 'R':
+                self.fail_if(np.bitwise_or.reduce(xs[q], axis=0), "Anticommuted with R")
+                kept = zs[q]
+            elif name == 'RX':
+                self.fail_if(np.bitwise_or.reduce(zs[q], axis=0), "Anticommuted with RX")
+                kept = xs[q]
+            else:
+                self.fail_if(np.bitwise_or.reduce(xs[q] ^ zs[q], axis=0), "Anticommuted with RY")
+                kept = xs[q] & zs[q]
+            rows, flows = self._flows_in_rows(kept)
+            for j, k in zip(rows, flows):
+                self.reset_to_flow_indices[self.reset_index + j].append(k)
+            self.reset_index += len(q)
+            if name != 'RX':
+                zs[q] = 0
+            if name != 'R':
+                xs[q] = 0
+        elif name == 'M' or name == 'MX' or name == 'MY':
+            if name == 'M':
+                self.fail_if(np.bitwise_or.reduce(xs[q], axis=0), "Anticommuted with M")
+            elif name == 'MX':
+                self.fail_if(np.bitwise_or.reduce(zs[q], axis=0), "Anticommuted with MX")
+            else:
+                self.fail_if(np.bitwise_or.reduce(xs[q] ^ zs[q], axis=0), "Anticommuted with M")
+            ms = self.next_measurement - np.arange(len(q))
+            self.next_measurement -= len(q)
+            untouched = ~np.any(xs[q] | zs[q], axis=1)
+            self.measurement_to_can_be_destructive.update(ms[untouched].tolist())
+
+            update_qubits = []
+            update_flows = []
+            for qubit, m in zip(q.tolist(), ms.tolist()):
+                for s in self.i2m.get(m, ()):
+                    update_qubits.append(qubit)
+                    update_flows.append(s)
+            if update_flows:
+                flows = np.array(update_flows)
+                index = (np.array(update_qubits), flows >> 6)
+                bits = np.left_shift(np.uint64(1), (flows & 63).astype(np.uint64))
+                if name != 'MX':
+                    np.bitwise_xor.at(zs, index, bits)
+                if name != 'M':
+                    np.bitwise_xor.at(xs, index, bits)
+        else:
+            raise NotImplementedError(f'{name=}')
+
+    def _rev_apply_pair(self, name: str, a: np.ndarray, b: np.ndarray):
+        xs = self.xs
+        zs = self.zs
+        if name == 'YCZ' or name == 'YCX':
+            a, b = b, a
+        if name == 'XCZ':
+            xs[a] ^= xs[b]
+            zs[b] ^= zs[a]
+        elif name == 'CX':
+            xs[b] ^= xs[a]
+            zs[a] ^= zs[b]
+        elif name == 'CZ':
+            zs[b] ^= xs[a]
+            zs[a] ^= xs[b]
+        elif name == 'CY' or name == 'YCZ':
+            yt = xs[b] ^ zs[b]
+            zs[a] ^= yt
+            zs[b] ^= xs[a]
+            xs[b] ^= xs[a]
+        elif name == 'XCY' or name == 'YCX':
+            yt = xs[b] ^ zs[b]
+            xs[a] ^= yt
+            zs[b] ^= zs[a]
+            xs[b] ^= zs[a]
+        elif name == 'SWAP':
+            xs[a], xs[b] = xs[b], xs[a]
+            zs[a], zs[b] = zs[b], zs[a]
+        elif name == 'ISWAP' or name == 'ISWAP_DAG':
+            # swap
+            xs[a], xs[b] = xs[b], xs[a]
+            zs[a], zs[b] = zs[b], zs[a]
+            # cz
+            zs[b] ^= xs[a]
+            zs[a] ^= xs[b]
+            # s s
+            zs[a] ^= xs[a]
+            zs[b] ^= xs[b]
+        elif name == 'SQRT_ZZ' or name == 'SQRT_ZZ_DAG':
+            # cz
+            zs[b] ^= xs[a]
+            zs[a] ^= xs[b]
+            # s s
+            zs[a] ^= xs[a]
+            zs[b] ^= xs[b]
+        elif name == 'XCX':
+            xs[b] ^= zs[a]
+            xs[a] ^= zs[b]
+        elif name == 'YCY':
+            # s s
+            zs[a] ^= xs[a]
+            zs[b] ^= xs[b]
+            # xcx
+            xs[b] ^= zs[a]
+            xs[a] ^= zs[b]
+            # s s
+            zs[a] ^= xs[a]
+            zs[b] ^= xs[b]
+        elif name == 'SQRT_YY' or name == 'SQRT_YY_DAG':
+            # s s
+            zs[a] ^= xs[a]
+            zs[b] ^= xs[b]
+            # xcx
+            xs[b] ^= zs[a]
+            xs[a] ^= zs[b]
+            # sqrt_x sqrt_x
+            xs[a] ^= zs[a]
+            xs[b] ^= zs[b]
+            # s s
+            zs[a] ^= xs[a]
+            zs[b] ^= xs[b]
+        elif name == 'SQRT_XX' or name == 'SQRT_XX_DAG':
+            # xcx
+            xs[b] ^= zs[a]
+            xs[a] ^= zs[b]
+            # sqrt_x sqrt_x
+            xs[a] ^= zs[a]
+            xs[b] ^= zs[b]
+        else:
+            raise NotImplementedError(f'{name=}')
+
+    def _flows_in_rows(self, rows: np.ndarray) -> Tuple[List[int], List[int]]:
+        """Lists the (row, flow) positions of the set bits in packed rows."""
+        if not np.any(rows):
+            return [], []
+        bits = np.unpackbits(np.ascontiguousarray(rows, dtype='<u8').view(np.uint8), axis=1, bitorder='little')
+        rows_hit, flows_hit = np.nonzero(bits[:, :len(self.flows)])
+        return rows_hit.tolist(), flows_hit.tolist()
+
+
+def _odd_occurrences(qubits: List[int]) -> List[int]:
+    """The qubits appearing an odd number of times (e.g. X0*X0 cancels)."""
+    if len(set(qubits)) == len(qubits):
+        return qubits
+    return [q for q, n in collections.Counter(qubits).items() if n % 2]
+
+
+def _disjoint_segments(groups: List[List[int]]) -> Iterator[List[List[int]]]:
+    """Splits target groups into consecutive runs that don't share any qubit."""
+    segment: List[List[int]] = []
+    seen: Set[int] = set()
+    for g in groups:
+        if any(q in seen for q in g):
+            yield segment
+            segment = []
+            seen = set()
+        segment.append(g)
+        seen.update(g)
+    if segment:
+        yield segment
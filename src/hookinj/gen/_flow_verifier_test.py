@@ -474,3 +474,94 @@ def test_reset_analysis():
         CX 2 0
         M 4 3 2 1 0
     """)
+
+
+def test_verify_many_flows():
+    n = 150
+    chunk = gen.Chunk(
+        circuit=stim.Circuit(f"""
+            R {' '.join(str(k) for k in range(n))}
+            M {' '.join(str(k) for k in range(n))}
+            MPP {'*'.join(f'Z{k}' for k in range(n))}
+        """),
+        q2i={k: k for k in range(n)},
+        flows=[
+            gen.Flow(center=0, end=gen.PauliString({k: 'Z'}))
+            for k in range(n)
+        ] + [
+            gen.Flow(center=0, measurement_indices=[k])
+            for k in range(n)
+        ] + [
+            gen.Flow(center=0, measurement_indices=[n], end=gen.PauliString({k: 'Z' for k in range(n)})),
+        ],
+    )
+    chunk.verify()
+
+    bad_flows = list(chunk.flows)
+    bad_flows[70] = gen.Flow(center=0, start=gen.PauliString({70: 'X'}), end=gen.PauliString({70: 'Z'}))
+    with pytest.raises(ValueError, match=r'Mismatch at start.*current value X70$'):
+        gen.Chunk(circuit=chunk.circuit, q2i=chunk.q2i, flows=bad_flows).verify()
+
+
+def test_verify_repeated_targets_in_one_instruction():
+    chunk = gen.Chunk(
+        circuit=stim.Circuit("""
+            H 0 0
+            CX 0 1 0 2 1 2
+        """),
+        q2i={0: 0, 1: 1, 2: 2},
+        flows=[
+            gen.Flow(
+                center=0,
+                start=gen.PauliString({0: 'X'}),
+                end=gen.PauliString({0: 'X', 1: 'X'}),
+            ),
+            gen.Flow(
+                center=0,
+                start=gen.PauliString({2: 'Z'}),
+                end=gen.PauliString({0: 'Z', 1: 'Z', 2: 'Z'}),
+            ),
+        ],
+    )
+    chunk.verify()
+
+    chunk = gen.Chunk(
+        circuit=stim.Circuit("""
+            R 0
+            M 0 0
+        """),
+        q2i={0: 0},
+        flows=[
+            gen.Flow(center=0, measurement_indices=[0]),
+            gen.Flow(center=0, measurement_indices=[1]),
+            gen.Flow(center=0, measurement_indices=[0, 1], end=gen.PauliString({0: 'Z'})),
+        ],
+    )
+    chunk.verify()
+
+
+def test_verify_mpp_multiple_products():
+    chunk = gen.Chunk(
+        circuit=stim.Circuit("""
+            MPP X0*X0*Z1 X0*X1 Z0*Z1
+        """),
+        q2i={0: 0, 1: 1},
+        flows=[
+            gen.Flow(center=0, start=gen.PauliString({1: 'Z'}), measurement_indices=[0]),
+            gen.Flow(center=0, end=gen.PauliString({0: 'X', 1: 'X'}), measurement_indices=[1]),
+            gen.Flow(center=0, end=gen.PauliString({0: 'Z', 1: 'Z'}), measurement_indices=[2]),
+        ],
+    )
+    chunk.verify()
+
+    chunk = gen.Chunk(
+        circuit=stim.Circuit("""
+            MPP X0*X1 Z0
+        """),
+        q2i={0: 0, 1: 1},
+        flows=[
+            gen.Flow(center=0, end=gen.PauliString({0: 'X', 1: 'X'}), measurement_indices=[0]),
+        ],
+    )
+    with pytest.raises(ValueError, match='Anticommuted with MPP'):
+        chunk.verify()
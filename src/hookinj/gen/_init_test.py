@@ -0,0 +1,26 @@
+import pathlib
+import subprocess
+import sys
+
+from hookinj import gen
+
+
+def test_lazy_attributes_resolve():
+    for name in gen.__all__:
+        assert getattr(gen, name) is not None
+        assert name in dir(gen)
+
+
+def test_import_does_not_load_heavy_dependencies():
+    # Runs in a fresh interpreter, since this one has already imported everything.
+    code = """
+import sys
+import hookinj.gen as gen
+gen.Patch, gen.Tile, gen.Chunk, gen.Flow, gen.PauliString, gen.Builder, gen.NoiseModel
+gen.standard_surface_code_chunk, gen.compile_chunks_into_circuit
+heavy = ['numpy', 'sinter', 'hookinj.gen._viz_circuit_html', 'hookinj.gen._layer_translate']
+print(','.join(m for m in heavy if m in sys.modules))
+"""
+    src_dir = pathlib.Path(__file__).parent.parent.parent
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=src_dir)
+    assert result.stdout.strip() == ''
@@ -1,12 +1,15 @@
 import collections
 import dataclasses
+import time
 from typing import List, TypeVar, Dict, Type, Optional, cast, Set, Tuple, \
-    Iterable
+    Iterable, Deque, Callable
 
 import numpy as np
-import sinter
 import stim
 
+from hookinj.gen import _trace as trace
+from hookinj.gen._util import group_by, instruction_text
+
 R_XYZ = 0
 R_XZY = 1
 R_YXZ = 2
@@ -45,6 +48,30 @@ ORIENTATION_MULTIPLICATION_TABLE = np.array([
     [4, 5, 1, 0, 3, 2],
     [5, 4, 3, 2, 1, 0],
 ], dtype=np.uint8)
+# Row-major python copy of the table; indexing it avoids creating numpy scalars one rotation at a time.
+_ORIENTATION_PRODUCTS: List[List[int]] = ORIENTATION_MULTIPLICATION_TABLE.tolist()
+
+
+def _append_grouped(out: stim.Circuit, groups: Dict[str, List[Tuple[int, ...]]]) -> None:
+    """Appends one instruction per gate, in sorted gate order, with each gate's target groups sorted."""
+    lines = []
+    for gate in sorted(groups.keys()):
+        if groups[gate]:
+            lines.append(instruction_text(gate, [t for group in sorted(groups[gate]) for t in group]))
+    if lines:
+        out.append_from_stim_program_text('\n'.join(lines))
+
+
+def _append_runs(out: stim.Circuit, gates: List[str], targets: List[int]) -> None:
+    """Appends one instruction per run of consecutive targets sharing a gate, preserving order."""
+    lines = []
+    start = 0
+    for k in range(1, len(gates) + 1):
+        if k == len(gates) or gates[k] != gates[start]:
+            lines.append(instruction_text(gates[start], targets[start:k]))
+            start = k
+    if lines:
+        out.append_from_stim_program_text('\n'.join(lines))
 
 
 class Layer:
@@ -97,7 +124,7 @@ class ShiftCoordAnnotationLayer(Layer):
         return False
 
     def append_into_stim_circuit(self, out: stim.Circuit) -> None:
-        out.append('SHIFT_COORDS', [], self.shift)
+        out.append_from_stim_program_text(instruction_text('SHIFT_COORDS', [], self.shift))
 
     def locally_optimized(self, next_layer: Optional['Layer']) -> List[Optional['Layer']]:
         if isinstance(next_layer, ShiftCoordAnnotationLayer):
@@ -131,8 +158,11 @@ class QubitCoordAnnotationLayer(Layer):
         return False
 
     def append_into_stim_circuit(self, out: stim.Circuit) -> None:
-        for q in sorted(self.coords.keys()):
-            out.append('QUBIT_COORDS', [q], self.coords[q])
+        if self.coords:
+            out.append_from_stim_program_text('\n'.join(
+                instruction_text('QUBIT_COORDS', [q], self.coords[q])
+                for q in sorted(self.coords.keys())
+            ))
 
 
 @dataclasses.dataclass
@@ -173,8 +203,14 @@ class ResetLayer(Layer):
         ]
 
     def append_into_stim_circuit(self, out: stim.Circuit) -> None:
+        if len(set(self.targets)) < len(self.targets):
+            # Resetting a qubit twice; the order matters.
+            _append_runs(out, ['R' + b for b in self.bases], self.targets)
+            return
+        groups = collections.defaultdict(list)
         for t, b in zip(self.targets, self.bases):
-            out.append('R' + b, [t])
+            groups['R' + b].append((t,))
+        _append_grouped(out, groups)
 
     def locally_optimized(self, next_layer: Optional['Layer']) -> List[Optional['Layer']]:
         if isinstance(next_layer, ResetLayer):
@@ -210,8 +246,8 @@ class MeasureLayer(Layer):
         ]
 
     def append_into_stim_circuit(self, out: stim.Circuit) -> None:
-        for t, b in zip(self.targets, self.bases):
-            out.append('M' + b, [t])
+        # Measurement order determines the record indices, so only adjacent measurements are fused.
+        _append_runs(out, ['M' + b for b in self.bases], self.targets)
 
     def locally_optimized(self, next_layer: Optional['Layer']) -> List[Optional['Layer']]:
         if isinstance(next_layer, MeasureLayer) and set(self.targets).isdisjoint(next_layer.targets):
@@ -260,7 +296,7 @@ class MppLayer(Layer):
                 flat_targets.append(t)
                 flat_targets.append(stim.target_combiner())
             flat_targets.pop()
-        out.append('MPP', flat_targets)
+        out.append_from_stim_program_text(instruction_text('MPP', flat_targets))
 
 
 @dataclasses.dataclass
@@ -311,9 +347,7 @@ class InteractLayer(Layer):
             if gate in ['XCX', 'YCY', 'ZCZ']:
                 t1, t2 = sorted([t1, t2])
             groups[gate].append((t1, t2))
-        for gate in sorted(groups.keys()):
-            for pair in sorted(groups[gate]):
-                out.append(gate, pair)
+        _append_grouped(out, groups)
 
     def locally_optimized(self, next_layer: Optional['Layer']) -> List[Optional['Layer']]:
         if isinstance(next_layer, SwapLayer):
@@ -351,8 +385,15 @@ class FeedbackLayer(Layer):
         )
 
     def append_into_stim_circuit(self, out: stim.Circuit) -> None:
+        # Classically controlled Paulis commute, so they can be grouped by gate.
+        groups = collections.defaultdict(list)
         for c, t, b in zip(self.controls, self.targets, self.bases):
-            out.append('C' + b, [c, t])
+            groups['C' + b].extend([c, t])
+        if groups:
+            out.append_from_stim_program_text('\n'.join(
+                instruction_text(gate, groups[gate])
+                for gate in sorted(groups.keys())
+            ))
 
 
 @dataclasses.dataclass
@@ -402,18 +443,21 @@ class RotationLayer(Layer):
         return RotationLayer(rotations={q: R_YZX if r == R_ZXY else R_ZXY if r == R_YZX else r for q, r in self.rotations.items()})
 
     def append_into_stim_circuit(self, out: stim.Circuit) -> None:
-        v = sinter.group_by(self.rotations.items(), key=lambda e: e[1])
+        v = group_by(self.rotations.items(), key=lambda e: e[1])
+        lines = []
         for r, items in sorted(v.items(), key=lambda e: ORIENTATIONS[e[0]]):
             if r:
-                out.append(ORIENTATIONS[r], sorted(q for q, _ in items))
+                lines.append(instruction_text(ORIENTATIONS[r], sorted(q for q, _ in items)))
+        if lines:
+            out.append_from_stim_program_text('\n'.join(lines))
 
     def prepend_rotation(self, rotation_index: int, target: int):
-        r1 = self.rotations.setdefault(target, R_XYZ)
-        self.rotations[target] = ORIENTATION_MULTIPLICATION_TABLE[r1][rotation_index]
+        r1 = self.rotations.get(target, R_XYZ)
+        self.rotations[target] = _ORIENTATION_PRODUCTS[r1][rotation_index]
 
     def append_rotation(self, rotation_index: int, target: int):
-        r1 = self.rotations.setdefault(target, R_XYZ)
-        self.rotations[target] = ORIENTATION_MULTIPLICATION_TABLE[rotation_index][r1]
+        r1 = self.rotations.get(target, R_XYZ)
+        self.rotations[target] = _ORIENTATION_PRODUCTS[rotation_index][r1]
 
     def is_vacuous(self) -> bool:
         return not any(self.rotations.values())
@@ -487,9 +531,7 @@ class SqrtPPLayer(Layer):
             if q2 < q1:
                 q1, q2 = q2, q1
             groups[gate].append((q1, q2))
-        for gate in sorted(groups.keys()):
-            for pair in sorted(groups[gate]):
-                out.append(gate, pair)
+        _append_grouped(out, groups)
 
 
 @dataclasses.dataclass
@@ -510,8 +552,7 @@ class SwapLayer(Layer):
             t2 = self.targets2[k]
             t1, t2 = sorted([t1, t2])
             pairs.append((t1, t2))
-        for pair in sorted(pairs):
-            out.append("SWAP", pair)
+        _append_grouped(out, {'SWAP': pairs})
 
     def locally_optimized(self, next_layer: Optional['Layer']) -> List[Optional['Layer']]:
         if isinstance(next_layer, InteractLayer):
@@ -539,8 +580,7 @@ class ISwapLayer(Layer):
             t2 = self.targets2[k]
             t1, t2 = sorted([t1, t2])
             pairs.append((t1, t2))
-        for pair in sorted(pairs):
-            out.append("ISWAP", pair)
+        _append_grouped(out, {'ISWAP': pairs})
 
     def locally_optimized(self, next_layer: Optional['Layer']) -> List[Optional['Layer']]:
         return [self, next_layer]
@@ -559,7 +599,7 @@ class InteractSwapLayer(Layer):
 
     def append_into_stim_circuit(self, out: stim.Circuit) -> None:
         self.i_layer.append_into_stim_circuit(out)
-        out.append('TICK')
+        out.append_from_stim_program_text('TICK')
         self.swap_layer.append_into_stim_circuit(out)
 
     def to_z_basis(self) -> List['Layer']:
@@ -631,15 +671,17 @@ class LayerCircuit:
 
     def _feed_reset(self, basis: str, targets: List[stim.GateTarget]):
         layer = self._feed(ResetLayer)
-        for t in targets:
-            layer.bases.append(basis)
-            layer.targets.append(t.value)
+        layer.bases.extend([basis] * len(targets))
+        layer.targets.extend([t.value for t in targets])
 
     def _feed_m(self, basis: str, targets: List[stim.GateTarget]):
         layer = self._feed(MeasureLayer)
-        for t in targets:
-            layer.bases.append(basis)
-            layer.targets.append(t.value)
+        layer.bases.extend([basis] * len(targets))
+        layer.targets.extend([t.value for t in targets])
+
+    def _feed_mr(self, basis: str, targets: List[stim.GateTarget]):
+        self._feed_m(basis, targets)
+        self._feed_reset(basis, targets)
 
     def _feed_mpp(self, targets: List[stim.GateTarget]):
         layer = self._feed(MppLayer)
@@ -665,31 +707,33 @@ class LayerCircuit:
         self._feed(ShiftCoordAnnotationLayer).offset_by(gate_args)
 
     def _feed_rotate(self, rotation: int, targets: List[stim.GateTarget]):
-        layer = self._feed(RotationLayer)
+        rotations = self._feed(RotationLayer).rotations
+        products = _ORIENTATION_PRODUCTS[rotation]
         for t in targets:
-            layer.append_rotation(rotation, t.value)
+            q = t.value
+            rotations[q] = products[rotations.get(q, R_XYZ)]
 
     def _feed_swap(self, targets: List[stim.GateTarget]):
         layer = self._feed(SwapLayer)
-        for k in range(0, len(targets), 2):
-            layer.targets1.append(targets[k].value)
-            layer.targets2.append(targets[k + 1].value)
+        values = [t.value for t in targets]
+        layer.targets1.extend(values[0::2])
+        layer.targets2.extend(values[1::2])
 
     def _feed_iswap(self, targets: List[stim.GateTarget]):
         layer = self._feed(ISwapLayer)
-        for k in range(0, len(targets), 2):
-            layer.targets1.append(targets[k].value)
-            layer.targets2.append(targets[k + 1].value)
+        values = [t.value for t in targets]
+        layer.targets1.extend(values[0::2])
+        layer.targets2.extend(values[1::2])
 
     def _feed_sqrt_pp(self, basis: str, targets: List[stim.GateTarget]):
         layer = self._feed(SqrtPPLayer)
-        for k in range(0, len(targets), 2):
-            layer.targets1.append(targets[k].value)
-            layer.targets2.append(targets[k + 1].value)
-            layer.bases.append(basis)
+        values = [t.value for t in targets]
+        layer.targets1.extend(values[0::2])
+        layer.targets2.extend(values[1::2])
+        layer.bases.extend([basis] * (len(values) // 2))
 
     def _feed_c(self, basis1: str, basis2: str, targets: List[stim.GateTarget]):
-        is_feedback = any(t.is_sweep_bit_target or t.is_measurement_record_target for t in targets)
+        is_feedback = not all(t.is_qubit_target for t in targets)
         if is_feedback:
             layer = self._feed(FeedbackLayer)
             for k in range(0, len(targets), 2):
@@ -704,103 +748,41 @@ class LayerCircuit:
                 layer.targets.append(t.value)
         else:
             layer = self._feed(InteractLayer)
-            for k in range(0, len(targets), 2):
-                layer.bases1.append(basis1)
-                layer.bases2.append(basis2)
-                layer.targets1.append(targets[k].value)
-                layer.targets2.append(targets[k + 1].value)
+            values = [t.value for t in targets]
+            layer.bases1.extend([basis1] * (len(values) // 2))
+            layer.bases2.extend([basis2] * (len(values) // 2))
+            layer.targets1.extend(values[0::2])
+            layer.targets2.extend(values[1::2])
 
     @staticmethod
     def from_stim_circuit(circuit: stim.Circuit) -> 'LayerCircuit':
         result = LayerCircuit()
-        for instruction in circuit:
+        annotations_start = None
+        for k, instruction in enumerate(circuit):
             if isinstance(instruction, stim.CircuitRepeatBlock):
+                name = None
+            else:
+                name = instruction.name
+                if name == 'DETECTOR' or name == 'OBSERVABLE_INCLUDE':
+                    # Runs of annotations are copied as one circuit slice, instead of one instruction at a time.
+                    if annotations_start is None:
+                        annotations_start = k
+                    continue
+            if annotations_start is not None:
+                result._feed(DetObsAnnotationLayer).circuit += circuit[annotations_start:k]
+                annotations_start = None
+
+            if name is None:
                 result.layers.append(LoopLayer(
                     body=LayerCircuit.from_stim_circuit(instruction.body_copy()),
                     repetitions=instruction.repeat_count))
-
-            elif instruction.name == 'R':
-                result._feed_reset('Z', instruction.targets_copy())
-            elif instruction.name == 'RX':
-                result._feed_reset('X', instruction.targets_copy())
-            elif instruction.name == 'RY':
-                result._feed_reset('Y', instruction.targets_copy())
-
-            elif instruction.name == 'M':
-                result._feed_m('Z', instruction.targets_copy())
-            elif instruction.name == 'MX':
-                result._feed_m('X', instruction.targets_copy())
-            elif instruction.name == 'MY':
-                result._feed_m('Y', instruction.targets_copy())
-
-            elif instruction.name == 'MR':
-                result._feed_m('Z', instruction.targets_copy())
-                result._feed_reset('Z', instruction.targets_copy())
-            elif instruction.name == 'MRX':
-                result._feed_m('X', instruction.targets_copy())
-                result._feed_reset('X', instruction.targets_copy())
-            elif instruction.name == 'MRY':
-                result._feed_m('Y', instruction.targets_copy())
-                result._feed_reset('Y', instruction.targets_copy())
-
-            elif instruction.name == 'XCX':
-                result._feed_c('X', 'X', instruction.targets_copy())
-            elif instruction.name == 'XCY':
-                result._feed_c('X', 'Y', instruction.targets_copy())
-            elif instruction.name == 'XCZ':
-                result._feed_c('X', 'Z', instruction.targets_copy())
-            elif instruction.name == 'YCX':
-                result._feed_c('Y', 'X', instruction.targets_copy())
-            elif instruction.name == 'YCY':
-                result._feed_c('Y', 'Y', instruction.targets_copy())
-            elif instruction.name == 'YCZ':
-                result._feed_c('Y', 'Z', instruction.targets_copy())
-            elif instruction.name == 'CX':
-                result._feed_c('Z', 'X', instruction.targets_copy())
-            elif instruction.name == 'CY':
-                result._feed_c('Z', 'Y', instruction.targets_copy())
-            elif instruction.name == 'CZ':
-                result._feed_c('Z', 'Z', instruction.targets_copy())
-
-            elif instruction.name in ['H', 'SQRT_Y', 'SQRT_Y_DAG']:
-                result._feed_rotate(R_ZYX, instruction.targets_copy())
-            elif instruction.name in ['H_XY', 'S', 'S_DAG']:
-                result._feed_rotate(R_YXZ, instruction.targets_copy())
-            elif instruction.name in ['H_YZ', 'SQRT_X', 'SQRT_X_DAG']:
-                result._feed_rotate(R_XZY, instruction.targets_copy())
-            elif instruction.name == 'C_XYZ':
-                result._feed_rotate(R_YZX, instruction.targets_copy())
-            elif instruction.name == 'C_ZYX':
-                result._feed_rotate(R_ZXY, instruction.targets_copy())
-            elif instruction.name in ['I', 'X', 'Y', 'Z']:
-                result._feed_rotate(R_XYZ, instruction.targets_copy())
-
-            elif instruction.name == 'QUBIT_COORDS':
-                result._feed_qubit_coords(instruction.targets_copy(), instruction.gate_args_copy())
-            elif instruction.name == 'SHIFT_COORDS':
-                result._feed_shift_coords(instruction.gate_args_copy())
-            elif instruction.name in ['DETECTOR', 'OBSERVABLE_INCLUDE']:
-                result._feed(DetObsAnnotationLayer).circuit.append(instruction)
-
-            elif instruction.name in ['ISWAP', 'ISWAP_DAG']:
-                result._feed_iswap(instruction.targets_copy())
-            elif instruction.name == 'MPP':
-                result._feed_mpp(instruction.targets_copy())
-            elif instruction.name == 'SWAP':
-                result._feed_swap(instruction.targets_copy())
-
-            elif instruction.name == 'TICK':
-                result.layers.append(EmptyLayer())
-
-            elif instruction.name == 'SQRT_XX' or instruction.name == 'SQRT_XX_DAG':
-                result._feed_sqrt_pp('X', instruction.targets_copy())
-            elif instruction.name == 'SQRT_YY' or instruction.name == 'SQRT_YY_DAG':
-                result._feed_sqrt_pp('Y', instruction.targets_copy())
-            elif instruction.name == 'SQRT_ZZ' or instruction.name == 'SQRT_ZZ_DAG':
-                result._feed_sqrt_pp('Z', instruction.targets_copy())
-
-            else:
+                continue
+            feed = _INSTRUCTION_FEEDERS.get(name)
+            if feed is None:
                 raise NotImplementedError(f'{instruction=}')
+            feed(result, instruction)
+        if annotations_start is not None:
+            result._feed(DetObsAnnotationLayer).circuit += circuit[annotations_start:]
         return result
 
     def __repr__(self) -> str:
@@ -865,36 +847,31 @@ class LayerCircuit:
         return set()
 
     def with_rotations_before_resets_removed(self, loop_boundary_resets: Optional[Set[int]] = None) -> 'LayerCircuit':
+        result = self.copy()
+        result._remove_rotations_before_resets(set() if loop_boundary_resets is None else loop_boundary_resets)
+        return result
+
+    def _remove_rotations_before_resets(self, loop_boundary_resets: Set[int]) -> None:
         all_touched = self.touched()
-        if loop_boundary_resets is None:
-            loop_boundary_resets = set()
         sets = [layer.touched() for layer in self.layers]
         sets.append(all_touched)
         resets = [self._resets_at_layer(k, end_resets=all_touched) for k in range(len(self.layers))]
-        if loop_boundary_resets is None:
-            resets.append(all_touched)
-        else:
-            resets.append(loop_boundary_resets & (set() if len(resets) == 0 else resets[0]))
-        new_layers = [layer.copy() for layer in self.layers]
-
-        for k, layer in enumerate(new_layers):
+        resets.append(loop_boundary_resets & (set() if len(resets) == 0 else resets[0]))
+        # Sweep backwards, tracking the next layer touching each qubit.
+        next_touch: Dict[int, int] = {}
+        end = len(self.layers)
+        for k in range(end - 1, -1, -1):
+            layer = self.layers[k]
             if isinstance(layer, LoopLayer):
-                layer.body = layer.body.with_rotations_before_resets_removed(loop_boundary_resets=self._resets_at_layer(k + 1, end_resets=all_touched))
+                layer.body._remove_rotations_before_resets(loop_boundary_resets=resets[k + 1] if k + 1 < end else all_touched)
             elif isinstance(layer, RotationLayer):
-                drops = []
-                for q, r in layer.rotations.items():
-                    if r:
-                        k2 = k + 1
-                        while k2 < len(sets):
-                            if q in sets[k2]:
-                                if q in resets[k2]:
-                                    drops.append(q)
-                                break
-                            k2 += 1
+                drops = [q for q, r in layer.rotations.items() if r and q in resets[next_touch.get(q, end)]]
                 for q in drops:
                     del layer.rotations[q]
+            for q in sets[k]:
+                next_touch[q] = k
 
-        return LayerCircuit([layer for layer in new_layers if not layer.is_vacuous()])
+        self.layers = [layer for layer in self.layers if not layer.is_vacuous()]
 
 
     def with_clearable_rotation_layers_cleared(self) -> 'LayerCircuit':
@@ -903,34 +880,68 @@ class LayerCircuit:
         Each individual rotation can move through intermediate non-rotation layers as long as those
         layers don't touch the qubit being rotated.
         """
+        result = self.copy()
+        result._clear_clearable_rotation_layers()
+        return result
+
+    def _clear_clearable_rotation_layers(self) -> None:
         sets = [layer.touched() for layer in self.layers]
-        def scan(qubit: int, start_layer: int, delta: int) -> Optional[int]:
-            while True:
-                start_layer += delta
-                if start_layer < 0 or start_layer >= len(sets):
-                    return None
-                if isinstance(new_layers[start_layer], RotationLayer) and not new_layers[start_layer].is_vacuous():
-                    return start_layer
-                if qubit in sets[start_layer]:
-                    return None
-
-        new_layers = [layer.copy() for layer in self.layers]
-        cur_layer_index = 0
-        while cur_layer_index < len(new_layers):
-            layer = new_layers[cur_layer_index]
+        new_layers = self.layers
+
+        # Per-qubit indices of the layers touching the qubit, split at the current layer. Behind it: every layer
+        # (kept as a stack, since only the nearest rotation layer still changes). Ahead of it: only the
+        # non-rotation layers, whose touched sets never change.
+        touched_before: Dict[int, List[int]] = collections.defaultdict(list)
+        fixed_after: Dict[int, Deque[int]] = collections.defaultdict(collections.deque)
+        rotations_before: List[int] = []
+        rotations_after: Deque[int] = collections.deque()
+        cleared_after: Set[int] = set()
+        for k, layer in enumerate(new_layers):
+            if isinstance(layer, RotationLayer):
+                if not layer.is_vacuous():
+                    rotations_after.append(k)
+            else:
+                for q in sets[k]:
+                    fixed_after[q].append(k)
+
+        def scan_back(qubit: int) -> Optional[int]:
+            if not rotations_before:
+                return None
+            rot = rotations_before[-1]
+            touches = touched_before.get(qubit)
+            if touches and touches[-1] > rot:
+                return None
+            return rot
+
+        def scan_ahead(qubit: int, start_layer: int) -> Optional[int]:
+            while rotations_after and (rotations_after[0] <= start_layer or rotations_after[0] in cleared_after):
+                rotations_after.popleft()
+            if not rotations_after:
+                return None
+            rot = rotations_after[0]
+            touches = fixed_after.get(qubit)
+            while touches and touches[0] <= start_layer:
+                touches.popleft()
+            if touches and touches[0] < rot:
+                return None
+            return rot
+
+        for cur_layer_index, layer in enumerate(new_layers):
             if isinstance(layer, RotationLayer):
                 rewrites = {}
                 for q, r in layer.rotations.items():
                     if not r:
                         continue
-                    new_layer_index = scan(q, cur_layer_index, -1)
+                    new_layer_index = scan_back(q)
                     if new_layer_index is None:
-                        new_layer_index = scan(q, cur_layer_index, +1)
+                        new_layer_index = scan_ahead(q, cur_layer_index)
                     if new_layer_index is not None:
                         rewrites[q] = new_layer_index
                     else:
+                        rotations_before.append(cur_layer_index)
                         break
                 else:
+                    cancelled_into = set()
                     for q, r in layer.rotations.items():
                         if not r:
                             continue
@@ -941,15 +952,27 @@ class LayerCircuit:
                         else:
                             new_layer.append_rotation(r, q)
                         if new_layer.rotations.get(q):
+                            if new_layer_index < cur_layer_index and q not in sets[new_layer_index]:
+                                touched_before[q].append(new_layer_index)
                             sets[new_layer_index].add(q)
                         elif q in sets[new_layer_index]:
                             sets[new_layer_index].remove(q)
+                            if new_layer_index < cur_layer_index:
+                                touched_before[q].pop()
+                            cancelled_into.add(new_layer_index)
+                    for k in cancelled_into:
+                        if new_layers[k].is_vacuous():
+                            if k < cur_layer_index:
+                                rotations_before.pop()
+                            else:
+                                cleared_after.add(k)
                     layer.rotations.clear()
                     sets[cur_layer_index].clear()
             elif isinstance(layer, LoopLayer):
-                layer.body = layer.body.with_clearable_rotation_layers_cleared()
-            cur_layer_index += 1
-        return LayerCircuit([layer for layer in new_layers if not layer.is_vacuous()])
+                layer.body._clear_clearable_rotation_layers()
+            for q in sets[cur_layer_index]:
+                touched_before[q].append(cur_layer_index)
+        self.layers = [layer for layer in new_layers if not layer.is_vacuous()]
 
     def with_rotations_rolled_from_end_of_loop_to_start_of_loop(self) -> 'LayerCircuit':
         """Rewrites loops so that they only have rotations at the start, not the end.
@@ -1014,42 +1037,38 @@ class LayerCircuit:
         return LayerCircuit([layer for layer in new_layers if not layer.is_vacuous()])
 
     def with_rotations_merged_earlier(self) -> 'LayerCircuit':
+        result = self.copy()
+        result._merge_rotations_earlier()
+        return result
+
+    def _merge_rotations_earlier(self) -> None:
         sets = [layer.touched() for layer in self.layers]
-        def scan(qubit: int, start_layer: int) -> Optional[int]:
-            while True:
-                start_layer -= 1
-                if start_layer < 0:
-                    return None
-                l = new_layers[start_layer]
-                if isinstance(l, RotationLayer) and qubit in l.rotations:
-                    return start_layer
-                if qubit in sets[start_layer]:
-                    return None
-
-        new_layers = [layer.copy() for layer in self.layers]
-        cur_layer_index = 0
-        while cur_layer_index < len(new_layers):
-            layer = new_layers[cur_layer_index]
+        new_layers = self.layers
+
+        # The last layer seen so far that touches each qubit or has an entry for it.
+        last_stop: Dict[int, int] = {}
+        for cur_layer_index, layer in enumerate(new_layers):
             if isinstance(layer, RotationLayer):
                 rewrites = {}
                 for q, r in layer.rotations.items():
                     if not r:
                         continue
-                    v = scan(q, cur_layer_index)
+                    v = last_stop.get(q)
                     if v is not None:
-                        rewrites[q] = v
+                        prev_layer = new_layers[v]
+                        if isinstance(prev_layer, RotationLayer) and q in prev_layer.rotations:
+                            rewrites[q] = v
                 for q, dst in rewrites.items():
                     new_layer: RotationLayer = cast(RotationLayer, new_layers[dst])
                     new_layer.append_rotation(layer.rotations.pop(q), q)
-                    sets[cur_layer_index].remove(q)
-                    if new_layer.rotations.get(q):
-                        sets[dst].add(q)
-                    elif q in sets[dst]:
-                        sets[dst].remove(q)
-            elif isinstance(layer, LoopLayer):
-                layer.body = layer.body.with_rotations_merged_earlier()
-            cur_layer_index += 1
-        return LayerCircuit([layer for layer in new_layers if not layer.is_vacuous()])
+                stops = layer.rotations.keys()
+            else:
+                if isinstance(layer, LoopLayer):
+                    layer.body._merge_rotations_earlier()
+                stops = sets[cur_layer_index]
+            for q in stops:
+                last_stop[q] = cur_layer_index
+        self.layers = [layer for layer in new_layers if not layer.is_vacuous()]
 
     def with_irrelevant_tail_layers_removed(self) -> 'LayerCircuit':
         irrelevant_layer_types_at_end = (
@@ -1072,22 +1091,195 @@ class LayerCircuit:
         tick_coming = False
         for layer in self.layers:
             if tick_coming and layer.requires_tick_before():
-                circuit.append('TICK')
+                circuit.append_from_stim_program_text('TICK')
                 tick_coming = False
             layer.append_into_stim_circuit(circuit)
             tick_coming |= layer.implies_eventual_tick_after()
         return circuit
 
 
-def to_z_basis_interaction_circuit(circuit: stim.Circuit) -> stim.Circuit:
-    c = LayerCircuit.from_stim_circuit(circuit)
-    c = c.with_qubit_coords_at_start()
-    c = c.with_locally_optimized_layers()
-    c = c.to_z_basis()
-    c = c.with_rotations_rolled_from_end_of_loop_to_start_of_loop()
-    c = c.with_locally_optimized_layers()
-    c = c.with_clearable_rotation_layers_cleared()
-    c = c.with_rotations_merged_earlier()
-    c = c.with_rotations_before_resets_removed()
-    c = c.with_irrelevant_tail_layers_removed()
-    return c.to_stim_circuit()
+def _rotation_feeder(rotation: int) -> Callable[[LayerCircuit, stim.CircuitInstruction], None]:
+    return lambda c, instruction: c._feed_rotate(rotation, instruction.targets_copy())
+
+
+def _c_feeder(basis1: str, basis2: str) -> Callable[[LayerCircuit, stim.CircuitInstruction], None]:
+    return lambda c, instruction: c._feed_c(basis1, basis2, instruction.targets_copy())
+
+
+# How `LayerCircuit.from_stim_circuit` handles each gate (except annotations and loops).
+_INSTRUCTION_FEEDERS: Dict[str, Callable[[LayerCircuit, stim.CircuitInstruction], None]] = {
+    'R': lambda c, instruction: c._feed_reset('Z', instruction.targets_copy()),
+    'RX': lambda c, instruction: c._feed_reset('X', instruction.targets_copy()),
+    'RY': lambda c, instruction: c._feed_reset('Y', instruction.targets_copy()),
+
+    'M': lambda c, instruction: c._feed_m('Z', instruction.targets_copy()),
+    'MX': lambda c, instruction: c._feed_m('X', instruction.targets_copy()),
+    'MY': lambda c, instruction: c._feed_m('Y', instruction.targets_copy()),
+
+    'MR': lambda c, instruction: c._feed_mr('Z', instruction.targets_copy()),
+    'MRX': lambda c, instruction: c._feed_mr('X', instruction.targets_copy()),
+    'MRY': lambda c, instruction: c._feed_mr('Y', instruction.targets_copy()),
+
+    'XCX': _c_feeder('X', 'X'),
+    'XCY': _c_feeder('X', 'Y'),
+    'XCZ': _c_feeder('X', 'Z'),
+    'YCX': _c_feeder('Y', 'X'),
+    'YCY': _c_feeder('Y', 'Y'),
+    'YCZ': _c_feeder('Y', 'Z'),
+    'CX': _c_feeder('Z', 'X'),
+    'CY': _c_feeder('Z', 'Y'),
+    'CZ': _c_feeder('Z', 'Z'),
+
+    **{name: _rotation_feeder(R_ZYX) for name in ['H', 'SQRT_Y', 'SQRT_Y_DAG']},
+    **{name: _rotation_feeder(R_YXZ) for name in ['H_XY', 'S', 'S_DAG']},
+    **{name: _rotation_feeder(R_XZY) for name in ['H_YZ', 'SQRT_X', 'SQRT_X_DAG']},
+    'C_XYZ': _rotation_feeder(R_YZX),
+    'C_ZYX': _rotation_feeder(R_ZXY),
+    **{name: _rotation_feeder(R_XYZ) for name in ['I', 'X', 'Y', 'Z']},
+
+    'QUBIT_COORDS': lambda c, instruction: c._feed_qubit_coords(instruction.targets_copy(), instruction.gate_args_copy()),
+    'SHIFT_COORDS': lambda c, instruction: c._feed_shift_coords(instruction.gate_args_copy()),
+
+    'ISWAP': lambda c, instruction: c._feed_iswap(instruction.targets_copy()),
+    'ISWAP_DAG': lambda c, instruction: c._feed_iswap(instruction.targets_copy()),
+    'MPP': lambda c, instruction: c._feed_mpp(instruction.targets_copy()),
+    'SWAP': lambda c, instruction: c._feed_swap(instruction.targets_copy()),
+
+    'TICK': lambda c, instruction: c.layers.append(EmptyLayer()),
+
+    **{name: (lambda c, instruction, b=name[5]: c._feed_sqrt_pp(b, instruction.targets_copy()))
+       for name in ['SQRT_XX', 'SQRT_XX_DAG', 'SQRT_YY', 'SQRT_YY_DAG', 'SQRT_ZZ', 'SQRT_ZZ_DAG']},
+}
+
+
+def _layer_and_rotation_counts(circuit: LayerCircuit) -> Tuple[int, int]:
+    num_layers = 0
+    num_rotations = 0
+    for layer in circuit.layers:
+        num_layers += 1
+        if isinstance(layer, RotationLayer):
+            num_rotations += len(layer.touched())
+        elif isinstance(layer, LoopLayer):
+            sub_layers, sub_rotations = _layer_and_rotation_counts(layer.body)
+            num_layers += sub_layers
+            num_rotations += sub_rotations
+    return num_layers, num_rotations
+
+
+def _layer_kinds(circuit: LayerCircuit, out: Set[Type[Layer]]) -> Set[Type[Layer]]:
+    for layer in circuit.layers:
+        out.add(type(layer))
+        if isinstance(layer, LoopLayer):
+            _layer_kinds(layer.body, out)
+    return out
+
+
+@dataclasses.dataclass
+class PassStats:
+    """How long one pass of `to_z_basis_interaction_circuit` took, and how much it changed."""
+    name: str
+    seconds: float
+    skipped: bool
+    layers_in: int
+    layers_out: int
+    rotations_in: int
+    rotations_out: int
+
+
+# Passes that mutate the circuit they're given, instead of returning a new one.
+_IN_PLACE_PASSES = {
+    'with_clearable_rotation_layers_cleared': LayerCircuit._clear_clearable_rotation_layers,
+    'with_rotations_merged_earlier': LayerCircuit._merge_rotations_earlier,
+    'with_rotations_before_resets_removed': lambda c: c._remove_rotations_before_resets(set()),
+}
+
+# Passes that can only change the circuit when it contains one of these kinds of layer.
+_PASS_REQUIREMENTS: Dict[str, Tuple[Type[Layer], ...]] = {
+    'with_qubit_coords_at_start': (QubitCoordAnnotationLayer,),
+    'with_rotations_rolled_from_end_of_loop_to_start_of_loop': (LoopLayer,),
+    'with_clearable_rotation_layers_cleared': (RotationLayer,),
+    'with_rotations_merged_earlier': (RotationLayer,),
+    'with_rotations_before_resets_removed': (RotationLayer,),
+}
+
+
+class _PassManager:
+    """Runs LayerCircuit passes on a circuit it owns, mutating it instead of copying it."""
+
+    def __init__(self, circuit: LayerCircuit, stats_out: Optional[List[PassStats]]):
+        self.circuit = circuit
+        self.stats_out = stats_out
+        self._kinds: Optional[Set[Type[Layer]]] = None
+
+    def _can_change(self, name: str) -> bool:
+        required = _PASS_REQUIREMENTS.get(name)
+        if required is None:
+            return True
+        if self._kinds is None:
+            self._kinds = _layer_kinds(self.circuit, set())
+        return any(kind in self._kinds for kind in required)
+
+    def run(self, name: str) -> None:
+        measure = self.stats_out is not None or trace.is_tracing()
+        if measure:
+            layers_in, rotations_in = _layer_and_rotation_counts(self.circuit)
+        skipped = not self._can_change(name)
+        with trace.span(f'LayerCircuit.{name}') as span:
+            t0 = time.perf_counter()
+            if not skipped:
+                in_place = _IN_PLACE_PASSES.get(name)
+                if in_place is not None:
+                    in_place(self.circuit)
+                else:
+                    self.circuit = getattr(self.circuit, name)()
+                self._kinds = None
+            seconds = time.perf_counter() - t0
+        if measure:
+            layers_out, rotations_out = _layer_and_rotation_counts(self.circuit)
+            span.args.update(
+                skipped=skipped,
+                layers_in=layers_in,
+                layers_out=layers_out,
+                rotations_in=rotations_in,
+                rotations_out=rotations_out,
+            )
+            trace.count('LayerCircuit size', layers=layers_out, rotations=rotations_out)
+            if self.stats_out is not None:
+                self.stats_out.append(PassStats(
+                    name=name,
+                    seconds=seconds,
+                    skipped=skipped,
+                    layers_in=layers_in,
+                    layers_out=layers_out,
+                    rotations_in=rotations_in,
+                    rotations_out=rotations_out,
+                ))
+
+
+def to_z_basis_interaction_circuit(
+        circuit: stim.Circuit,
+        *,
+        pass_stats: Optional[List[PassStats]] = None,
+) -> stim.Circuit:
+    """Rewrites a circuit to use Z basis resets, measurements, and interactions plus single qubit rotations.
+
+    Args:
+        circuit: The circuit to rewrite.
+        pass_stats: If not None, a `PassStats` is appended to this list for
+            each optimization pass, in the order the passes ran.
+    """
+    with trace.span('to_z_basis_interaction_circuit'):
+        with trace.span('LayerCircuit.from_stim_circuit'):
+            c = LayerCircuit.from_stim_circuit(circuit)
+        passes = _PassManager(c, pass_stats)
+        passes.run('with_qubit_coords_at_start')
+        passes.run('with_locally_optimized_layers')
+        passes.run('to_z_basis')
+        passes.run('with_rotations_rolled_from_end_of_loop_to_start_of_loop')
+        passes.run('with_locally_optimized_layers')
+        passes.run('with_clearable_rotation_layers_cleared')
+        passes.run('with_rotations_merged_earlier')
+        passes.run('with_rotations_before_resets_removed')
+        passes.run('with_irrelevant_tail_layers_removed')
+        with trace.span('LayerCircuit.to_stim_circuit'):
+            return passes.circuit.to_stim_circuit()
@@ -1,6 +1,8 @@
+import pytest
 import stim
 
-from hookinj.gen._layer_translate import LayerCircuit, to_z_basis_interaction_circuit, _basis_before_rotation, R_ZXY
+from hookinj.gen._layer_translate import LayerCircuit, RotationLayer, to_z_basis_interaction_circuit, _basis_before_rotation, R_ZXY, \
+    PassStats, DetObsAnnotationLayer, MeasureLayer, ResetLayer, InteractLayer, FeedbackLayer
 
 
 def test_to_cz_circuit_rotation_folding():
@@ -478,6 +480,124 @@ def test_with_rotations_merged_earlier():
     """)
 
 
+def test_with_clearable_rotation_layers_cleared():
+    assert LayerCircuit.from_stim_circuit(stim.Circuit("""
+        H 0 1
+        TICK
+        CZ 2 3
+        TICK
+        CZ 2 3
+        TICK
+        S 2
+        TICK
+        CZ 1 3
+        TICK
+        H 0 4
+        TICK
+        CZ 0 1
+        TICK
+        S 4
+        TICK
+        S 4
+    """)).with_clearable_rotation_layers_cleared().to_stim_circuit() == stim.Circuit("""
+        CZ 2 3
+        TICK
+        CZ 2 3
+        TICK
+        H 1 4
+        S 2
+        TICK
+        CZ 1 3
+        TICK
+        CZ 0 1
+    """)
+
+
+def test_rotation_passes_move_across_long_idle_stretches():
+    n = 2000
+    circuit = stim.Circuit()
+    circuit.append('H', range(n, 2 * n))
+    circuit.append('TICK')
+    for k in range(n):
+        circuit.append('CZ', [k % 8, (k + 1) % 8 + 8])
+        circuit.append('TICK')
+    circuit.append('S', range(n, 2 * n))
+    c = LayerCircuit.from_stim_circuit(circuit)
+    c = c.with_clearable_rotation_layers_cleared()
+    c = c.with_rotations_merged_earlier()
+    c = c.with_rotations_before_resets_removed()
+    rotation_layers = [layer for layer in c.layers if isinstance(layer, RotationLayer)]
+    assert len(rotation_layers) == 1
+    assert rotation_layers[0].rotations == {q: R_ZXY for q in range(n, 2 * n)}
+
+
+def test_rotation_passes_leave_input_unchanged():
+    circuit = stim.Circuit("""
+        H 0 1
+        TICK
+        REPEAT 3 {
+            S 0
+            TICK
+            CZ 0 1
+            TICK
+            S 0
+            TICK
+        }
+        R 0
+    """)
+    c = LayerCircuit.from_stim_circuit(circuit).to_z_basis()
+    before = repr(c)
+    c.with_clearable_rotation_layers_cleared()
+    c.with_rotations_merged_earlier()
+    c.with_rotations_before_resets_removed()
+    assert repr(c) == before
+
+
+def test_to_z_basis_interaction_circuit_pass_stats():
+    stats = []
+    result = to_z_basis_interaction_circuit(stim.Circuit("""
+        CX 0 1
+        TICK
+        M 0 1
+    """), pass_stats=stats)
+    assert result == to_z_basis_interaction_circuit(stim.Circuit("""
+        CX 0 1
+        TICK
+        M 0 1
+    """))
+    assert [s.name for s in stats] == [
+        'with_qubit_coords_at_start',
+        'with_locally_optimized_layers',
+        'to_z_basis',
+        'with_rotations_rolled_from_end_of_loop_to_start_of_loop',
+        'with_locally_optimized_layers',
+        'with_clearable_rotation_layers_cleared',
+        'with_rotations_merged_earlier',
+        'with_rotations_before_resets_removed',
+        'with_irrelevant_tail_layers_removed',
+    ]
+    assert all(isinstance(s, PassStats) and s.seconds >= 0 for s in stats)
+    skipped = {s.name for s in stats if s.skipped}
+    assert skipped == {
+        'with_qubit_coords_at_start',
+        'with_rotations_rolled_from_end_of_loop_to_start_of_loop',
+    }
+    to_z_basis = stats[2]
+    assert to_z_basis.rotations_in == 0
+    assert to_z_basis.rotations_out > 0
+    assert to_z_basis.layers_out > to_z_basis.layers_in
+
+
+def test_to_z_basis_interaction_circuit_traces_sizes():
+    from hookinj.gen import _trace
+    with _trace.tracing() as tracer:
+        to_z_basis_interaction_circuit(stim.Circuit("CX 0 1\nTICK\nM 0 1"))
+    counters = [e['args'] for e in tracer.events if e['name'] == 'LayerCircuit size']
+    assert len(counters) == 9
+    assert counters[0]['rotations'] == 0
+    assert counters[2]['rotations'] > 0
+
+
 def test_with_qubit_coords_at_start():
     assert LayerCircuit.from_stim_circuit(stim.Circuit("""
         QUBIT_COORDS(2, 3) 0
@@ -538,6 +658,42 @@ def test_merge_shift_coords():
     """)
 
 
+def test_from_stim_circuit_layers():
+    c = LayerCircuit.from_stim_circuit(stim.Circuit("""
+        MRX 0 1
+        DETECTOR(1, 2) rec[-1]
+        OBSERVABLE_INCLUDE(0) rec[-2]
+        TICK
+        CX 0 1 2 3
+        CZ rec[-1] 4
+        H 5
+        S 5
+        DETECTOR(3) rec[-2]
+    """))
+    assert [type(e) for e in c.layers] == [
+        MeasureLayer,
+        ResetLayer,
+        DetObsAnnotationLayer,
+        InteractLayer,
+        FeedbackLayer,
+        RotationLayer,
+        DetObsAnnotationLayer,
+    ]
+    assert c.layers[0] == MeasureLayer(targets=[0, 1], bases=['X', 'X'])
+    assert c.layers[1] == ResetLayer(targets=[0, 1], bases=['X', 'X'])
+    assert c.layers[2].circuit == stim.Circuit("""
+        DETECTOR(1, 2) rec[-1]
+        OBSERVABLE_INCLUDE(0) rec[-2]
+    """)
+    assert c.layers[3] == InteractLayer(targets1=[0, 2], targets2=[1, 3], bases1=['Z', 'Z'], bases2=['X', 'X'])
+    assert c.layers[4] == FeedbackLayer(controls=[stim.target_rec(-1)], targets=[4], bases=['Z'])
+    assert c.layers[5] == RotationLayer({5: R_ZXY})
+    assert c.layers[6].circuit == stim.Circuit("DETECTOR(3) rec[-2]")
+
+    with pytest.raises(NotImplementedError):
+        LayerCircuit.from_stim_circuit(stim.Circuit("CXSWAP 0 1"))
+
+
 def test_merge_resets_and_measurements():
     assert LayerCircuit.from_stim_circuit(stim.Circuit("""
         RX 0 1
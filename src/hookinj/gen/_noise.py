@@ -1,9 +1,12 @@
-from typing import Optional, Dict, Set, List, Iterator, Union, AbstractSet, DefaultDict, Any
+from typing import Optional, Dict, Set, List, Iterator, Union, AbstractSet, DefaultDict, Any, Tuple, Iterable, Callable
 
-import collections
+import re
 
 import stim
 
+from hookinj.gen import _trace as trace
+from hookinj.gen._util import instruction_text, exact_instruction_text
+
 CLIFFORD_1Q = 'C1'
 CLIFFORD_2Q = 'C2'
 ANNOTATION = 'info'
@@ -98,6 +101,19 @@ OP_MEASURE_BASES = {
 }
 COLLAPSING_OPS = {op for op, t in OP_TYPES.items() if t == JUST_RESET_1Q or t == JUST_MEASURE_1Q or t == MPP or t == MEASURE_RESET_1Q}
 
+# Placeholders in `NoiseModel._rules_by_gate`.
+_MEASURE_BASIS_DEPENDENT = object()
+_MISSING = object()
+
+# Matches the arguments of noise channels and (possibly noisy) measurements, in program text.
+_NOISE_ARGUMENTS = re.compile(
+    r'^([ \t]*(?:' + '|'.join(sorted(
+        (op for op, t in OP_TYPES.items() if t in (NOISE, MPP, JUST_MEASURE_1Q, MEASURE_RESET_1Q)),
+        key=lambda op: (-len(op), op),
+    )) + r'))\(([^)]*)\)',
+    re.MULTILINE,
+)
+
 
 class NoiseRule:
     """Describes how to add noise to an operation."""
@@ -126,28 +142,51 @@ class NoiseRule:
         self.after = after
         self.flip_result = flip_result
 
+    def __repr__(self) -> str:
+        return f'NoiseRule(after={self.after!r}, flip_result={self.flip_result!r})'
+
     def append_noisy_version_of(self,
                                 *,
                                 split_op: stim.CircuitInstruction,
                                 out_during_moment: stim.Circuit,
                                 after_moments: DefaultDict[Any, stim.Circuit],
                                 immune_qubits: AbstractSet[int]) -> None:
-        targets = split_op.targets_copy()
+        during: List[str] = []
+        after: Dict[Tuple[str, float], List[int]] = {}
+        self._append_noisy_lines(
+            split_op=split_op,
+            targets=split_op.targets_copy(),
+            out_during_moment=during,
+            after_moment=after,
+            immune_qubits=immune_qubits,
+        )
+        out_during_moment.append_from_stim_program_text('\n'.join(during))
+        for (op_name, arg), raw_targets in after.items():
+            after_moments[(op_name, arg)].append(op_name, raw_targets, arg)
+
+    def _append_noisy_lines(self,
+                            *,
+                            split_op: stim.CircuitInstruction,
+                            targets: List[stim.GateTarget],
+                            out_during_moment: List[str],
+                            after_moment: Dict[Tuple[str, float], List[int]],
+                            immune_qubits: AbstractSet[int]) -> None:
+        """Same as `append_noisy_version_of`, but producing program text lines and target lists."""
         if immune_qubits and any((t.is_qubit_target or t.is_x_target or t.is_y_target or t.is_z_target) and t.value in immune_qubits for t in targets):
-            out_during_moment.append(split_op)
+            out_during_moment.append(exact_instruction_text(split_op))
             return
 
-        args = split_op.gate_args_copy()
+        args = None
         if self.flip_result:
             t = OP_TYPES[split_op.name]
             assert t == MPP or t == JUST_MEASURE_1Q or t == MEASURE_RESET_1Q
-            assert len(args) == 0
+            assert len(split_op.gate_args_copy()) == 0
             args = [self.flip_result]
 
-        out_during_moment.append(split_op.name, targets, args)
+        out_during_moment.append(exact_instruction_text(split_op, args))
         raw_targets = [t.value for t in targets if not t.is_combiner]
         for op_name, arg in self.after.items():
-            after_moments[(op_name, arg)].append(op_name, raw_targets, arg)
+            after_moment.setdefault((op_name, arg), []).extend(raw_targets)
 
 
 class NoiseModel:
@@ -164,6 +203,16 @@ class NoiseModel:
         self.measure_rules = measure_rules
         self.any_clifford_1q_rule = any_clifford_1q_rule
         self.any_clifford_2q_rule = any_clifford_2q_rule
+        self._rules_by_gate_cache: Optional[Dict[str, Any]] = None
+
+    def __repr__(self) -> str:
+        return (f'NoiseModel('
+                f'idle_depolarization={self.idle_depolarization!r}, '
+                f'additional_depolarization_waiting_for_m_or_r={self.additional_depolarization_waiting_for_m_or_r!r}, '
+                f'gate_rules={self.gate_rules!r}, '
+                f'measure_rules={self.measure_rules!r}, '
+                f'any_clifford_1q_rule={self.any_clifford_1q_rule!r}, '
+                f'any_clifford_2q_rule={self.any_clifford_2q_rule!r})')
 
     @staticmethod
     def si1000(p: float) -> 'NoiseModel':
@@ -239,97 +288,129 @@ class NoiseModel:
             }
         )
 
-    def _noise_rule_for_split_operation(self, *, split_op: stim.CircuitInstruction) -> Optional[NoiseRule]:
-        if occurs_in_classical_control_system(split_op):
-            return None
+    def _rules_by_gate(self) -> Dict[str, Any]:
+        """Precomputes the noise rule of each gate, resolving rule precedence once per model.
 
-        rule = self.gate_rules.get(split_op.name)
-        if rule is not None:
-            return rule
-
-        t = OP_TYPES[split_op.name]
-
-        if self.any_clifford_1q_rule is not None and t == CLIFFORD_1Q:
-            return self.any_clifford_1q_rule
-        if self.any_clifford_2q_rule is not None and t == CLIFFORD_2Q:
-            return self.any_clifford_2q_rule
-        if self.measure_rules is not None:
-            rule = self.measure_rules.get(_measure_basis(split_op=split_op))
-            if rule is not None:
-                return rule
-
-        raise ValueError(f"No noise (or lack of noise) specified for {split_op=}.")
-
-    def _append_idle_error(self,
-                           *,
-                           moment_split_ops: List[stim.CircuitInstruction],
-                           out: stim.Circuit,
-                           system_qubits: AbstractSet[int],
-                           immune_qubits: AbstractSet[int],
-                           ) -> None:
-        collapse_qubits = []
-        clifford_qubits = []
-        for split_op in moment_split_ops:
-            if occurs_in_classical_control_system(split_op):
-                continue
-            if split_op.name in COLLAPSING_OPS:
-                qubits_out = collapse_qubits
-            else:
-                qubits_out = clifford_qubits
-            for target in split_op.targets_copy():
-                if not target.is_combiner:
-                    qubits_out.append(target.value)
+        Values are a `NoiseRule`, None for no noise, `_MEASURE_BASIS_DEPENDENT`
+        for MPP (whose rule depends on the measured Paulis), or `_MISSING`.
+        """
+        if self._rules_by_gate_cache is not None:
+            return self._rules_by_gate_cache
+        table = {}
+        for name, t in OP_TYPES.items():
+            rule = None if t == ANNOTATION else (self.gate_rules or {}).get(name)
+            if rule is None and t != ANNOTATION:
+                if self.any_clifford_1q_rule is not None and t == CLIFFORD_1Q:
+                    rule = self.any_clifford_1q_rule
+                elif self.any_clifford_2q_rule is not None and t == CLIFFORD_2Q:
+                    rule = self.any_clifford_2q_rule
+                elif self.measure_rules is not None and name == 'MPP':
+                    rule = _MEASURE_BASIS_DEPENDENT
+                elif self.measure_rules is not None and name in OP_MEASURE_BASES:
+                    rule = self.measure_rules.get(OP_MEASURE_BASES[name], _MISSING)
+                else:
+                    rule = _MISSING
+            table[name] = rule
+        self._rules_by_gate_cache = table
+        return table
+
+    def _noise_rule_for_split_operation(self, *, split_op: stim.CircuitInstruction) -> Optional[NoiseRule]:
+        rule = self._rules_by_gate()[split_op.name]
+        if rule is _MEASURE_BASIS_DEPENDENT:
+            rule = self.measure_rules.get(_measure_basis(split_op=split_op), _MISSING)
+        elif rule is not None and OP_TYPES[split_op.name] == CLIFFORD_2Q and occurs_in_classical_control_system(split_op):
+            rule = None
+        if rule is _MISSING:
+            raise ValueError(f"No noise (or lack of noise) specified for {split_op=}.")
+        return rule
+
+    def _noisy_moment_text(self, moment: List[stim.CircuitInstruction], qubits: '_MomentQubits') -> str:
+        import numpy as np
+
+        during: List[str] = []
+        after: Dict[Tuple[str, float], List[int]] = {}
+        collapse_qubits: List[int] = []
+        clifford_qubits: List[int] = []
+        for op in moment:
+            for split_op in _split_targets_if_needed(op, immune_qubits=qubits.immune):
+                targets = split_op.targets_copy()
+                rule = self._noise_rule_for_split_operation(split_op=split_op)
+                if rule is None:
+                    # Annotations and classical control don't get noise, or count as using qubits.
+                    during.append(exact_instruction_text(split_op))
+                    continue
+                rule._append_noisy_lines(
+                    split_op=split_op,
+                    targets=targets,
+                    out_during_moment=during,
+                    after_moment=after,
+                    immune_qubits=qubits.immune,
+                )
+                qubits_out = collapse_qubits if split_op.name in COLLAPSING_OPS else clifford_qubits
+                qubits_out.extend(t.value for t in targets if not t.is_combiner)
+        for op_name, arg in sorted(after.keys()):
+            during.append(instruction_text(op_name, after[(op_name, arg)], arg))
 
         # Safety check for operation collisions.
-        usage_counts = collections.Counter(collapse_qubits + clifford_qubits)
-        qubits_used_multiple_times = {q for q, c in usage_counts.items() if c != 1}
-        if qubits_used_multiple_times:
-            moment = stim.Circuit()
-            for op in moment_split_ops:
-                moment.append(op)
+        usage_counts = np.bincount(np.array(collapse_qubits + clifford_qubits, dtype=np.int64), minlength=len(qubits.available))
+        qubits_used_multiple_times = np.flatnonzero(usage_counts > 1)
+        if len(qubits_used_multiple_times):
+            text = '\n'.join(exact_instruction_text(op) for op in moment)
             raise ValueError(f"Qubits were operated on multiple times without a TICK in between:\n"
-                             f"multiple uses: {sorted(qubits_used_multiple_times)}\n"
+                             f"multiple uses: {qubits_used_multiple_times.tolist()}\n"
                              f"moment:\n"
-                             f"{moment}")
-
-        collapse_qubits_set = set(collapse_qubits)
-        clifford_qubits_set = set(clifford_qubits)
-        idle = sorted(system_qubits - collapse_qubits_set - clifford_qubits_set - immune_qubits)
-        if idle and self.idle_depolarization:
-            out.append('DEPOLARIZE1', idle, self.idle_depolarization)
-
-        waiting_for_mr = sorted(system_qubits - collapse_qubits_set - immune_qubits)
-        if collapse_qubits_set and waiting_for_mr and self.additional_depolarization_waiting_for_m_or_r:
-            out.append('DEPOLARIZE1', idle, self.additional_depolarization_waiting_for_m_or_r)
-
-    def _append_noisy_moment(self,
-                             *,
-                             moment_split_ops: List[stim.CircuitInstruction],
-                             out: stim.Circuit,
-                             system_qubits: AbstractSet[int],
-                             immune_qubits: AbstractSet[int],
-                             ) -> None:
-        after = collections.defaultdict(stim.Circuit)
-        for split_op in moment_split_ops:
-            rule = self._noise_rule_for_split_operation(split_op=split_op)
-            if rule is None:
-                out.append(split_op)
-            else:
-                rule.append_noisy_version_of(
-                    split_op=split_op,
-                    out_during_moment=out,
-                    after_moments=after,
-                    immune_qubits=immune_qubits,
+                             f"{stim.Circuit(text)}")
+
+        idle = np.flatnonzero(qubits.available & (usage_counts[:len(qubits.available)] == 0))
+        if len(idle) and self.idle_depolarization:
+            during.append(instruction_text('DEPOLARIZE1', idle.tolist(), self.idle_depolarization))
+
+        if collapse_qubits and self.additional_depolarization_waiting_for_m_or_r:
+            waiting_for_mr = qubits.available.copy()
+            waiting_for_mr[collapse_qubits] = False
+            if waiting_for_mr.any():
+                during.append(instruction_text('DEPOLARIZE1', idle.tolist(), self.additional_depolarization_waiting_for_m_or_r))
+
+        return '\n'.join(during)
+
+    def _append_noisy_circuit_lines(self,
+                                    *,
+                                    circuit: stim.Circuit,
+                                    out: List[str],
+                                    qubits: '_MomentQubits',
+                                    memo: Dict[Tuple[stim.CircuitInstruction, ...], str],
+                                    counts: Dict[str, int]) -> None:
+        first = True
+        after_loop = False
+        for moment in _iter_moments(circuit):
+            counts['moments'] += 1
+            if first:
+                first = False
+            elif not after_loop:
+                out.append('TICK')
+            if isinstance(moment, stim.CircuitRepeatBlock):
+                out.append(f'REPEAT {moment.repeat_count} {{')
+                self._append_noisy_circuit_lines(
+                    circuit=moment.body_copy(),
+                    out=out,
+                    qubits=qubits,
+                    memo=memo,
+                    counts=counts,
                 )
-        for k in sorted(after.keys()):
-            out += after[k]
-
-        self._append_idle_error(
-            moment_split_ops=moment_split_ops,
-            out=out,
-            system_qubits=system_qubits,
-            immune_qubits=immune_qubits,
-        )
+                out.append('TICK')
+                out.append('}')
+                after_loop = True
+            else:
+                key = tuple(moment)
+                text = memo.get(key)
+                if text is None:
+                    text = self._noisy_moment_text(moment, qubits)
+                    memo[key] = text
+                else:
+                    counts['moment_cache_hits'] += 1
+                if text:
+                    out.append(text)
+                    after_loop = False
 
     def noisy_circuit(self,
                       circuit: stim.Circuit,
@@ -339,6 +420,9 @@ class NoiseModel:
                       ) -> stim.Circuit:
         """Returns a noisy version of the given circuit, by applying the receiving noise model.
 
+        Surface code circuits repeat the same moments over and over, so each
+        distinct moment is only made noisy once.
+
         Args:
             circuit: The circuit to layer noise over.
             system_qubits: All qubits used by the circuit. These are the qubits eligible for idling noise.
@@ -347,39 +431,149 @@ class NoiseModel:
         Returns:
             The noisy version of the circuit.
         """
+        return stim.Circuit(self._noisy_circuit_text(circuit, system_qubits=system_qubits, immune_qubits=immune_qubits))
+
+    def _noisy_circuit_text(self,
+                            circuit: stim.Circuit,
+                            *,
+                            system_qubits: Optional[Set[int]],
+                            immune_qubits: Optional[Set[int]]) -> str:
         if system_qubits is None:
             system_qubits = set(range(circuit.num_qubits))
         if immune_qubits is None:
             immune_qubits = set()
 
-        result = stim.Circuit()
-
-        first = True
-        for moment_split_ops in _iter_split_op_moments(circuit, immune_qubits=immune_qubits):
-            if first:
-                first = False
-            elif result and isinstance(result[-1], stim.CircuitRepeatBlock):
-                pass
-            else:
-                result.append('TICK')
-            if isinstance(moment_split_ops, stim.CircuitRepeatBlock):
-                noisy_body = self.noisy_circuit(
-                    moment_split_ops.body_copy(),
-                    system_qubits=system_qubits,
-                    immune_qubits=immune_qubits,
-                )
-                noisy_body.append('TICK')
-                result.append(stim.CircuitRepeatBlock(repeat_count=moment_split_ops.repeat_count, body=noisy_body))
+        with trace.span('NoiseModel.noisy_circuit') as span:
+            lines: List[str] = []
+            counts = {'moments': 0, 'moment_cache_hits': 0}
+            self._append_noisy_circuit_lines(
+                circuit=circuit,
+                out=lines,
+                qubits=_MomentQubits(
+                    num_qubits=circuit.num_qubits,
+                    system=system_qubits,
+                    immune=immune_qubits,
+                ),
+                memo={},
+                counts=counts,
+            )
+            span.args.update(counts)
+            trace.count('noisy moments', processed=counts['moments'], cache_hits=counts['moment_cache_hits'])
+            return '\n'.join(lines)
+
+    def _parameters(self) -> List[Tuple[str, float]]:
+        """Lists every probability in the model, labelled by where it is used."""
+        result = [
+            ('idle_depolarization', self.idle_depolarization),
+            ('additional_depolarization_waiting_for_m_or_r', self.additional_depolarization_waiting_for_m_or_r),
+        ]
+
+        def add_rule(label: str, rule: Optional[NoiseRule]):
+            if rule is None:
+                result.append((f'{label}=None', 0))
+                return
+            for name, p in rule.after.items():
+                result.append((f'{label}.after[{name}]', p))
+            result.append((f'{label}.flip_result', rule.flip_result))
+
+        for label, rules in [('gate_rules', self.gate_rules), ('measure_rules', self.measure_rules)]:
+            if rules is None:
+                result.append((f'{label}=None', 0))
             else:
-                self._append_noisy_moment(
-                    moment_split_ops=moment_split_ops,
-                    out=result,
-                    system_qubits=system_qubits,
-                    immune_qubits=immune_qubits,
-                )
-
+                for key in sorted(rules.keys()):
+                    add_rule(f'{label}[{key}]', rules[key])
+        add_rule('any_clifford_1q_rule', self.any_clifford_1q_rule)
+        add_rule('any_clifford_2q_rule', self.any_clifford_2q_rule)
         return result
 
+    @staticmethod
+    def noisy_circuit_family(
+            circuit: stim.Circuit,
+            strengths: Iterable[float],
+            *,
+            model: Callable[[float], 'NoiseModel'],
+            system_qubits: Optional[Set[int]] = None,
+            immune_qubits: Optional[Set[int]] = None,
+    ) -> List[stim.Circuit]:
+        """Returns `model(p).noisy_circuit(circuit)` for each strength p.
+
+        Where the noise goes doesn't depend on the strength, so the noise is
+        laid out once (at the first strength) and the other circuits are made
+        by substituting probabilities into its program text. Strengths where
+        substitution could give a different circuit (e.g. a probability that
+        is zero at one strength but not at another) are noised directly.
+
+        Args:
+            circuit: The circuit to layer noise over. Should be noiseless.
+            strengths: The noise strengths to produce circuits for.
+            model: Makes the noise model for a strength (e.g. `NoiseModel.si1000`).
+            system_qubits: Same as for `noisy_circuit`.
+            immune_qubits: Same as for `noisy_circuit`.
+
+        Returns:
+            The noisy circuits, in the same order as `strengths`.
+        """
+        strengths = list(strengths)
+        if not strengths:
+            return []
+        with trace.span('NoiseModel.noisy_circuit_family', strengths=len(strengths)) as span:
+            reference = model(strengths[0])
+            text = reference._noisy_circuit_text(circuit, system_qubits=system_qubits, immune_qubits=immune_qubits)
+            # Arguments already present in the circuit would be indistinguishable from the model's.
+            can_substitute = _NOISE_ARGUMENTS.search(str(circuit)) is None
+            results = []
+            substituted = 0
+            for p in strengths:
+                noise = model(p)
+                replacements = None
+                if can_substitute:
+                    replacements = _argument_replacements(reference._parameters(), noise._parameters())
+                if replacements is None:
+                    results.append(noise.noisy_circuit(circuit, system_qubits=system_qubits, immune_qubits=immune_qubits))
+                    continue
+                substituted += 1
+                results.append(stim.Circuit(_NOISE_ARGUMENTS.sub(
+                    lambda m: m.group(1) + '(' + ', '.join(replacements.get(a, a) for a in m.group(2).split(', ')) + ')',
+                    text,
+                )))
+            span.args['substituted'] = substituted
+            return results
+
+
+class _MomentQubits:
+    """The qubits that a moment's noise is applied relative to."""
+
+    def __init__(self, *, num_qubits: int, system: AbstractSet[int], immune: AbstractSet[int]):
+        import numpy as np
+
+        n = max(num_qubits, max(system, default=-1) + 1, max(immune, default=-1) + 1)
+        self.immune = immune
+        # Which qubits are eligible for idling noise.
+        self.available = np.zeros(n, dtype=np.bool_)
+        self.available[list(system)] = True
+        self.available[list(immune)] = False
+
+
+def _argument_replacements(old: List[Tuple[str, float]], new: List[Tuple[str, float]]) -> Optional[Dict[str, str]]:
+    """Maps the program text of old noise probabilities to new ones.
+
+    Returns None when substituting them wouldn't give the same circuit as
+    noising with the new probabilities directly. That happens when the models
+    differ in structure or in which probabilities are zero, or when the
+    mapping merges or reorders probabilities (adjacent equal channels fuse,
+    and channels are emitted in probability order).
+    """
+    if [label for label, _ in old] != [label for label, _ in new]:
+        return None
+    mapping: Dict[float, float] = {}
+    for (_, a), (_, b) in zip(old, new):
+        if (a == 0) != (b == 0) or mapping.setdefault(a, b) != b:
+            return None
+    ordered = [mapping[a] for a in sorted(mapping)]
+    if any(x >= y for x, y in zip(ordered, ordered[1:])):
+        return None
+    return {repr(float(a)): repr(float(b)) for a, b in mapping.items()}
+
 
 def occurs_in_classical_control_system(op: stim.CircuitInstruction) -> bool:
     """Determines if an operation is an annotation or a classical control system update."""
@@ -449,6 +643,25 @@ def _split_targets_if_needed_m_basis(op: stim.CircuitInstruction, immune_qubits:
     assert k == len(targets)
 
 
+def _iter_moments(circuit: stim.Circuit) -> Iterator[Union[stim.CircuitRepeatBlock, List[stim.CircuitInstruction]]]:
+    """Splits a circuit into moments (the time between two TICKs), yielding REPEAT blocks whole."""
+    cur_moment = []
+
+    for op in circuit:
+        if isinstance(op, stim.CircuitRepeatBlock):
+            if cur_moment:
+                yield cur_moment
+                cur_moment = []
+            yield op
+        elif op.name == 'TICK':
+            yield cur_moment
+            cur_moment = []
+        else:
+            cur_moment.append(op)
+    if cur_moment:
+        yield cur_moment
+
+
 def _iter_split_op_moments(circuit: stim.Circuit, *, immune_qubits: AbstractSet[int]) -> Iterator[Union[stim.CircuitRepeatBlock, List[stim.CircuitInstruction]]]:
     """Splits a circuit into moments and some operations into pieces.
 
@@ -462,22 +675,11 @@ def _iter_split_op_moments(circuit: stim.Circuit, *, immune_qubits: AbstractSet[
 
         (A moment is the time between two TICKs.)
     """
-    cur_moment = []
-
-    for op in circuit:
-        if isinstance(op, stim.CircuitRepeatBlock):
-            if cur_moment:
-                yield cur_moment
-                cur_moment = []
-            yield op
-        elif isinstance(op, stim.CircuitInstruction):
-            if op.name == 'TICK':
-                yield cur_moment
-                cur_moment = []
-            else:
-                cur_moment.extend(_split_targets_if_needed(op, immune_qubits=immune_qubits))
-    if cur_moment:
-        yield cur_moment
+    for moment in _iter_moments(circuit):
+        if isinstance(moment, stim.CircuitRepeatBlock):
+            yield moment
+        else:
+            yield [split_op for op in moment for split_op in _split_targets_if_needed(op, immune_qubits=immune_qubits)]
 
 
 def _measure_basis(*, split_op: stim.CircuitInstruction) -> Optional[str]:
@@ -1,6 +1,8 @@
+import pytest
 import stim
 
-from hookinj.gen._noise import _measure_basis, _iter_split_op_moments, occurs_in_classical_control_system, NoiseModel
+from hookinj import gen
+from hookinj.gen._noise import _measure_basis, _iter_split_op_moments, occurs_in_classical_control_system, NoiseModel, NoiseRule
 
 
 def test_measure_basis():
@@ -121,4 +123,117 @@ def test_si_1000():
         DEPOLARIZE1(0.001) 0 1 2 3
         DEPOLARIZE1(0.0001) 4 5 6 7
         DEPOLARIZE1(0.002) 4 5 6 7
-    """)
\ No newline at end of file
+    """)
+
+def test_noisy_circuit_reuses_repeated_moments():
+    model = NoiseModel.si1000(1e-3)
+    moment = """
+        R 0
+        TICK
+        CX 0 1
+        TICK
+        M 0
+        DETECTOR(0.1234567, 0, 0) rec[-1]
+        TICK
+    """
+    with gen.tracing() as tracer:
+        noisy = model.noisy_circuit(stim.Circuit(moment * 3 + "REPEAT 5 {\n" + moment + "}"))
+    (span,) = [e for e in tracer.events if e['name'] == 'NoiseModel.noisy_circuit']
+    assert span['args'] == {'moments': 13, 'moment_cache_hits': 9}
+    (counter,) = [e for e in tracer.events if e['name'] == 'noisy moments']
+    assert counter['ph'] == 'C'
+    assert counter['args'] == {'processed': 13, 'cache_hits': 9}
+
+    noisy_moment = """
+        R 0
+        X_ERROR(0.002) 0
+        DEPOLARIZE1(0.0001) 1
+        DEPOLARIZE1(0.002) 1
+        TICK
+        CX 0 1
+        DEPOLARIZE2(0.001) 0 1
+        TICK
+        M(0.005) 0
+        DETECTOR(0.1234567, 0, 0) rec[-1]
+        DEPOLARIZE1(0.001) 0
+        DEPOLARIZE1(0.0001) 1
+        DEPOLARIZE1(0.002) 1
+        TICK
+    """
+    # Gate arguments keep their full precision.
+    assert noisy == stim.Circuit(noisy_moment * 3 + "REPEAT 5 {\n" + noisy_moment + "}")
+
+
+def test_noise_rule_lookup():
+    model = NoiseModel(
+        idle_depolarization=0,
+        any_clifford_1q_rule=NoiseRule(after={'DEPOLARIZE1': 0.125}),
+        gate_rules={'H': NoiseRule(after={'Z_ERROR': 0.25})},
+        measure_rules={'XZ': NoiseRule(after={'DEPOLARIZE2': 0.5}, flip_result=0.0625)},
+    )
+    assert model.noisy_circuit(stim.Circuit("""
+        H 0
+        S 1
+        CX rec[-1] 2
+        TICK
+        MPP X0*Z1
+    """)) == stim.Circuit("""
+        H 0
+        S 1
+        CX rec[-1] 2
+        DEPOLARIZE1(0.125) 1
+        Z_ERROR(0.25) 0
+        TICK
+        MPP(0.0625) X0*Z1
+        DEPOLARIZE2(0.5) 0 1
+    """)
+    with pytest.raises(ValueError, match='No noise'):
+        model.noisy_circuit(stim.Circuit("CX 0 1"))
+    with pytest.raises(ValueError, match='No noise'):
+        model.noisy_circuit(stim.Circuit("MPP Z0*Z1"))
+    with pytest.raises(ValueError, match='multiple times'):
+        model.noisy_circuit(stim.Circuit("H 0 0"))
+
+
+def test_noisy_circuit_family():
+    circuit = stim.Circuit("""
+        R 0 1
+        TICK
+        REPEAT 3 {
+            H 0
+            TICK
+            CX 0 1
+            TICK
+            M 1
+            DETECTOR(0.5, 0, 0) rec[-1]
+            TICK
+        }
+        MPP X0*X1
+    """)
+    strengths = [1e-3, 2e-3, 0, 3.3e-3]
+
+    def check(model, expected_substituted, circuit=circuit):
+        with gen.tracing() as tracer:
+            family = NoiseModel.noisy_circuit_family(circuit, strengths, model=model)
+        assert family == [model(p).noisy_circuit(circuit) for p in strengths]
+        (span,) = [e for e in tracer.events if e['name'] == 'NoiseModel.noisy_circuit_family']
+        assert span['args']['substituted'] == expected_substituted
+
+    # Zero noise has a different layout, so it isn't substituted.
+    check(NoiseModel.uniform_depolarizing, 3)
+
+    # The 1q depolarization passes the idle depolarization, which reorders the channels.
+    def crossing(p: float) -> NoiseModel:
+        model = NoiseModel.uniform_depolarizing(p)
+        model.any_clifford_1q_rule = NoiseRule(after={'DEPOLARIZE1': 0.0015})
+        return model
+    check(crossing, 1)
+
+    # Arguments already in the circuit could be confused with the model's.
+    def keeping_existing_noise(p: float) -> NoiseModel:
+        model = NoiseModel.uniform_depolarizing(p)
+        model.gate_rules['X_ERROR'] = NoiseRule(after={})
+        return model
+    check(keeping_existing_noise, 0, circuit=circuit + stim.Circuit("TICK\nX_ERROR(0.001) 0"))
+
+    assert NoiseModel.noisy_circuit_family(circuit, [], model=NoiseModel.si1000) == []
@@ -7,6 +7,8 @@ from hookinj.gen._util import sorted_complex
 
 class Patch:
     """A collection of annotated stabilizers to measure simultaneously.
+
+    Patches are immutable and hashable, so they can be used as cache keys.
     """
 
     def __init__(self,
@@ -14,9 +16,16 @@ class Patch:
                  *,
                  do_not_sort: bool = False):
         if do_not_sort:
-            self.tiles = tuple(tiles)
+            tiles = tuple(tiles)
         else:
-            self.tiles = tuple(sorted_complex(tiles, key=lambda e: e.measurement_qubit))
+            tiles = tuple(sorted_complex(tiles, key=lambda e: e.measurement_qubit))
+        object.__setattr__(self, 'tiles', tiles)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"Patch is immutable (tried to set {key!r}).")
+
+    def __delattr__(self, key):
+        raise AttributeError(f"Patch is immutable (tried to delete {key!r}).")
 
     def after_coordinate_transform(self, coord_transform: Callable[[complex], complex]) -> 'Patch':
         return Patch(
@@ -62,6 +71,13 @@ class Patch:
     def __ne__(self, other):
         return not (self == other)
 
+    @functools.cached_property
+    def _hash(self) -> int:
+        return hash((Patch, self.tiles))
+
+    def __hash__(self):
+        return self._hash
+
     @functools.cached_property
     def measure_set(self) -> FrozenSet[complex]:
         return frozenset(e.measurement_qubit for e in self.tiles)
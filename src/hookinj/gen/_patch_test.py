@@ -0,0 +1,39 @@
+import pickle
+
+import pytest
+
+from hookinj import gen
+
+
+def _patch() -> gen.Patch:
+    return gen.Patch([
+        gen.Tile(bases='X', measurement_qubit=1, ordered_data_qubits=[0, 2]),
+        gen.Tile(bases='Z', measurement_qubit=0.5j, ordered_data_qubits=[0, 1j]),
+    ])
+
+
+def test_patch_hash():
+    p1 = _patch()
+    p2 = _patch()
+    assert p1 == p2
+    assert hash(p1) == hash(p2)
+    assert len({p1, p2}) == 1
+    assert p1 != p1.with_opposite_order()
+    assert {p1: 'a'}[p2] == 'a'
+
+
+def test_patch_immutable():
+    p = _patch()
+    with pytest.raises(AttributeError):
+        p.tiles = ()
+    with pytest.raises(AttributeError):
+        del p.tiles
+    assert p.used_set == {0, 1, 2, 0.5j, 1j}
+
+
+def test_patch_pickle():
+    p = _patch()
+    assert p.used_set
+    p2 = pickle.loads(pickle.dumps(p))
+    assert p2 == p
+    assert hash(p2) == hash(p)
@@ -0,0 +1,154 @@
+import atexit
+import contextlib
+import functools
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union, Iterator, Callable, TypeVar
+
+TFunc = TypeVar('TFunc', bound=Callable)
+
+
+class Span:
+    """A timed region. Extra `args` may be filled in while the span is open."""
+
+    def __init__(self, name: str, args: Dict[str, Any]):
+        self.name = name
+        self.args = args
+
+
+class Tracer:
+    """Accumulates trace events in memory."""
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self._start = time.perf_counter()
+        self._pid = os.getpid()
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._start) * 1e6
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[Span]:
+        s = Span(name, args)
+        t0 = self._now_us()
+        try:
+            yield s
+        finally:
+            self.events.append({
+                'name': name,
+                'ph': 'X',
+                'ts': t0,
+                'dur': self._now_us() - t0,
+                'pid': self._pid,
+                'tid': threading.get_ident(),
+                'args': s.args,
+            })
+
+    def count(self, name: str, **values: Union[int, float]) -> None:
+        self.events.append({
+            'name': name,
+            'ph': 'C',
+            'ts': self._now_us(),
+            'pid': self._pid,
+            'args': values,
+        })
+
+    def write(self, path: Union[str, pathlib.Path]) -> None:
+        path = pathlib.Path(str(path).format(pid=self._pid))
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+_ACTIVE: Optional[Tracer] = None
+
+
+@contextlib.contextmanager
+def _null_span() -> Iterator[Span]:
+    yield Span('', {})
+
+
+def is_tracing() -> bool:
+    return _ACTIVE is not None
+
+
+def span(name: str, **args: Any) -> contextlib.AbstractContextManager:
+    """Times the body of a `with` statement, if tracing is on."""
+    if _ACTIVE is None:
+        return _null_span()
+    return _ACTIVE.span(name, **args)
+
+
+def count(name: str, **values: Union[int, float]) -> None:
+    """Records counter values, if tracing is on."""
+    if _ACTIVE is not None:
+        _ACTIVE.count(name, **values)
+
+
+def traced(name: str) -> Callable[[TFunc], TFunc]:
+    """Decorates a function so that each call is a span, if tracing is on."""
+    def decorator(func: TFunc) -> TFunc:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _ACTIVE is None:
+                return func(*args, **kwargs)
+            with _ACTIVE.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def tracing(path: Union[None, str, pathlib.Path] = None) -> Iterator[Tracer]:
+    """Records spans and counters while the context is open.
+
+    Tracing can also be turned on for a whole process by setting the
+    HOOKINJ_TRACE environment variable to an output path. Use `{pid}` in the
+    path when several processes are generating circuits at once. Open the
+    output with chrome://tracing or https://ui.perfetto.dev.
+
+    Args:
+        path: If not None, where to write the Chrome trace JSON when the
+            context exits. `{pid}` in the path is replaced by the process id.
+
+    Yields:
+        The tracer, whose `events` can also be inspected directly.
+    """
+    global _ACTIVE
+    prev = _ACTIVE
+    tracer = Tracer()
+    _ACTIVE = tracer
+    try:
+        yield tracer
+    finally:
+        _ACTIVE = prev
+        if path is not None:
+            tracer.write(path)
+
+
+def _start_from_environment() -> None:
+    global _ACTIVE
+    path = os.environ.get('HOOKINJ_TRACE')
+    if not path:
+        return
+    tracer = Tracer()
+    _ACTIVE = tracer
+    written = []
+
+    def write():
+        if not written:
+            written.append(True)
+            tracer.write(path)
+
+    atexit.register(write)
+    import multiprocessing.util
+    # Worker processes (e.g. from `--jobs`) exit without running atexit hooks,
+    # but they do run multiprocessing finalizers. Forked workers start their
+    # own tracer, so that each process writes its own events.
+    multiprocessing.util.Finalize(tracer, write, exitpriority=0)
+    multiprocessing.util.register_after_fork(tracer, lambda _: _start_from_environment())
+
+
+_start_from_environment()
@@ -0,0 +1,67 @@
+import json
+import pathlib
+import subprocess
+import sys
+
+from hookinj import gen
+from hookinj.gen import _trace
+from hookinj._bench import clear_memo_caches
+from hookinj._make_circuit import make_circuit
+
+
+def test_tracing_off_by_default():
+    assert not _trace.is_tracing()
+    with _trace.span('x') as span:
+        span.args['a'] = 1
+    _trace.count('y', v=1)
+
+
+def test_tracing_records_pipeline(tmp_path):
+    path = tmp_path / 'trace.json'
+    # Otherwise memoized chunks from earlier tests would skip the traced builder.
+    clear_memo_caches()
+    with gen.tracing(path) as tracer:
+        make_circuit(
+            basis='hook_inject_Y',
+            distance=3,
+            noise=gen.NoiseModel.si1000(1e-3),
+            postselected_rounds=2,
+            postselected_diameter=3,
+            memory_rounds=5,
+        )
+    assert not _trace.is_tracing()
+
+    events = json.loads(path.read_text())['traceEvents']
+    assert events == json.loads(json.dumps(tracer.events))
+    names = {e['name'] for e in events}
+    assert 'Builder.gate2' in names
+    assert 'Builder.measure' in names
+    assert 'NoiseModel.noisy_circuit' in names
+    assert 'LayerCircuit.with_rotations_merged_earlier' in names
+
+    loops = [e for e in events if e['name'] == 'compile_chunk_into_circuit.loop']
+    assert loops
+    assert all(1 <= e['args']['iterations_compiled'] <= e['args']['repetitions'] for e in loops)
+    merged = [e for e in events if e['name'] == 'LayerCircuit.with_rotations_merged_earlier']
+    assert merged[0]['args']['rotations_out'] <= merged[0]['args']['rotations_in']
+    noise = [e for e in events if e['name'] == 'NoiseModel.noisy_circuit']
+    assert all(e['args']['moments'] > 0 for e in noise)
+    assert {e['ph'] for e in events} == {'X', 'C'}
+    assert all(e['dur'] >= 0 for e in events if e['ph'] == 'X')
+    sizes = [e for e in events if e['name'] == 'LayerCircuit size']
+    assert all(e['ph'] == 'C' and e['args']['layers'] > 0 for e in sizes)
+
+
+def test_tracing_from_environment(tmp_path):
+    src_dir = pathlib.Path(__file__).parent.parent.parent
+    code = "from hookinj import gen; gen.NoiseModel.si1000(1e-3).noisy_circuit(__import__('stim').Circuit('H 0'))"
+    subprocess.run(
+        [sys.executable, '-c', code],
+        check=True,
+        cwd=src_dir,
+        env={'HOOKINJ_TRACE': str(tmp_path / 'trace-{pid}.json'), 'PATH': ''},
+    )
+    (out,) = tmp_path.iterdir()
+    assert out.name.startswith('trace-')
+    names = {e['name'] for e in json.loads(out.read_text())['traceEvents']}
+    assert names == {'NoiseModel.noisy_circuit', 'noisy moments'}
@@ -1,8 +1,89 @@
-from typing import List, Callable, Iterable, TypeVar, Any, Tuple, Dict
+from typing import List, Callable, Iterable, TypeVar, Any, Tuple, Dict, Union, Optional
 
 import stim
 
 TItem = TypeVar('TItem')
+TKey = TypeVar('TKey')
+
+
+def group_by(items: Iterable[TItem], *, key: Callable[[TItem], TKey]) -> Dict[TKey, List[TItem]]:
+    """Groups items by a key, preserving the order of items within each group.
+
+    Same behavior as `sinter.group_by`, without having to import sinter.
+    """
+    result: Dict[TKey, List[TItem]] = {}
+    for item in items:
+        result.setdefault(key(item), []).append(item)
+    return result
+
+
+def _target_text(t: Union[int, stim.GateTarget]) -> str:
+    if not isinstance(t, stim.GateTarget):
+        return str(int(t))
+    if t.is_measurement_record_target:
+        return f'rec[{t.value}]'
+    if t.is_sweep_bit_target:
+        return f'sweep[{t.value}]'
+    prefix = '!' if t.is_inverted_result_target else ''
+    if t.is_x_target:
+        return f'{prefix}X{t.value}'
+    if t.is_y_target:
+        return f'{prefix}Y{t.value}'
+    if t.is_z_target:
+        return f'{prefix}Z{t.value}'
+    if t.is_qubit_target:
+        return f'{prefix}{t.value}'
+    raise NotImplementedError(f'{t=}')
+
+
+def instruction_text(
+        name: str,
+        targets: Iterable[Union[int, stim.GateTarget]] = (),
+        args: Union[float, Iterable[float]] = ()) -> str:
+    """Returns the stim program line for an instruction.
+
+    Combiner targets join their neighbours into a product (e.g. `X0*Z1`).
+    """
+    parts = [name]
+    args = [args] if isinstance(args, (int, float)) else list(args)
+    if args:
+        parts.append('(' + ', '.join(repr(float(a)) for a in args) + ')')
+    for t in targets:
+        if not isinstance(t, stim.GateTarget):
+            parts.append(f' {int(t)}')
+        elif t.is_combiner:
+            parts.append('*')
+        elif parts[-1] == '*':
+            parts.append(_target_text(t))
+            parts[-3:] = [''.join(parts[-3:])]
+        else:
+            parts.append(' ' + _target_text(t))
+    return ''.join(parts)
+
+
+def exact_instruction_text(op: stim.CircuitInstruction, args: Optional[Iterable[float]] = None) -> str:
+    """Returns `str(op)`, but with full precision (and optionally different) gate arguments.
+
+    `str` rounds gate arguments to six significant digits, but formats the
+    targets far faster than `instruction_text` can.
+    """
+    text = str(op)
+    old_args = op.gate_args_copy()
+    targets_text = text[text.index(')') + 1:] if old_args else text[len(op.name):]
+    return instruction_text(op.name, (), old_args if args is None else args) + targets_text
+
+
+def append_instruction(
+        out: stim.Circuit,
+        name: str,
+        targets: Iterable[Union[int, stim.GateTarget]] = (),
+        args: Union[float, Iterable[float]] = ()) -> None:
+    """Same as `out.append(name, targets, args)`, but faster for long target lists.
+
+    `stim.Circuit.append` converts each python target individually, which costs
+    microseconds per target. Parsing the equivalent program text does not.
+    """
+    out.append_from_stim_program_text(instruction_text(name, targets, args))
 
 
 def complex_key(c: complex) -> Any:
@@ -1,7 +1,7 @@
 import stim
 
 from hookinj.gen._noise import _measure_basis, _iter_split_op_moments, occurs_in_classical_control_system, NoiseModel
-from hookinj.gen._util import estimate_qubit_count_during_postselection
+from hookinj.gen._util import estimate_qubit_count_during_postselection, append_instruction, instruction_text, exact_instruction_text
 
 
 def test_estimate_qubit_count_during_postselection():
@@ -43,3 +43,31 @@ def test_estimate_qubit_count_during_postselection():
         DETECTOR(0, 0, 0, 999) rec[-1]
         H 57
     """)) == 3
+
+
+def test_append_instruction_matches_stim_append():
+    cases = [
+        ('H', [0, 5, 2], []),
+        ('TICK', [], []),
+        ('M', [stim.target_inv(5), 3], []),
+        ('X_ERROR', [1, 2], [0.125]),
+        ('CX', [stim.target_rec(-1), 3, stim.target_sweep_bit(2), 4], []),
+        ('MPP', [stim.target_x(0), stim.target_combiner(), stim.target_z(1), stim.target_y(2)], []),
+        ('DETECTOR', [stim.target_rec(-2)], [1.5, 0.1, 3]),
+        ('OBSERVABLE_INCLUDE', [stim.target_rec(-1)], 2),
+    ]
+    for name, targets, args in cases:
+        expected = stim.Circuit()
+        expected.append(name, targets, args)
+        actual = stim.Circuit()
+        append_instruction(actual, name, targets, args)
+        assert actual == expected, name
+    assert instruction_text('MPP', [stim.target_x(0), stim.target_combiner(), stim.target_z(1)]) == 'MPP X0*Z1'
+
+
+def test_exact_instruction_text():
+    for line in ['H 0 1', 'DETECTOR(0.1234567, 2, 0) rec[-1] rec[-3]', 'MPP(0.125) X0*Z1 !Y2', 'TICK']:
+        op = stim.Circuit(line)[0]
+        assert stim.Circuit(exact_instruction_text(op))[0] == op
+    op = stim.Circuit('M !0 1')[0]
+    assert exact_instruction_text(op, [0.25]) == 'M(0.25) !0 1'
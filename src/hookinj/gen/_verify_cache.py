@@ -0,0 +1,94 @@
+import contextlib
+import functools
+import hashlib
+import os
+import pathlib
+from typing import Iterator, Optional, Set, Union
+
+import stim
+
+_VERIFIED: Set[str] = set()
+_DIRECTORY: Optional[pathlib.Path] = None
+
+
+@functools.lru_cache(maxsize=None)
+def verifier_source_hash() -> str:
+    """Hashes the code that decides whether a chunk verifies.
+
+    That's every non-test module of `hookinj.gen` (chunks, flows and the
+    verifier use helpers from across the package) and the stim version.
+    Changing either invalidates verification results stored on disk.
+    """
+    h = hashlib.sha256()
+    h.update(stim.__version__.encode('utf8'))
+    h.update(b'\0')
+    package_dir = pathlib.Path(__file__).parent
+    for path in sorted(package_dir.rglob('*.py')):
+        if path.name.endswith('_test.py'):
+            continue
+        h.update(path.relative_to(package_dir).as_posix().encode('utf8'))
+        h.update(b'\0')
+        h.update(path.read_bytes())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _marker_path(fingerprint: str) -> Optional[pathlib.Path]:
+    if _DIRECTORY is None:
+        return None
+    key = hashlib.sha256(f'{verifier_source_hash()}:{fingerprint}'.encode('utf8')).hexdigest()
+    return _DIRECTORY / key[:2] / key
+
+
+def is_verified(fingerprint: str) -> bool:
+    path = _marker_path(fingerprint)
+    if fingerprint in _VERIFIED:
+        if path is not None and not path.exists():
+            # Verified in this process before the cache directory was set.
+            mark_verified(fingerprint)
+        return True
+    if path is not None and path.exists():
+        _VERIFIED.add(fingerprint)
+        return True
+    return False
+
+
+def mark_verified(fingerprint: str) -> None:
+    _VERIFIED.add(fingerprint)
+    path = _marker_path(fingerprint)
+    if path is not None:
+        path.parent.mkdir(exist_ok=True, parents=True)
+        path.touch()
+
+
+def clear_verified() -> None:
+    """Forgets in-process verification results (markers on disk are kept)."""
+    _VERIFIED.clear()
+
+
+def get_verification_cache_dir() -> Optional[pathlib.Path]:
+    return _DIRECTORY
+
+
+def set_verification_cache_dir(directory: Union[None, str, pathlib.Path]) -> None:
+    """Sets where chunks proven correct by `Chunk.verify` are remembered across processes.
+
+    Defaults to the HOOKINJ_VERIFY_CACHE environment variable. None means
+    results are only remembered in memory.
+    """
+    global _DIRECTORY
+    _DIRECTORY = None if directory is None else pathlib.Path(directory)
+
+
+@contextlib.contextmanager
+def verification_cache_dir(directory: Union[None, str, pathlib.Path]) -> Iterator[None]:
+    """Temporarily changes the on-disk verification cache directory."""
+    prev = _DIRECTORY
+    set_verification_cache_dir(directory)
+    try:
+        yield
+    finally:
+        set_verification_cache_dir(prev)
+
+
+set_verification_cache_dir(os.environ.get('HOOKINJ_VERIFY_CACHE') or None)
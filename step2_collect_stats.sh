@@ -3,12 +3,11 @@
 set -e
 set -o pipefail
 
-sinter collect \
-    --circuits out/circuits/*.stim \
-    --metadata_func auto \
-    --decoders pymatching \
+# Uses the task manifests written by step1 (detector error models and
+# postselection masks are precomputed there, instead of per worker).
+PYTHONPATH=src tools/collect_manifest_stats \
+    --manifests out/circuits/*.task.json \
     --max_shots 1_000_000 \
     --max_errors 100 \
     --processes 4 \
-    --save_resume_filepath out/stats.csv \
-    --postselected_detectors_predicate "len(coords) > 3 and coords[3] != 0"
+    --save_resume_filepath out/stats.csv